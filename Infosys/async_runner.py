@@ -0,0 +1,102 @@
+import asyncio
+import uuid
+
+from email_assistant.resilience import get_breaker
+from email_assistant.sqlite_persistence import pending_index
+from email_assistant.telemetry import get_logger
+from email_assistant.tenants import current_tenant
+
+logger = get_logger(__name__)
+
+# Default number of emails in flight at once for a single worker
+DEFAULT_MAX_CONCURRENCY = 8
+
+def email_config(email_input: dict, config: dict | None = None) -> dict:
+    """Build the run config for one email, giving it its own thread_id.
+
+    The Gmail message id is used when present so a re-run lands on the same checkpoint thread.
+    For a tenant's run (tenant_id in config) the thread id is prefixed with the tenant.
+    """
+    config = config or {}
+    configurable = dict(config.get("configurable", {}))
+    configurable.setdefault("thread_id", current_tenant(config).thread_id(str(email_input.get("id") or uuid.uuid4())))
+    return {**config, "configurable": configurable}
+
+async def ainvoke_once(graph, email_input: dict, config: dict):
+    """Run an email through the graph to its checkpoint, once per checkpoint thread.
+
+    An email delivered again (after a crash, a failed run or a re-sync of the inbox)
+    continues its thread from the last checkpoint instead of starting over, and a thread
+    that already finished or is waiting for review is left alone. Graphs compiled without a
+    checkpointer always run.
+
+    With the SQLite checkpointer, a run that stops at an interrupt is added to the Agent
+    Inbox's pending list (see inbox_service), whichever runner started it.
+
+    Returns:
+        The final state, or None when the thread had already run
+    """
+    if not graph.checkpointer:
+        return await graph.ainvoke({"email_input": email_input}, config)
+    state = await graph.aget_state(config)
+    if not state.values:
+        result = await graph.ainvoke({"email_input": email_input}, config)
+    elif state.next and not any(task.interrupts for task in state.tasks):
+        logger.info(f"🔁 Resuming email {email_input.get('id')} from its checkpoint", email_id=email_input.get("id"),
+                    thread_id=config["configurable"]["thread_id"])
+        result = await graph.ainvoke(None, config)
+    else:
+        return None
+    index = pending_index(graph.checkpointer)
+    if index is not None:
+        await index.record(result, config)
+    return result
+
+async def run_email(graph, email_input: dict, semaphore: asyncio.Semaphore, config: dict | None = None, coalescer=None, scheduler=None):
+    """Run one email through the graph once its tenant's limits and the semaphore allow it.
+
+    With a scheduler (see priority_scheduler), the email waits for a slot of the scheduler
+    instead of the semaphore. With a coalescer (see thread_coalescer), returns None for an
+    email folded into a newer message of its thread.
+    """
+    async def run(email_input):
+        run_config = email_config(email_input, config)
+        # While the model provider's circuit is open, emails wait here instead of failing
+        await get_breaker("llm").wait_until_available()
+        if scheduler is None:
+            # The tenant's slot comes first, so a throttled tenant does not hold a shared slot while it waits
+            async with current_tenant(run_config).slot(), semaphore:
+                return await graph.ainvoke({"email_input": email_input}, config=run_config)
+        # The scheduler admits emails within the tenant's limits, so its priority order holds within a tenant too
+        async with scheduler.slot(email_input, run_config), current_tenant(run_config).slot(throttle=False):
+            return await graph.ainvoke({"email_input": email_input}, config=run_config)
+
+    if coalescer is None:
+        return await run(email_input)
+    return await coalescer.submit(email_input, run, config)
+
+async def run_emails(graph, email_inputs, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, config: dict | None = None, return_exceptions: bool = True,
+                     coalescer=None, scheduler=None):
+    """Run many emails through an async-compiled graph concurrently.
+
+    Args:
+        graph: Compiled graph built from async nodes, e.g. async_email_assistant
+        email_inputs: Iterable of email_input dicts
+        max_concurrency: Maximum number of emails processed at the same time
+        config: Base run config shared by every email (callbacks, tags, configurable values)
+        return_exceptions: If True, a failing email returns its exception instead of cancelling the others
+        coalescer: Optional ThreadCoalescer, to run quick replies in one thread only once
+        scheduler: Optional PriorityScheduler, to start urgent email first; its max_concurrency then applies
+
+    Returns:
+        list: One final state (or exception, or None for a coalesced email) per email, in input order
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(
+        *(run_email(graph, email_input, semaphore, config, coalescer, scheduler) for email_input in email_inputs),
+        return_exceptions=return_exceptions,
+    )
+
+def run_emails_sync(graph, email_inputs, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, config: dict | None = None):
+    """Blocking wrapper around run_emails for scripts and notebooks without a running event loop."""
+    return asyncio.run(run_emails(graph, list(email_inputs), max_concurrency=max_concurrency, config=config))
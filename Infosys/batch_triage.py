@@ -0,0 +1,114 @@
+from pydantic import BaseModel, Field
+
+from email_assistant.prompts import triage_user_prompt, batch_triage_user_prompt, batch_triage_email_template
+from email_assistant.schemas import RouterSchema
+
+# Upper bounds on how much we pack into a single router call
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_BATCH_CHARS = 40_000
+
+class BatchRouterDecision(RouterSchema):
+    """Routing decision for one email of a batch."""
+
+    index: int = Field(
+        description="The index of the email this decision is for, as shown in the batch."
+    )
+
+class BatchRouterSchema(BaseModel):
+    """Analyze a batch of unread emails and route each one according to its content."""
+
+    decisions: list[BatchRouterDecision] = Field(
+        description="One routing decision per email in the batch."
+    )
+
+def make_batches(parsed_emails, batch_size=DEFAULT_BATCH_SIZE, max_chars=DEFAULT_MAX_BATCH_CHARS):
+    """Split emails into batches bounded by count and by total thread length.
+
+    Args:
+        parsed_emails: List of (author, to, subject, email_thread) tuples
+        batch_size: Maximum number of emails per batch
+        max_chars: Maximum total characters of email content per batch
+
+    Returns:
+        list[list[int]]: Indices into parsed_emails, one list per batch
+    """
+    batches = []
+    current = []
+    current_chars = 0
+    for index, (author, to, subject, email_thread) in enumerate(parsed_emails):
+        size = len(author) + len(to) + len(subject) + len(email_thread)
+        # Start a new batch when either bound would be exceeded (an oversized email still gets its own batch)
+        if current and (len(current) >= batch_size or current_chars + size > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(index)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+def format_batch(parsed_emails):
+    """Render a batch of parsed emails into a single router user prompt."""
+    emails = "\n\n".join(
+        batch_triage_email_template.format(
+            index=index, author=author, to=to, subject=subject, email_thread=email_thread
+        )
+        for index, (author, to, subject, email_thread) in enumerate(parsed_emails)
+    )
+    return batch_triage_user_prompt.format(count=len(parsed_emails), emails=emails)
+
+def batch_triage(parsed_emails, llm_batch_router, llm_router, system_prompt, batch_size=DEFAULT_BATCH_SIZE, max_chars=DEFAULT_MAX_BATCH_CHARS, decided=None):
+    """Classify many emails with one router call per batch.
+
+    Args:
+        parsed_emails: List of (author, to, subject, email_thread) tuples
+        llm_batch_router: Model bound to BatchRouterSchema structured output
+        llm_router: Model bound to RouterSchema, used for any email the batch call skipped
+        system_prompt: Triage system prompt, sent once per batch
+        batch_size: Maximum number of emails per batch
+        max_chars: Maximum total characters of email content per batch
+        decided: Optional decisions already made without the LLM (e.g. by pre-triage), None where undecided
+
+    Returns:
+        list[RouterSchema]: One decision per email, in the same order as parsed_emails
+    """
+    results = list(decided) if decided is not None else [None] * len(parsed_emails)
+
+    # Only emails without a decision are sent to the LLM
+    undecided = [i for i, result in enumerate(results) if result is None]
+    for batch in make_batches([parsed_emails[i] for i in undecided], batch_size, max_chars):
+        batch = [undecided[i] for i in batch]
+
+        # Number the emails 0..n-1 within the batch so indices stay small and easy to echo back
+        user_prompt = format_batch([parsed_emails[i] for i in batch])
+
+        # Run the router LLM once for the whole batch
+        response = llm_batch_router.invoke(
+            [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ]
+        )
+
+        # Fan the decisions back out to their emails, ignoring unknown or repeated indices
+        for decision in response.decisions:
+            if 0 <= decision.index < len(batch) and results[batch[decision.index]] is None:
+                results[batch[decision.index]] = RouterSchema(
+                    reasoning=decision.reasoning, classification=decision.classification
+                )
+
+    # Classify any email the batch call left out on its own, exactly like triage_router would
+    for i, result in enumerate(results):
+        if result is None:
+            author, to, subject, email_thread = parsed_emails[i]
+            results[i] = llm_router.invoke(
+                [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": triage_user_prompt.format(
+                        author=author, to=to, subject=subject, email_thread=email_thread
+                    )},
+                ]
+            )
+
+    return results
@@ -0,0 +1,77 @@
+"""Benchmark: search latency and recall of the episodic memory index as it grows.
+
+Fills a VectorIndex (in a temporary directory) with synthetic clustered unit vectors, then
+runs --queries searches at each size in --sizes and reports p50/p99 search latency and
+recall@k against an exact scan. Past the training threshold the index is clustered, so
+latency should stay flat while the index grows.
+
+    python -m email_assistant.benchmarks.bench_episodic_memory --sizes 1000 10000 100000 --json episodic.json
+"""
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from email_assistant.episodic_memory import DEFAULT_K, DEFAULT_NPROBE, VectorIndex
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def synthetic_vectors(count: int, dimensions: int, topics: int, rng) -> np.ndarray:
+    """Unit vectors around `topics` random directions, like emails about recurring subjects."""
+    centers = rng.standard_normal((topics, dimensions)).astype(np.float32)
+    vectors = centers[rng.integers(topics, size=count)] + 0.6 * rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def bench_size(index: VectorIndex, vectors: np.ndarray, queries: np.ndarray, k: int) -> dict:
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        found = index.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        exact = set(np.argsort(-(vectors[:index.count] @ query))[:k].tolist())
+        hits += len(exact & {vector_id for vector_id, _ in found})
+    return {
+        "episodes": index.count,
+        "clustered": index.trained_count > 0,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "recall": hits / (len(queries) * k),
+    }
+
+def main(sizes, dimensions: int, queries: int, k: int, nprobe: int, topics: int, json_path: str | None):
+    rng = np.random.default_rng(0)
+    vectors = synthetic_vectors(max(sizes), dimensions, topics, rng)
+    query_vectors = synthetic_vectors(queries, dimensions, topics, rng)
+    index = VectorIndex(tempfile.mkdtemp(), dimensions, nprobe=nprobe)
+
+    results = []
+    for size in sorted(sizes):
+        start = time.perf_counter()
+        for vector_id in range(index.count, size):
+            index.add(vectors[vector_id], {"id": vector_id})
+        fill_seconds = time.perf_counter() - start
+        result = bench_size(index, vectors, query_vectors, k)
+        result["fill_seconds"] = fill_seconds
+        results.append(result)
+        print(f"{result['episodes']:>9} episodes ({'ivf' if result['clustered'] else 'flat'}): "
+              f"p50 {result['p50_ms']:.2f} ms, p99 {result['p99_ms']:.2f} ms, recall@{k} {result['recall']:.2f}")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 50000])
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=DEFAULT_K)
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    parser.add_argument("--topics", type=int, default=200, help="Clusters in the synthetic data")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    main(args.sizes, args.dimensions, args.queries, args.k, args.nprobe, args.topics, args.json_path)
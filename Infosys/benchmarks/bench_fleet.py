@@ -0,0 +1,104 @@
+"""Benchmark: throughput of the worker fleet for increasing numbers of worker processes.
+
+Queues a replayed corpus (see benchmarks.replay) in a fresh SQLite job queue and runs it on
+a WorkerFleet of each size in --processes, with the replay models and fake Gmail tools, so
+no network or API key is needed. Each worker process runs the Gmail assistant with the
+SQLite checkpointer up to its first interrupt. Reports emails/s and the speedup over the
+smallest fleet; with model latency dominating, throughput should grow about linearly.
+
+    python -m email_assistant.benchmarks.bench_fleet --emails 2000 --processes 1 2 4 8 --json fleet.json
+"""
+import argparse
+import importlib
+import json
+import os
+import tempfile
+import time
+
+from email_assistant.benchmarks.replay import FakeLabelBatcher, FakeTool, ReplayChatModel, make_corpus
+from email_assistant.episodic_memory import HashingEmbeddings
+from email_assistant.model_registry import MODEL_SPECS, register_embeddings, register_model
+from email_assistant.sqlite_persistence import get_persistence
+from email_assistant.worker_fleet import JobQueue, WorkerFleet
+
+def replay_graph(db_path: str, emails: int, senders: int, llm_latency: float, tool_latency: float):
+    """Graph factory of the worker processes: the Gmail assistant on replay models and fake tools."""
+    model = ReplayChatModel(make_corpus(emails, senders=senders), latency=llm_latency)
+    for role in MODEL_SPECS:
+        register_model(role, model)
+    register_embeddings("episodic_memory", HashingEmbeddings())
+    module = importlib.import_module("email_assistant.email_assistant_hitl_memory_gmail")
+    for name in list(module.tools_by_name):
+        module.tools_by_name[name] = FakeTool(name, tool_latency)
+    batcher = FakeLabelBatcher()
+    module.get_label_batcher = lambda *args: batcher
+    checkpointer, store = get_persistence(db_path)
+    return module.build_email_assistant(
+        module.atriage_router, module.atriage_interrupt_handler, module.async_response_agent, module.amark_as_read_node,
+        checkpointer=checkpointer, store=store,
+    )
+
+def bench_fleet(processes: int, corpus, concurrency: int, factory_kwargs: dict, timeout: float) -> dict:
+    workdir = tempfile.mkdtemp()
+    queue_path, db_path = os.path.join(workdir, "jobs.sqlite"), os.path.join(workdir, "checkpoints.sqlite")
+    queue = JobQueue(queue_path)
+    for email in corpus:
+        queue.enqueue(email)
+
+    fleet = WorkerFleet(processes, concurrency, factory="email_assistant.benchmarks.bench_fleet:replay_graph", factory_kwargs=factory_kwargs,
+                        queue_path=queue_path, db_path=db_path)
+    start = time.perf_counter()
+    fleet.start()
+    try:
+        # Measured until the queue is drained; process start-up is included
+        while True:
+            stats = queue.stats()
+            if stats["queued"] == stats["leased"] == 0:
+                break
+            if time.perf_counter() - start > timeout or not fleet.alive():
+                raise RuntimeError(f"Fleet of {processes} did not drain the queue: {stats}")
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - start
+    finally:
+        fleet.stop()
+        queue.close()
+
+    return {
+        "processes": processes,
+        "concurrency": concurrency,
+        "emails": len(corpus),
+        "seconds": elapsed,
+        "emails_per_second": len(corpus) / elapsed,
+        "jobs": stats,
+    }
+
+def main(emails: int, processes, concurrency: int, llm_latency: float, tool_latency: float, senders: int, timeout: float, json_path: str | None):
+    corpus = make_corpus(emails, senders=senders)
+    factory_kwargs = {"emails": emails, "senders": senders, "llm_latency": llm_latency, "tool_latency": tool_latency}
+    results = []
+    for count in sorted(processes):
+        result = bench_fleet(count, corpus, concurrency, factory_kwargs, timeout)
+        result["speedup"] = result["emails_per_second"] / results[0]["emails_per_second"] if results else 1.0
+        results.append(result)
+        print(f"{count:>3} process(es) x {concurrency}: {result['emails_per_second']:8.1f} emails/s  "
+              f"speedup {result['speedup']:.2f}  ({result['jobs']['done']} done, {result['jobs']['dead']} dead)")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--processes", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=8, help="Emails in flight per worker process")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--tool-latency-ms", type=float, default=10.0)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds a fleet may take to drain the queue")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    # The memory variant journals pending memory updates in the working directory
+    os.chdir(tempfile.mkdtemp())
+    main(args.emails, args.processes, args.concurrency, args.llm_latency_ms / 1e3, args.tool_latency_ms / 1e3, args.senders, args.timeout, json_path)
@@ -0,0 +1,164 @@
+"""Offline benchmark of the assistant graphs on a replayed email corpus.
+
+Runs a corpus of sample emails through email_assistant, email_assistant_hitl and
+email_assistant_hitl_memory_gmail with the replay models, tools and Gmail stand-ins
+from benchmarks.replay, so no network or API key is needed. A simulated reviewer answers
+every interrupt (accept tool calls, ignore notifications). Reports emails/s,
+p50/p95/p99 latency per node and peak Python memory for each variant.
+
+Pre-triage and the triage cache stay enabled, as in production; the corpus reuses
+--senders senders per template, so later emails mostly skip the router model.
+
+    python -m email_assistant.benchmarks.bench_graphs --emails 2000 --llm-latency-ms 50 --json results.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.store.memory import InMemoryStore
+from langgraph.types import Command
+
+from email_assistant import telemetry
+from email_assistant.async_runner import email_config
+from email_assistant.benchmarks.replay import FakeLabelBatcher, FakeTool, ReplayChatModel, make_corpus
+from email_assistant.episodic_memory import HashingEmbeddings
+from email_assistant.model_registry import MODEL_SPECS, register_embeddings, register_model
+from email_assistant.pre_triage import PreTriage
+from email_assistant.tenants import tenant_registry
+from email_assistant.tiered_triage import TieredRouter
+from email_assistant.triage_cache import triage_cache
+
+VARIANTS = ["email_assistant", "email_assistant_hitl", "email_assistant_hitl_memory_gmail"]
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def load_variant(variant: str, tool_latency: float):
+    """Import an assistant module with fake tools and Gmail, and build its async graph."""
+    module = importlib.import_module(f"email_assistant.{variant}")
+    for name in list(module.tools_by_name):
+        module.tools_by_name[name] = FakeTool(name, tool_latency)
+    # Fresh learned sender statistics, so variants don't warm each other up
+    pre_triage = tenant_registry.default.pre_triage = PreTriage()
+    module.get_pre_triage = lambda: pre_triage
+    # Fresh per-tier counters for this variant
+    module.tiered_router = TieredRouter()
+    if variant == "email_assistant":
+        return module.async_email_assistant
+    persistence = {"checkpointer": InMemorySaver(), "store": InMemoryStore()}
+    if variant == "email_assistant_hitl":
+        return module.build_email_assistant(module.atriage_router, module.triage_interrupt_handler, module.async_response_agent, **persistence)
+    batcher = FakeLabelBatcher()
+    module.get_label_batcher = lambda *args: batcher
+    return module.build_email_assistant(
+        module.atriage_router, module.atriage_interrupt_handler, module.async_response_agent, module.amark_as_read_node, **persistence
+    )
+
+def review(request: dict) -> dict:
+    """Simulated reviewer: accept what can be accepted, ignore notifications, answer questions."""
+    allowed = request.get("config", {})
+    if allowed.get("allow_accept"):
+        return {"type": "accept", "args": request["action_request"]["args"]}
+    if request["action_request"]["action"] == "Question":
+        return {"type": "response", "args": "Tuesday afternoon works."}
+    return {"type": "ignore", "args": None}
+
+async def run_email(graph, email: dict, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        config = email_config(email)
+        result = await graph.ainvoke({"email_input": email}, config)
+        # Resume until the email is done; the base variant never interrupts
+        while result and result.get("__interrupt__"):
+            request = result["__interrupt__"][0].value[0]
+            result = await graph.ainvoke(Command(resume=[review(request)]), config)
+
+async def bench_variant(variant: str, corpus, concurrency: int, tool_latency: float) -> dict:
+    graph = load_variant(variant, tool_latency)
+    triage_cache.clear()
+    telemetry.reset_stats()
+    samples = defaultdict(list)
+    listener = lambda kind, name, seconds: samples[(kind, name)].append(seconds)
+    telemetry.add_listener(listener)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_email(graph, email, semaphore) for email in corpus))
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        telemetry.remove_listener(listener)
+
+    return {
+        "variant": variant,
+        "emails": len(corpus),
+        "seconds": elapsed,
+        "emails_per_second": len(corpus) / elapsed,
+        "peak_memory_mb": peak / 1e6,
+        "llm_calls": len(samples[("llm", "replay")]),
+        "triage_cache": triage_cache.stats(),
+        "triage_tiers": importlib.import_module(f"email_assistant.{variant}").tiered_router.stats(),
+        "nodes": {
+            name: {
+                "count": len(values),
+                "p50_ms": percentile(values, 0.50) * 1e3,
+                "p95_ms": percentile(values, 0.95) * 1e3,
+                "p99_ms": percentile(values, 0.99) * 1e3,
+            }
+            for (kind, name), values in sorted(samples.items()) if kind in ("node", "tool")
+        },
+    }
+
+def report(result: dict):
+    print(f"\n{result['variant']}: {result['emails']} emails in {result['seconds']:.1f}s "
+          f"({result['emails_per_second']:.1f}/s), {result['llm_calls']} model calls, peak memory {result['peak_memory_mb']:.1f} MB")
+    tiers = result["triage_tiers"]
+    print("  triage tiers: " + ", ".join(f"{tier} {entry['calls']} calls ({entry['mean_seconds'] * 1e3:.1f} ms, ${entry['cost_usd']:.4f})"
+                                        for tier, entry in tiers["tiers"].items()) + f", escalation rate {tiers['escalation_rate']:.1%}")
+    print(f"  {'node / tool':<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, entry in result["nodes"].items():
+        print(f"  {name:<28}{entry['count']:>8}{entry['p50_ms']:>10.1f}{entry['p95_ms']:>10.1f}{entry['p99_ms']:>10.1f}")
+
+async def main(emails: int, variants, concurrency: int, llm_latency: float, tool_latency: float, senders: int, json_path: str | None):
+    corpus = make_corpus(emails, senders=senders)
+    # Register the replay model for every role before the assistant modules bind their models
+    model = ReplayChatModel(corpus, latency=llm_latency)
+    for role in MODEL_SPECS:
+        register_model(role, model)
+    # Episodes of the memory variant are embedded offline
+    register_embeddings("episodic_memory", HashingEmbeddings())
+
+    results = []
+    for variant in variants:
+        result = await bench_variant(variant, corpus, concurrency, tool_latency)
+        report(result)
+        results.append(result)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=500)
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=VARIANTS)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--tool-latency-ms", type=float, default=10.0)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    # The memory variant journals pending memory updates in the working directory
+    os.chdir(tempfile.mkdtemp())
+    asyncio.run(main(args.emails, args.variants, args.concurrency, args.llm_latency_ms / 1e3, args.tool_latency_ms / 1e3, args.senders, json_path))
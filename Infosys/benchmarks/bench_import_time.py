@@ -0,0 +1,71 @@
+"""Benchmark: cold import time of the assistant modules, measured with python -X importtime.
+
+Each module is imported in a fresh interpreter, so nothing is cached between runs. Reports
+the module's own cumulative import time (median of --runs) and the slowest imports under
+it. With --max-ms it exits non-zero when a module is slower, so CI can track regressions.
+
+    python -m email_assistant.benchmarks.bench_import_time --runs 5 --max-ms 1500 --json import_times.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = ["email_assistant.email_assistant", "email_assistant.email_assistant_hitl", "email_assistant.email_assistant_hitl_memory_gmail"]
+
+def import_times(module: str) -> dict:
+    """Cumulative import time in microseconds of every module imported by `import module`."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=os.environ.copy(),
+    )
+    if result.returncode != 0:
+        raise ValueError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    # Lines look like "import time:       512 |       1024 |   email_assistant.telemetry"
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+def bench_module(module: str, runs: int, top: int) -> dict:
+    samples = [import_times(module) for _ in range(runs)]
+    total = statistics.median(sample[module] for sample in samples) / 1e3
+    # Slowest imports below the module itself, from the first run
+    slowest = sorted(((name, us) for name, us in samples[0].items() if name != module), key=lambda item: -item[1])[:top]
+    return {
+        "module": module,
+        "import_ms": total,
+        "slowest": [{"module": name, "import_ms": us / 1e3} for name, us in slowest],
+    }
+
+def main(modules, runs: int, top: int, max_ms: float | None, json_path: str | None):
+    results = []
+    for module in modules:
+        result = bench_module(module, runs, top)
+        results.append(result)
+        print(f"{module}: {result['import_ms']:.1f} ms (median of {runs})")
+        for entry in result["slowest"]:
+            print(f"    {entry['import_ms']:8.1f} ms  {entry['module']}")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    too_slow = [result["module"] for result in results if max_ms is not None and result["import_ms"] > max_ms]
+    if too_slow:
+        print(f"Slower than {max_ms:.0f} ms: {', '.join(too_slow)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=MODULES)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list per module")
+    parser.add_argument("--max-ms", type=float, help="Fail when a module takes longer than this to import")
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    main(args.modules, args.runs, args.top, args.max_ms, args.json_path)
@@ -0,0 +1,36 @@
+"""Microbenchmark: cost of getting the memory-updater model in update_memory.
+
+Compares building the structured-output model on every call (the old behaviour) with
+fetching it from the model registry. No request is sent, so no network access or real
+API key is needed.
+
+    python -m email_assistant.benchmarks.bench_memory_model
+"""
+import os
+import timeit
+
+from langchain.chat_models import init_chat_model
+
+from email_assistant.model_registry import get_structured_model
+from email_assistant.preference_rules import RuleUpdate
+
+# init_chat_model only needs a key to be present, never a valid one
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+def per_call():
+    return init_chat_model("openai:gpt-4.1", temperature=0.0).with_structured_output(RuleUpdate)
+
+def registry():
+    return get_structured_model("memory_updater", RuleUpdate)
+
+def main(number: int = 200):
+    # Warm both paths so imports and the registry's first build are not counted
+    per_call()
+    registry()
+
+    for name, fn in [("init_chat_model per call", per_call), ("model registry", registry)]:
+        seconds = timeit.timeit(fn, number=number)
+        print(f"{name:>26}: {seconds / number * 1e6:10.1f} µs per update_memory")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark: prompt size and selection cost of the preference rules as the memory grows.
+
+Fills a namespace with --sizes rules (a few general ones, the rest about one sender domain
+or topic each) and, for a sample of emails, compares the preferences rendered into the
+prompt and the rules shown to the memory updater with what a full-profile rewrite would
+send. Also reports the per-email cost of selecting the relevant rules. No model is called.
+
+    python -m email_assistant.benchmarks.bench_preference_rules --sizes 10 100 1000 --json rules.json
+"""
+import argparse
+import json
+import random
+import time
+
+from langgraph.store.memory import InMemoryStore
+
+from email_assistant.preference_rules import RULES_KEY, RuleBook, _new_rule, render_rules
+
+NAMESPACE = ("email_assistant", "bench", "response_preferences")
+GENERAL_RULES = 3
+
+def make_rules(count: int, rng) -> dict:
+    now = time.time()
+    rules = [_new_rule(f"r{index}", f"General preference number {index}.", [], "default", now) for index in range(1, GENERAL_RULES + 1)]
+    for index in range(GENERAL_RULES + 1, count + 1):
+        keyword = f"@client{index}.com" if rng.random() < 0.5 else f"project{index}"
+        rules.append(_new_rule(f"r{index}", f"When an email is about {keyword}, reply with the agreed wording number {index}.", [keyword], "feedback", now))
+    return {"rules": {rule["id"]: rule for rule in rules}, "next_id": count + 1}
+
+def sample_emails(count: int, rules: int, rng) -> list[dict]:
+    return [
+        {
+            "from": f"someone@client{rng.randint(1, rules)}.com",
+            "subject": f"Update on project{rng.randint(1, rules)}",
+            "body": "Hi, could you send me the latest status and confirm the next meeting? Thanks.",
+        }
+        for _ in range(count)
+    ]
+
+def bench_size(size: int, emails: int, rng) -> dict:
+    store, rulebook = InMemoryStore(), RuleBook()
+    document = make_rules(size, rng)
+    store.put(NAMESPACE, RULES_KEY, document)
+    full_profile = render_rules(list(document["rules"].values()))
+
+    prompt_chars, update_chars, seconds = [], [], 0.0
+    for email_input in sample_emails(emails, size, rng):
+        start = time.perf_counter()
+        rendered = render_rules(rulebook.select(store, NAMESPACE, rulebook.load(store, NAMESPACE), [email_input]))
+        seconds += time.perf_counter() - start
+        prompt_chars.append(len(rendered))
+        feedback = [{"role": "user", "content": f"User edited the reply to: {email_input['from']} {email_input['subject']}"}]
+        update_chars.append(len(rulebook._update_messages(store, NAMESPACE, document, feedback)[0]["content"]))
+
+    return {
+        "rules": size,
+        "full_profile_chars": len(full_profile),
+        "prompt_chars": sum(prompt_chars) / len(prompt_chars),
+        "update_prompt_chars": sum(update_chars) / len(update_chars),
+        "select_us": seconds / emails * 1e6,
+    }
+
+def main(sizes, emails: int, json_path: str | None):
+    rng = random.Random(0)
+    results = []
+    for size in sorted(sizes):
+        result = bench_size(size, emails, rng)
+        results.append(result)
+        print(f"{size:>6} rules: full profile {result['full_profile_chars']:>8} chars, prompt {result['prompt_chars']:8.0f} chars, "
+              f"updater {result['update_prompt_chars']:8.0f} chars, selection {result['select_us']:8.1f} µs/email")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 100, 1000])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--json", dest="json_path", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+    main(args.sizes, args.emails, args.json_path)
@@ -0,0 +1,83 @@
+"""Load test: resume latency of threads suspended on the SQLite checkpointer.
+
+Suspends many threads at a human-review interrupt (as triage_interrupt_handler does),
+then resumes a sample of them concurrently and reports latency percentiles. The graph
+makes no model calls, so only the persistence layer is measured.
+
+    python -m email_assistant.benchmarks.bench_resume_latency --threads 5000 --resumes 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import TypedDict
+
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import interrupt, Command
+
+from email_assistant.sqlite_persistence import SqliteCheckpointer, SqliteDatabase, SqliteStore
+
+# A realistic suspended state: an email thread plus a few agent messages
+EMAIL_BODY = "Hi Lance,\n\nCan we move Thursday's API review to Friday afternoon? " * 40
+
+class ReviewState(TypedDict):
+    email_input: dict
+    messages: list
+    decision: str
+
+def review(state: ReviewState):
+    return {"decision": interrupt({"description": state["email_input"]["body"][:200]})}
+
+def build_graph(checkpointer, store):
+    builder = StateGraph(ReviewState)
+    builder.add_node("review", review)
+    builder.add_edge(START, "review")
+    builder.add_edge("review", END)
+    return builder.compile(checkpointer=checkpointer, store=store)
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+async def timed(graph, value, config, semaphore):
+    async with semaphore:
+        start = time.perf_counter()
+        await graph.ainvoke(value, config)
+        return time.perf_counter() - start
+
+async def main(threads: int, resumes: int, concurrency: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.sqlite")
+    db = SqliteDatabase(path)
+    graph = build_graph(SqliteCheckpointer(db), SqliteStore(db))
+    semaphore = asyncio.Semaphore(concurrency)
+    messages = [{"role": "assistant", "content": f"Step {step}: checked the calendar for Friday."} for step in range(6)]
+
+    # Suspend every thread at the review interrupt
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        timed(graph, {"email_input": {"id": str(i), "body": EMAIL_BODY}, "messages": messages}, {"configurable": {"thread_id": str(i)}}, semaphore)
+        for i in range(threads)
+    ))
+    elapsed = time.perf_counter() - start
+    print(f"Suspended {threads} threads in {elapsed:.1f}s ({threads / elapsed:.0f}/s), "
+          f"{db.writes} writes in {db.commits} commits, database {os.path.getsize(path) / 1e6:.1f} MB")
+
+    # Resume a random sample, as reviewers would
+    sample = random.sample(range(threads), min(resumes, threads))
+    latencies = await asyncio.gather(*(
+        timed(graph, Command(resume="respond"), {"configurable": {"thread_id": str(i)}}, semaphore) for i in sample
+    ))
+    print(f"Resumed {len(sample)} threads: p50 {statistics.median(latencies) * 1e3:.1f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1e3:.1f} ms, p99 {percentile(latencies, 0.99) * 1e3:.1f} ms")
+    db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=2000)
+    parser.add_argument("--resumes", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main(args.threads, args.resumes, args.concurrency))
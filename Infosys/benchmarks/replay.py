@@ -0,0 +1,254 @@
+"""Deterministic stand-ins for the chat models, tools and Gmail used by the assistant graphs.
+
+Every email in the benchmark corpus carries a "[bench-N]" reference. ReplayChatModel finds
+that reference in the prompt and replays the recording for email N: the RouterSchema
+classification for the router and the scripted tool calls, one per agent turn, for the
+response agent. Simulated latency is seeded per email and turn, so runs are repeatable.
+"""
+import asyncio
+import random
+import re
+import time
+import zlib
+
+from langchain_core.messages import AIMessage
+
+from email_assistant import telemetry
+
+# Sample emails based on the notebook's email_input examples; {n} keeps each one unique
+EMAIL_TEMPLATES = [
+    {
+        "kind": "meeting",
+        "classification": "respond",
+        "author": "Alice Smith <alice.smith{sender}@company.com>",
+        "subject": "Quick question about API documentation",
+        "email_thread": "Hi Lance,\n\nI was reviewing the API documentation for the new authentication service and noticed a few endpoints seem to be missing. Could we meet for 30 minutes next Tuesday to go through them?\n\nThanks!\nAlice",
+    },
+    {
+        "kind": "reply",
+        "classification": "respond",
+        "author": "Project Manager <pm{sender}@client.com>",
+        "subject": "Tax season let's schedule call",
+        "email_thread": "Lance,\n\nCan you confirm the deliverables for milestone {n}? I need the list for the client update on Friday.\n\nRegards,\nProject Manager",
+    },
+    {
+        "kind": "notify",
+        "classification": "notify",
+        "author": "System Admin <sysadmin{sender}@company.com>",
+        "subject": "Scheduled maintenance - database downtime",
+        "email_thread": "Hi team,\n\nThis is a reminder that we'll be performing scheduled maintenance on the production database tonight from 2AM to 4AM EST. During this time, all database services will be unavailable.\n\nPlease plan your work accordingly and ensure no critical deployments are scheduled during this window.\n\nThanks,\nSystem Admin Team",
+    },
+    {
+        "kind": "ignore",
+        "classification": "ignore",
+        "author": "Marketing Team <marketing{sender}@amazingdeals.com>",
+        "subject": "Exclusive offer just for you",
+        "email_thread": "Dear valued customer,\n\nDon't miss our spring collection - only this week, members save on every order.\n\nBest regards,\nThe Marketing Team",
+    },
+]
+
+# Tool names of the plain and Gmail tool sets
+TOOL_NAMES = {"write": "write_email", "schedule": "schedule_meeting", "calendar": "check_calendar_availability"}
+GMAIL_TOOL_NAMES = {"write": "send_email_tool", "schedule": "schedule_meeting_tool", "calendar": "check_calendar_tool"}
+
+REFERENCE = re.compile(r"\[bench-(\d+)\]")
+BATCH_EMAIL = re.compile(r'<email index="(\d+)">(.*?)</email>', re.S)
+
+def make_corpus(count: int, senders: int = 50, seed: int = 0) -> list[dict]:
+    """Build count sample emails, each in both the parse_email and parse_gmail shapes.
+
+    Args:
+        count: Number of emails
+        senders: Distinct senders per template; fewer senders means more triage cache hits
+        seed: Seed for the order of email kinds
+
+    Returns:
+        list[dict]: email_input dicts, each with a "kind" and "classification" recording
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for n in range(count):
+        template = rng.choice(EMAIL_TEMPLATES)
+        author = template["author"].format(sender=n % senders)
+        body = template["email_thread"].format(n=n) + f"\n\n[bench-{n}]"
+        corpus.append({
+            # parse_email shape
+            "author": author,
+            "to": "Lance Martin <lance@company.com>",
+            "subject": template["subject"],
+            "email_thread": body,
+            # parse_gmail shape
+            "from": author,
+            "body": body,
+            "id": f"bench-{n}",
+            "send_time": "2025-05-01T10:00:00",
+            # Recording
+            "kind": template["kind"],
+            "classification": template["classification"],
+        })
+    return corpus
+
+def script(email: dict, gmail: bool = False) -> list[dict]:
+    """The recorded tool calls of the response agent for an email, one per turn, ending with Done."""
+    names = GMAIL_TOOL_NAMES if gmail else TOOL_NAMES
+    author = email["author"]
+    calls = []
+    if email["kind"] == "meeting":
+        calls.append((names["calendar"], {"dates": ["05-06-2025"]} if gmail else {"day": "Tuesday"}))
+        calls.append((names["schedule"], {
+            "attendees": [author, "lance@company.com"], "title": "API documentation review",
+            "start_time": "2025-05-06T14:00:00", "end_time": "2025-05-06T14:30:00", "organizer_email": "lance@company.com",
+        } if gmail else {
+            "attendees": [author, "lance@company.com"], "subject": "API documentation review",
+            "duration_minutes": 30, "preferred_day": "Tuesday", "start_time": 14,
+        }))
+    calls.append((names["write"], {
+        "email_id": email["id"], "response_text": "Thanks, that works for me. Lance", "email_address": "lance@company.com",
+    } if gmail else {
+        "to": author, "subject": f"Re: {email['subject']}", "content": "Thanks, that works for me.\n\nLance",
+    }))
+    calls.append(("Done", {"done": True}))
+    return [{"name": name, "args": args, "id": f"call_{email['id']}_{turn}", "type": "tool_call"} for turn, (name, args) in enumerate(calls)]
+
+def _text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(message["content"] if isinstance(message, dict) else message.content) for message in messages)
+
+def _agent_turns(messages) -> int:
+    return sum(
+        1 for message in messages
+        if isinstance(message, AIMessage) or (isinstance(message, dict) and message.get("role") in ("assistant", "ai"))
+    )
+
+class ReplayChatModel:
+    """Fake chat model that replays recorded outputs for the benchmark corpus.
+
+    Serves every role of the model registry and every assistant variant: with_structured_output
+    returns recorded RouterSchema (and batch) decisions or a placeholder for other schemas,
+    bind_tools returns the scripted tool calls (Gmail tool names if the bound tools are the
+    Gmail ones), and plain invoke returns a short summary.
+
+    Args:
+        corpus: Emails from make_corpus
+        latency: Mean simulated latency per call, in seconds
+        jitter: Relative spread of the latency (0.2 = plus or minus 20%)
+        seed: Seed of the latency jitter
+    """
+
+    def __init__(self, corpus, latency: float = 0.05, jitter: float = 0.2, seed: int = 0):
+        self.corpus = {email["id"]: email for email in corpus}
+        self.latency = latency
+        self.jitter = jitter
+        self.seed = seed
+        self.calls = 0
+
+    def _email(self, text):
+        match = REFERENCE.search(text)
+        if match is None:
+            raise ValueError("Prompt has no [bench-N] reference; only corpus emails can be replayed")
+        return self.corpus[f"bench-{match.group(1)}"]
+
+    def _delay(self, *key):
+        self.calls += 1
+        # crc32 rather than hash(), which is randomized per process for strings
+        spread = random.Random(zlib.crc32(repr((self.seed, *key)).encode())).uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency * (1 + spread))
+
+    def _record(self, delay, text, output_tokens):
+        telemetry.record_llm("replay", delay, len(text) // 4, output_tokens)
+
+    # Structured output (router, batch router, memory updater)
+    def _structured(self, schema, messages):
+        text = _text(messages)
+        fields = schema.model_fields
+        if "decisions" in fields:
+            decision_type = fields["decisions"].annotation.__args__[0]
+            decisions = [
+                decision_type(index=int(index), reasoning="Recorded decision.", classification=self._email(block)["classification"])
+                for index, block in BATCH_EMAIL.findall(text)
+            ]
+            return schema(decisions=decisions), ("batch", len(decisions))
+        if "classification" in fields:
+            email = self._email(text)
+            # The fast triage tier also reports its confidence; recorded decisions are never escalated
+            extra = {"confidence": 0.95} if "confidence" in fields else {}
+            return schema(reasoning="Recorded decision.", classification=email["classification"], **extra), ("router", email["id"])
+        if "operations" in fields:
+            # Memory updater on the preference rules: the recorded feedback changes no rule
+            return schema(operations=[]), ("memory", len(text))
+        # Any other schema gets placeholder strings
+        return schema(**{name: "Recorded output." for name in fields}), ("structured", schema.__name__)
+
+    # Tool calling (response agent)
+    def _tool_step(self, messages, gmail):
+        email = self._email(_text(messages))
+        calls = script(email, gmail)
+        turn = min(_agent_turns(messages), len(calls) - 1)
+        return AIMessage(content="", tool_calls=[calls[turn]]), ("agent", email["id"], turn)
+
+    def invoke(self, messages, config=None, **kwargs):
+        message = AIMessage(content="Summary: earlier steps checked the calendar and drafted a reply.")
+        delay = self._delay("plain", len(messages))
+        time.sleep(delay)
+        self._record(delay, _text(messages), 20)
+        return message
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        message = AIMessage(content="Summary: earlier steps checked the calendar and drafted a reply.")
+        delay = self._delay("plain", len(messages))
+        await asyncio.sleep(delay)
+        self._record(delay, _text(messages), 20)
+        return message
+
+    def with_structured_output(self, schema, **kwargs):
+        return _Bound(self, lambda messages: self._structured(schema, messages))
+
+    def bind_tools(self, tools, **kwargs):
+        gmail = any(getattr(tool, "name", None) == GMAIL_TOOL_NAMES["write"] for tool in tools)
+        return _Bound(self, lambda messages: self._tool_step(messages, gmail))
+
+class _Bound:
+    """A ReplayChatModel bound to structured output or tools."""
+
+    def __init__(self, model, respond):
+        self.model = model
+        self.respond = respond
+
+    def invoke(self, messages, config=None, **kwargs):
+        result, key = self.respond(messages)
+        delay = self.model._delay(*key)
+        time.sleep(delay)
+        self.model._record(delay, _text(messages), 50)
+        return result
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        result, key = self.respond(messages)
+        delay = self.model._delay(*key)
+        await asyncio.sleep(delay)
+        self.model._record(delay, _text(messages), 50)
+        return result
+
+class FakeTool:
+    """Tool stand-in that returns a canned result after a simulated latency."""
+
+    def __init__(self, name: str, latency: float = 0.01):
+        self.name = name
+        self.latency = latency
+
+    def invoke(self, args, config=None, **kwargs):
+        time.sleep(self.latency)
+        return f"{self.name} completed with {sorted(args) if isinstance(args, dict) else args}"
+
+    async def ainvoke(self, args, config=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return f"{self.name} completed with {sorted(args) if isinstance(args, dict) else args}"
+
+class FakeLabelBatcher:
+    """Stand-in for gmail_pool.LabelBatcher that only counts label changes."""
+
+    def __init__(self):
+        self.marked = 0
+
+    def mark_as_read(self, message_id: str):
+        self.marked += 1
@@ -0,0 +1,165 @@
+import re
+import threading
+from collections import OrderedDict
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, convert_to_messages
+
+from email_assistant.model_registry import get_model
+from email_assistant.resilience import ResilientModel
+from email_assistant.prompts import context_summary_prompt
+from email_assistant.telemetry import get_logger, record_context
+
+logger = get_logger(__name__)
+
+# Agent turns (an AI message plus the tool results that answer it) kept verbatim
+DEFAULT_KEEP_TURNS = 4
+# Longest email body / tool result sent as-is; longer ones lose their quoted history first
+DEFAULT_MAX_BODY_CHARS = 6000
+
+# Where quoted history usually starts in a reply
+QUOTE_START = re.compile(r"^(>|On .+ wrote:\s*$|-{2,}\s*Original Message\s*-{2,}|From: .+$)", re.M)
+
+def estimate_tokens(messages) -> int:
+    """Rough token count (about four characters per token), including tool call arguments."""
+    chars = 0
+    for message in messages:
+        content = message.content
+        chars += len(content) if isinstance(content, str) else sum(len(str(part)) for part in content)
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            chars += len(str(tool_call["args"]))
+    return chars // 4
+
+def cap_email_body(text: str, max_chars: int = DEFAULT_MAX_BODY_CHARS) -> str:
+    """Shorten a long email body, dropping quoted history before cutting the new text."""
+    if len(text) <= max_chars:
+        return text
+    match = QUOTE_START.search(text)
+    if match and match.start() > 0:
+        text = text[:match.start()].rstrip() + "\n\n[quoted history omitted]"
+        if len(text) <= max_chars:
+            return text
+    omitted = len(text) - max_chars
+    return text[:max_chars].rstrip() + f"\n\n[{omitted} characters omitted]"
+
+def split_turns(messages):
+    """Split messages into the opening messages (the email) and agent turns.
+
+    A turn starts at an AI message and runs until the next AI message, so an AI
+    message always stays together with the tool messages that answer its tool calls.
+    """
+    head = []
+    turns = []
+    for message in messages:
+        if isinstance(message, AIMessage):
+            turns.append([message])
+        elif turns:
+            turns[-1].append(message)
+        else:
+            head.append(message)
+    return head, turns
+
+class ContextManager:
+    """Keeps the agent loop's prompt bounded.
+
+    The opening email and the last keep_turns agent turns are sent verbatim; older turns are
+    replaced by one rolling summary. Summaries are cached by the ids of the messages they cover,
+    and a longer history extends the summary of its cached prefix instead of starting over, so
+    each old turn is summarized once. Long email bodies and tool results are capped as well.
+    """
+
+    def __init__(self, keep_turns: int = DEFAULT_KEEP_TURNS, max_body_chars: int = DEFAULT_MAX_BODY_CHARS,
+                 summarizer_role: str = "summarizer", max_cached_summaries: int = 1024):
+        self.keep_turns = keep_turns
+        self.max_body_chars = max_body_chars
+        self.summarizer_role = summarizer_role
+        self.max_cached_summaries = max_cached_summaries
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cap(self, message):
+        if isinstance(message, (HumanMessage, ToolMessage)) and isinstance(message.content, str) and len(message.content) > self.max_body_chars:
+            return message.model_copy(update={"content": cap_email_body(message.content, self.max_body_chars)})
+        return message
+
+    def _key(self, turns):
+        return tuple(message.id or str(hash(str(message.content))) for turn in turns for message in turn)
+
+    def _cached_prefix(self, old_turns):
+        """Longest prefix of old_turns that already has a summary: (summary, number of turns)."""
+        with self._lock:
+            for count in range(len(old_turns), 0, -1):
+                key = self._key(old_turns[:count])
+                if key in self._summaries:
+                    self._summaries.move_to_end(key)
+                    return self._summaries[key], count
+        return "", 0
+
+    def _remember(self, old_turns, summary):
+        with self._lock:
+            self._summaries[self._key(old_turns)] = summary
+            while len(self._summaries) > self.max_cached_summaries:
+                self._summaries.popitem(last=False)
+
+    def _summarizer(self):
+        # Deadline and retries of the "summarizer" call policy
+        return ResilientModel(get_model(self.summarizer_role), self.summarizer_role)
+
+    def _summary_request(self, previous_summary, new_turns):
+        previous = f"Summary so far:\n{previous_summary}" if previous_summary else ""
+        return (
+            [{"role": "system", "content": context_summary_prompt.format(previous_summary=previous)}]
+            + [self._cap(message) for turn in new_turns for message in turn]
+            + [{"role": "user", "content": "Write the updated summary now."}]
+        )
+
+    def _assemble(self, head, summary, kept_turns, messages, summarized):
+        result = [self._cap(message) for message in head]
+        if summary:
+            result.append(HumanMessage(content=f"Summary of earlier steps on this email: {summary}"))
+        result += [self._cap(message) for turn in kept_turns for message in turn]
+
+        # Recorded per prompt (metrics, and the span of the node preparing it), since one manager serves every email
+        before = estimate_tokens(messages)
+        after = estimate_tokens(result)
+        record_context(before, after, summarized)
+        if after < before:
+            logger.info(f"✂️ Context: {before} → {after} tokens ({summarized} older turn(s) summarized)", tokens_before=before, tokens_after=after, summarized_turns=summarized)
+        return result
+
+    def prepare(self, messages):
+        """Return the bounded message list to send to the model in place of messages."""
+        messages = convert_to_messages(messages)
+        head, turns = split_turns(messages)
+        if len(turns) <= self.keep_turns:
+            return self._assemble(head, "", turns, messages, 0)
+
+        old_turns, kept_turns = turns[:-self.keep_turns], turns[-self.keep_turns:]
+        summary, covered = self._cached_prefix(old_turns)
+        if covered < len(old_turns):
+            try:
+                summary = self._summarizer().invoke(self._summary_request(summary, old_turns[covered:])).content
+                self._remember(old_turns, summary)
+            except Exception as error:
+                # Better to drop the old turns than to fail the email
+                logger.warning(f"⚠️ Context summary failed, dropping {len(old_turns) - covered} older turn(s): {error}", dropped_turns=len(old_turns) - covered)
+        return self._assemble(head, summary, kept_turns, messages, len(old_turns))
+
+    async def aprepare(self, messages):
+        """Async variant of prepare."""
+        messages = convert_to_messages(messages)
+        head, turns = split_turns(messages)
+        if len(turns) <= self.keep_turns:
+            return self._assemble(head, "", turns, messages, 0)
+
+        old_turns, kept_turns = turns[:-self.keep_turns], turns[-self.keep_turns:]
+        summary, covered = self._cached_prefix(old_turns)
+        if covered < len(old_turns):
+            try:
+                summary = (await self._summarizer().ainvoke(self._summary_request(summary, old_turns[covered:]))).content
+                self._remember(old_turns, summary)
+            except Exception as error:
+                logger.warning(f"⚠️ Context summary failed, dropping {len(old_turns) - covered} older turn(s): {error}", dropped_turns=len(old_turns) - covered)
+        return self._assemble(head, summary, kept_turns, messages, len(old_turns))
+
+# Shared context stage used by the assistant graphs; adjust keep_turns / max_body_chars here
+context_manager = ContextManager()
@@ -1,29 +1,68 @@
+from functools import cache
 from typing import Literal
 
-from langchain.chat_models import init_chat_model
-
 from email_assistant.tools import get_tools, get_tools_by_name
 from email_assistant.tools.default.prompt_templates import AGENT_TOOLS_PROMPT
 from email_assistant.prompts import triage_system_prompt, triage_user_prompt, agent_system_prompt, default_background, default_triage_instructions, default_response_preferences, default_cal_preferences
-from email_assistant.schemas import State, RouterSchema, StateInput
+from email_assistant.schemas import State, StateInput
 from email_assistant.utils import parse_email, format_email_markdown
+from email_assistant.batch_triage import BatchRouterSchema, batch_triage, DEFAULT_BATCH_SIZE
+from email_assistant.tool_executor import run_tool_calls, arun_tool_calls
+from email_assistant.prompt_cache import prompt_cache
+from email_assistant.tiered_triage import tiered_router
+from email_assistant.model_registry import get_structured_model, get_tool_model, load_environment
+from email_assistant.context import context_manager
+from email_assistant.telemetry import get_logger, instrument_node
+from email_assistant.pre_triage import get_pre_triage
+from email_assistant.triage_cache import triage_cache
 
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import Command
-from dotenv import load_dotenv
-load_dotenv(".env")
 
-# Get tools
-tools = get_tools()
-tools_by_name = get_tools_by_name(tools)
+logger = get_logger(__name__)
+
+# Tools and models are built on first use rather than at import, so importing this module stays
+# cheap for CLI runs, test collection and autoscaled workers; warm_up() builds everything up front
+@cache
+def load_tools():
+    """Tools of this assistant, loaded once on first use"""
+    load_environment()
+    return get_tools()
+
+@cache
+def load_tools_by_name():
+    """Tools of this assistant by name"""
+    return get_tools_by_name(load_tools())
+
+# LLM for use with router / structured output: a fast model first, escalating to the
+# large one only when unsure (models built once per process by the model registry)
+def router_model():
+    return tiered_router
+
+def batch_router_model():
+    return get_structured_model("router", BatchRouterSchema)
 
-# Initialize the LLM for use with router / structured output
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_router = llm.with_structured_output(RouterSchema) 
+# LLM, enforcing tool use (of any available tools) for agent
+def agent_model():
+    return get_tool_model("agent", load_tools(), tool_choice="any")
 
-# Initialize the LLM, enforcing tool use (of any available tools) for agent
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_with_tools = llm.bind_tools(tools, tool_choice="any")
+# Prompts: these don't depend on memory, so each is formatted once per process
+def agent_prompt():
+    """System prompt for the response agent"""
+    return prompt_cache.get("agent_system_prompt", lambda: agent_system_prompt.format(
+        tools_prompt=AGENT_TOOLS_PROMPT,
+        background=default_background,
+        response_preferences=default_response_preferences, 
+        cal_preferences=default_cal_preferences,
+    ))
+
+def triage_prompt():
+    """System prompt for the triage router"""
+    return prompt_cache.get("triage_system_prompt", lambda: triage_system_prompt.format(
+        background=default_background,
+        triage_instructions=default_triage_instructions,
+    ))
 
 # Nodes
 def llm_call(state: State):
@@ -31,17 +70,25 @@ def llm_call(state: State):
 
     return {
         "messages": [
-            llm_with_tools.invoke(
+            agent_model().invoke(
+                [
+                    {"role": "system", "content": agent_prompt()},
+                ]
+                + context_manager.prepare(state["messages"])
+            )
+        ]
+    }
+
+async def allm_call(state: State):
+    """Async variant of llm_call"""
+
+    return {
+        "messages": [
+            await agent_model().ainvoke(
                 [
-                    {"role": "system", "content": agent_system_prompt.format(
-                        tools_prompt=AGENT_TOOLS_PROMPT,
-                        background=default_background,
-                        response_preferences=default_response_preferences, 
-                        cal_preferences=default_cal_preferences)
-                    },
-                    
+                    {"role": "system", "content": agent_prompt()},
                 ]
-                + state["messages"]
+                + await context_manager.aprepare(state["messages"])
             )
         ]
     }
@@ -49,11 +96,15 @@ def llm_call(state: State):
 def tool_node(state: State):
     """Performs the tool call"""
 
-    result = []
-    for tool_call in state["messages"][-1].tool_calls:
-        tool = tools_by_name[tool_call["name"]]
-        observation = tool.invoke(tool_call["args"])
-        result.append({"role": "tool", "content" : observation, "tool_call_id": tool_call["id"]})
+    # Independent calls of one turn run concurrently; messages keep the tool call order
+    result = run_tool_calls(state["messages"][-1].tool_calls, load_tools_by_name())
+    return {"messages": result}
+
+async def atool_node(state: State):
+    """Async variant of tool_node"""
+
+    # Independent calls of one turn run concurrently; messages keep the tool call order
+    result = await arun_tool_calls(state["messages"][-1].tool_calls, load_tools_by_name())
     return {"messages": result}
 
 # Conditional edge function
@@ -69,93 +120,225 @@ def should_continue(state: State) -> Literal["Action", "__end__"]:
                 return "Action"
 
 # Build workflow
-agent_builder = StateGraph(State)
-
-# Add nodes
-agent_builder.add_node("llm_call", llm_call)
-agent_builder.add_node("environment", tool_node)
-
-# Add edges to connect nodes
-agent_builder.add_edge(START, "llm_call")
-agent_builder.add_conditional_edges(
-    "llm_call",
-    should_continue,
-    {
-        # Name returned by should_continue : Name of next node to visit
-        "Action": "environment",
-        END: END,
-    },
-)
-agent_builder.add_edge("environment", "llm_call")
-
-# Compile the agent
-agent = agent_builder.compile()
-
-def triage_router(state: State) -> Command[Literal["response_agent", "__end__"]]:
-    """Analyze email content to decide if we should respond, notify, or ignore.
+def build_agent(llm_call, tool_node):
+    """Build the response agent from sync or async node functions"""
+    agent_builder = StateGraph(State)
 
-    The triage step prevents the assistant from wasting time on:
-    - Marketing emails and spam
-    - Company-wide announcements
-    - Messages meant for other teams
-    """
-    author, to, subject, email_thread = parse_email(state["email_input"])
-    system_prompt = triage_system_prompt.format(
-        background=default_background,
-        triage_instructions=default_triage_instructions
-    )
+    # Add nodes
+    agent_builder.add_node("llm_call", instrument_node("llm_call", llm_call))
+    agent_builder.add_node("environment", instrument_node("environment", tool_node))
 
-    user_prompt = triage_user_prompt.format(
-        author=author, to=to, subject=subject, email_thread=email_thread
+    # Add edges to connect nodes
+    agent_builder.add_edge(START, "llm_call")
+    agent_builder.add_conditional_edges(
+        "llm_call",
+        should_continue,
+        {
+            # Name returned by should_continue : Name of next node to visit
+            "Action": "environment",
+            END: END,
+        },
     )
+    agent_builder.add_edge("environment", "llm_call")
 
-    # Create email markdown for Agent Inbox in case of notification  
-    email_markdown = format_email_markdown(subject, author, to, email_thread)
+    # Compile the agent
+    return agent_builder.compile()
 
-    # Run the router LLM
-    result = llm_router.invoke(
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-    )
-
-    # Decision
-    classification = result.classification
+def triage_command(classification: str, email_markdown: str) -> Command[Literal["response_agent", "__end__"]]:
+    """Turn a triage classification into the routing Command for the graph."""
 
     if classification == "respond":
-        print("📧 Classification: RESPOND - This email requires a response")
+        logger.info("📧 Classification: RESPOND - This email requires a response", classification=classification)
         goto = "response_agent"
         # Add the email to the messages
         update = {
-            "classification_decision": result.classification,
+            "classification_decision": classification,
             "messages": [{"role": "user",
                             "content": f"Respond to the email: {email_markdown}"
                         }],
         }
-    elif result.classification == "ignore":
-        print("🚫 Classification: IGNORE - This email can be safely ignored")
+    elif classification == "ignore":
+        logger.info("🚫 Classification: IGNORE - This email can be safely ignored", classification=classification)
         update =  {
-            "classification_decision": result.classification,
+            "classification_decision": classification,
         }
         goto = END
-    elif result.classification == "notify":
+    elif classification == "notify":
         # If real life, this would do something else
-        print("🔔 Classification: NOTIFY - This email contains important information")
+        logger.info("🔔 Classification: NOTIFY - This email contains important information", classification=classification)
         update = {
-            "classification_decision": result.classification,
+            "classification_decision": classification,
         }
         goto = END
     else:
-        raise ValueError(f"Invalid classification: {result.classification}")
+        raise ValueError(f"Invalid classification: {classification}")
     return Command(goto=goto, update=update)
 
+def triage_lookup(state: State, config: RunnableConfig):
+    """Parse the email for triage and look for a decision that needs no router LLM call.
+
+    Shared by triage_router and atriage_router, which only differ in how they call the router.
+
+    Returns:
+        tuple: (author, subject and thread of the email, user prompt, email markdown, decision or None)
+    """
+    # Parse the email input
+    author, to, subject, email_thread = parse_email(state["email_input"])
+    user_prompt = triage_user_prompt.format(
+        author=author, to=to, subject=subject, email_thread=email_thread
+    )
+
+    # Create email markdown for Agent Inbox in case of notification  
+    email_markdown = format_email_markdown(subject, author, to, email_thread)
+
+    # Use a decision made ahead of time (e.g. by run_batch), otherwise try the pre-triage rules
+    result = config.get("configurable", {}).get("triage_result")
+    if result is None:
+        # Obvious bulk and automated mail is classified from its headers without the LLM
+        result = get_pre_triage().classify(author, subject, state["email_input"].get("headers"))
+    if result is None:
+        # Recurring emails (build reports, digests, ...) reuse the decision made for an earlier near-duplicate
+        result = triage_cache.get(author, subject, email_thread)
+    return (author, subject, email_thread), user_prompt, email_markdown, result
+
+def triage_messages(user_prompt: str) -> list[dict]:
+    """Messages for the router LLM, with the system prompt formatted with background and triage instructions"""
+    return [
+        {"role": "system", "content": triage_prompt()},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def triage_learn(email, result):
+    """Learn from (and cache) a decision of the router LLM for an (author, subject, thread) email"""
+    author, subject, email_thread = email
+    # Learn which senders are always classified the same way
+    get_pre_triage().learn(author, result.classification)
+    triage_cache.put(author, subject, email_thread, result)
+
+def triage_router(state: State, config: RunnableConfig) -> Command[Literal["response_agent", "__end__"]]:
+    """Analyze email content to decide if we should respond, notify, or ignore.
+
+    The triage step prevents the assistant from wasting time on:
+    - Marketing emails and spam
+    - Company-wide announcements
+    - Messages meant for other teams
+    """
+    email, user_prompt, email_markdown, result = triage_lookup(state, config)
+    if result is None:
+        result = router_model().invoke(triage_messages(user_prompt))
+        triage_learn(email, result)
+
+    # Decision
+    return triage_command(result.classification, email_markdown)
+
+async def atriage_router(state: State, config: RunnableConfig) -> Command[Literal["response_agent", "__end__"]]:
+    """Async variant of triage_router"""
+    email, user_prompt, email_markdown, result = triage_lookup(state, config)
+    if result is None:
+        result = await router_model().ainvoke(triage_messages(user_prompt))
+        triage_learn(email, result)
+    return triage_command(result.classification, email_markdown)
+
+def batch_triage_router(email_inputs: list[dict], batch_size: int = DEFAULT_BATCH_SIZE) -> list[Command[Literal["response_agent", "__end__"]]]:
+    """Triage many emails at once, sending the triage system prompt once per batch.
+
+    Args:
+        email_inputs: List of email_input dicts, as passed to email_assistant
+        batch_size: Maximum number of emails classified by one router call
+
+    Returns:
+        list[Command]: One routing Command per email, in input order
+    """
+    parsed_emails = [parse_email(email_input) for email_input in email_inputs]
+    results = classify_batch(email_inputs, batch_size, parsed_emails)
+    return [
+        triage_command(result.classification, format_email_markdown(subject, author, to, email_thread))
+        for (author, to, subject, email_thread), result in zip(parsed_emails, results)
+    ]
+
+def classify_batch(email_inputs, batch_size=DEFAULT_BATCH_SIZE, parsed_emails=None):
+    """Classify emails with the pre-triage rules, the triage cache and the batched router; one RouterSchema per email."""
+    # Callers that already parsed the emails (e.g. batch_triage_router) pass them in
+    parsed_emails = parsed_emails or [parse_email(email_input) for email_input in email_inputs]
+
+    # Obvious bulk and automated mail, and near-duplicates of emails seen before, never reach the LLM
+    decided = [
+        get_pre_triage().classify(author, subject, email_input.get("headers")) or triage_cache.get(author, subject, email_thread)
+        for email_input, (author, to, subject, email_thread) in zip(email_inputs, parsed_emails)
+    ]
+    results = batch_triage(parsed_emails, batch_router_model(), router_model(), triage_prompt(), batch_size=batch_size, decided=decided)
+
+    # Learn from (and cache) the LLM's decisions only
+    for (author, to, subject, email_thread), rule_result, result in zip(parsed_emails, decided, results):
+        if rule_result is None:
+            triage_learn((author, subject, email_thread), result)
+    return results
+
+def run_batch(email_inputs: list[dict], batch_size: int = DEFAULT_BATCH_SIZE, config: RunnableConfig | None = None) -> list[dict]:
+    """Triage a burst of emails in batches, then run each through email_assistant.
+
+    Each graph run reuses its precomputed decision, so triage_router does not call the LLM again.
+    Any other settings in config (e.g. callbacks or tags) are passed through to every run.
+    """
+    config = config or {}
+    results = classify_batch(email_inputs, batch_size)
+    return [
+        get_graph("email_assistant").invoke(
+            {"email_input": email_input},
+            config={**config, "configurable": {**config.get("configurable", {}), "triage_result": result}},
+        )
+        for email_input, result in zip(email_inputs, results)
+    ]
+
 # Build workflow
-overall_workflow = (
-    StateGraph(State, input=StateInput)
-    .add_node(triage_router)
-    .add_node("response_agent", agent)
-    .add_edge(START, "triage_router")
-)
-
-email_assistant = overall_workflow.compile()
\ No newline at end of file
+def build_email_assistant(triage_router, response_agent):
+    """Build the overall workflow from a triage node and a compiled response agent"""
+    overall_workflow = (
+        StateGraph(State, input=StateInput)
+        .add_node("triage_router", instrument_node("triage_router", triage_router))
+        .add_node("response_agent", response_agent)
+        .add_edge(START, "triage_router")
+    )
+    return overall_workflow.compile()
+
+# Compiled graphs by name, built on first use
+GRAPHS = {
+    "agent": lambda: build_agent(llm_call, tool_node),
+    "async_agent": lambda: build_agent(allm_call, atool_node),
+    "email_assistant": lambda: build_email_assistant(triage_router, get_graph("agent")),
+    # Async graph: run it with ainvoke, or many emails at once with async_runner.run_emails
+    "async_email_assistant": lambda: build_email_assistant(atriage_router, get_graph("async_agent")),
+}
+
+@cache
+def get_graph(name: str):
+    """Compiled graph by name (a key of GRAPHS), built once on first use"""
+    return GRAPHS[name]()
+
+# Module attributes built on first access, so e.g. `from email_assistant.email_assistant import email_assistant` still works
+LAZY_ATTRIBUTES = {
+    "tools": load_tools,
+    "tools_by_name": load_tools_by_name,
+    "llm_router": router_model,
+    "llm_batch_router": batch_router_model,
+    "llm_with_tools": agent_model,
+}
+
+def __getattr__(name):
+    if name in GRAPHS:
+        return get_graph(name)
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """Build the tools, models and compiled graphs now (e.g. when a worker starts) instead of on the first email"""
+    load_tools_by_name()
+    # router_model() is the tiered router; build the models of both of its tiers
+    router_model().warm_up()
+    batch_router_model()
+    agent_model()
+    # Reads the learned sender statistics
+    get_pre_triage()
+    for name in GRAPHS:
+        get_graph(name)
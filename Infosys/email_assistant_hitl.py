@@ -1,81 +1,88 @@
+from functools import cache
 from typing import Literal
 
-from langchain.chat_models import init_chat_model
-
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import interrupt, Command
 
 from email_assistant.tools import get_tools, get_tools_by_name
 from email_assistant.tools.default.prompt_templates import HITL_TOOLS_PROMPT
 from email_assistant.prompts import triage_system_prompt, triage_user_prompt, agent_system_prompt_hitl, default_background, default_triage_instructions, default_response_preferences, default_cal_preferences
-from email_assistant.schemas import State, RouterSchema, StateInput
+from email_assistant.schemas import State, StateInput
 from email_assistant.utils import parse_email, format_for_display, format_email_markdown
-from dotenv import load_dotenv
-
-load_dotenv(".env")
-
-# Get tools
-tools = get_tools(["write_email", "schedule_meeting", "check_calendar_availability", "Question", "Done"])
-tools_by_name = get_tools_by_name(tools)
-
-# Initialize the LLM for use with router / structured output
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_router = llm.with_structured_output(RouterSchema) 
-
-# Initialize the LLM, enforcing tool use (of any available tools) for agent
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_with_tools = llm.bind_tools(tools, tool_choice="required")
-
-# Nodes 
-def triage_router(state: State) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
-    """Analyze email content to decide if we should respond, notify, or ignore.
-
-    The triage step prevents the assistant from wasting time on:
-    - Marketing emails and spam
-    - Company-wide announcements
-    - Messages meant for other teams
-    """
-
-    # Parse the email input
-    author, to, subject, email_thread = parse_email(state["email_input"])
-    user_prompt = triage_user_prompt.format(
-        author=author, to=to, subject=subject, email_thread=email_thread
-    )
-
-    # Create email markdown for Agent Inbox in case of notification  
-    email_markdown = format_email_markdown(subject, author, to, email_thread)
-
-    # Format system prompt with background and triage instructions
-    system_prompt = triage_system_prompt.format(
+from email_assistant.batch_triage import BatchRouterSchema, batch_triage, DEFAULT_BATCH_SIZE
+from email_assistant.tool_executor import run_tool_calls, arun_tool_calls, invoke_tool, ainvoke_tool
+from email_assistant.prompt_cache import prompt_cache
+from email_assistant.tiered_triage import tiered_router
+from email_assistant.model_registry import get_structured_model, get_tool_model, load_environment
+from email_assistant.context import context_manager
+from email_assistant.telemetry import get_logger, instrument_node
+from email_assistant.pre_triage import get_pre_triage
+from email_assistant.triage_cache import triage_cache
+from email_assistant.sqlite_persistence import DEFAULT_DB_PATH, get_persistence
+
+logger = get_logger(__name__)
+
+# Tools and models are built on first use rather than at import, so importing this module stays
+# cheap for CLI runs, test collection and autoscaled workers; warm_up() builds everything up front
+@cache
+def load_tools():
+    """Tools of this assistant, loaded once on first use"""
+    load_environment()
+    return get_tools(["write_email", "schedule_meeting", "check_calendar_availability", "Question", "Done"])
+
+@cache
+def load_tools_by_name():
+    """Tools of this assistant by name"""
+    return get_tools_by_name(load_tools())
+
+# LLM for use with router / structured output: a fast model first, escalating to the
+# large one only when unsure (models built once per process by the model registry)
+def router_model():
+    return tiered_router
+
+def batch_router_model():
+    return get_structured_model("router", BatchRouterSchema)
+
+# LLM, enforcing tool use (of any available tools) for agent
+def agent_model():
+    return get_tool_model("agent", load_tools(), tool_choice="required")
+
+# Prompts: these don't depend on memory, so each is formatted once per process
+def agent_prompt():
+    """System prompt for the response agent"""
+    return prompt_cache.get("agent_system_prompt_hitl", lambda: agent_system_prompt_hitl.format(
+        tools_prompt=HITL_TOOLS_PROMPT,
         background=default_background,
-        triage_instructions=default_triage_instructions
-    )
+        response_preferences=default_response_preferences, 
+        cal_preferences=default_cal_preferences,
+    ))
 
-    # Run the router LLM
-    result = llm_router.invoke(
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-    )
+def triage_prompt():
+    """System prompt for the triage router"""
+    return prompt_cache.get("triage_system_prompt", lambda: triage_system_prompt.format(
+        background=default_background,
+        triage_instructions=default_triage_instructions,
+    ))
 
-    # Decision
-    classification = result.classification
+# Nodes 
+def triage_command(classification: str, email_markdown: str) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
+    """Turn a triage classification into the routing Command for the graph."""
 
     # Process the classification decision
     if classification == "respond":
-        print("📧 Classification: RESPOND - This email requires a response")
+        logger.info("📧 Classification: RESPOND - This email requires a response", classification=classification)
         # Next node
         goto = "response_agent"
         # Update the state
         update = {
-            "classification_decision": result.classification,
+            "classification_decision": classification,
             "messages": [{"role": "user",
                             "content": f"Respond to the email: {email_markdown}"
                         }],
         }
     elif classification == "ignore":
-        print("🚫 Classification: IGNORE - This email can be safely ignored")
+        logger.info("🚫 Classification: IGNORE - This email can be safely ignored", classification=classification)
 
         # Next node
         goto = END
@@ -85,7 +92,7 @@ def triage_router(state: State) -> Command[Literal["triage_interrupt_handler", "
         }
 
     elif classification == "notify":
-        print("🔔 Classification: NOTIFY - This email contains important information") 
+        logger.info("🔔 Classification: NOTIFY - This email contains important information", classification=classification) 
 
         # Next node
         goto = "triage_interrupt_handler"
@@ -98,6 +105,122 @@ def triage_router(state: State) -> Command[Literal["triage_interrupt_handler", "
         raise ValueError(f"Invalid classification: {classification}")
     return Command(goto=goto, update=update)
 
+def triage_lookup(state: State, config: RunnableConfig):
+    """Parse the email for triage and look for a decision that needs no router LLM call.
+
+    Shared by triage_router and atriage_router, which only differ in how they call the router.
+
+    Returns:
+        tuple: (author, subject and thread of the email, user prompt, email markdown, decision or None)
+    """
+    # Parse the email input
+    author, to, subject, email_thread = parse_email(state["email_input"])
+    user_prompt = triage_user_prompt.format(
+        author=author, to=to, subject=subject, email_thread=email_thread
+    )
+
+    # Create email markdown for Agent Inbox in case of notification  
+    email_markdown = format_email_markdown(subject, author, to, email_thread)
+
+    # Use a decision made ahead of time (e.g. by run_batch), otherwise try the pre-triage rules
+    result = config.get("configurable", {}).get("triage_result")
+    if result is None:
+        # Obvious bulk and automated mail is classified from its headers without the LLM
+        result = get_pre_triage().classify(author, subject, state["email_input"].get("headers"))
+    if result is None:
+        # Recurring emails (build reports, digests, ...) reuse the decision made for an earlier near-duplicate
+        result = triage_cache.get(author, subject, email_thread)
+    return (author, subject, email_thread), user_prompt, email_markdown, result
+
+def triage_messages(user_prompt: str) -> list[dict]:
+    """Messages for the router LLM, with the system prompt formatted with background and triage instructions"""
+    return [
+        {"role": "system", "content": triage_prompt()},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def triage_learn(email, result):
+    """Learn from (and cache) a decision of the router LLM for an (author, subject, thread) email"""
+    author, subject, email_thread = email
+    # Learn which senders are always classified the same way
+    get_pre_triage().learn(author, result.classification)
+    triage_cache.put(author, subject, email_thread, result)
+
+def triage_router(state: State, config: RunnableConfig) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
+    """Analyze email content to decide if we should respond, notify, or ignore.
+
+    The triage step prevents the assistant from wasting time on:
+    - Marketing emails and spam
+    - Company-wide announcements
+    - Messages meant for other teams
+    """
+    email, user_prompt, email_markdown, result = triage_lookup(state, config)
+    if result is None:
+        result = router_model().invoke(triage_messages(user_prompt))
+        triage_learn(email, result)
+
+    # Decision
+    return triage_command(result.classification, email_markdown)
+
+async def atriage_router(state: State, config: RunnableConfig) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
+    """Async variant of triage_router"""
+    email, user_prompt, email_markdown, result = triage_lookup(state, config)
+    if result is None:
+        result = await router_model().ainvoke(triage_messages(user_prompt))
+        triage_learn(email, result)
+    return triage_command(result.classification, email_markdown)
+
+def batch_triage_router(email_inputs: list[dict], batch_size: int = DEFAULT_BATCH_SIZE) -> list[Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]]:
+    """Triage many emails at once, sending the triage system prompt once per batch.
+
+    Args:
+        email_inputs: List of email_input dicts, as passed to email_assistant
+        batch_size: Maximum number of emails classified by one router call
+
+    Returns:
+        list[Command]: One routing Command per email, in input order
+    """
+    parsed_emails = [parse_email(email_input) for email_input in email_inputs]
+    results = classify_batch(email_inputs, batch_size, parsed_emails)
+    return [
+        triage_command(result.classification, format_email_markdown(subject, author, to, email_thread))
+        for (author, to, subject, email_thread), result in zip(parsed_emails, results)
+    ]
+
+def classify_batch(email_inputs, batch_size=DEFAULT_BATCH_SIZE, parsed_emails=None):
+    """Classify emails with the pre-triage rules, the triage cache and the batched router; one RouterSchema per email."""
+    # Callers that already parsed the emails (e.g. batch_triage_router) pass them in
+    parsed_emails = parsed_emails or [parse_email(email_input) for email_input in email_inputs]
+
+    # Obvious bulk and automated mail, and near-duplicates of emails seen before, never reach the LLM
+    decided = [
+        get_pre_triage().classify(author, subject, email_input.get("headers")) or triage_cache.get(author, subject, email_thread)
+        for email_input, (author, to, subject, email_thread) in zip(email_inputs, parsed_emails)
+    ]
+    results = batch_triage(parsed_emails, batch_router_model(), router_model(), triage_prompt(), batch_size=batch_size, decided=decided)
+
+    # Learn from (and cache) the LLM's decisions only
+    for (author, to, subject, email_thread), rule_result, result in zip(parsed_emails, decided, results):
+        if rule_result is None:
+            triage_learn((author, subject, email_thread), result)
+    return results
+
+def run_batch(email_inputs: list[dict], batch_size: int = DEFAULT_BATCH_SIZE, config: RunnableConfig | None = None) -> list[dict]:
+    """Triage a burst of emails in batches, then run each through email_assistant.
+
+    Each graph run reuses its precomputed decision, so triage_router does not call the LLM again.
+    Any other settings in config (e.g. callbacks or tags) are passed through to every run.
+    """
+    config = config or {}
+    results = classify_batch(email_inputs, batch_size)
+    return [
+        get_graph("email_assistant").invoke(
+            {"email_input": email_input},
+            config={**config, "configurable": {**config.get("configurable", {}), "triage_result": result}},
+        )
+        for email_input, result in zip(email_inputs, results)
+    ]
+
 def triage_interrupt_handler(state: State) -> Command[Literal["response_agent", "__end__"]]:
     """Handles interrupts from the triage step"""
     
@@ -139,11 +262,14 @@ def triage_interrupt_handler(state: State) -> Command[Literal["response_agent",
         messages.append({"role": "user",
                         "content": f"User wants to reply to the email. Use this feedback to respond: {user_input}"
                         })
+        # Count the user's decision in this sender's history
+        get_pre_triage().learn(author, "respond")
         # Go to response agent
         goto = "response_agent"
 
     # If user ignores email, go to END
     elif response["type"] == "ignore":
+        get_pre_triage().learn(author, "ignore")
         goto = END
 
     # Catch all other responses
@@ -162,87 +288,120 @@ def llm_call(state: State):
 
     return {
         "messages": [
-            llm_with_tools.invoke(
+            agent_model().invoke(
                 [
-                    {"role": "system", "content": agent_system_prompt_hitl.format(
-                        tools_prompt=HITL_TOOLS_PROMPT,
-                        background=default_background,
-                        response_preferences=default_response_preferences, 
-                        cal_preferences=default_cal_preferences
-                    )}
+                    {"role": "system", "content": agent_prompt()}
                 ]
-                + state["messages"]
+                + context_manager.prepare(state["messages"])
             )
         ]
     }
 
-def interrupt_handler(state: State) -> Command[Literal["llm_call", "__end__"]]:
-    """Creates an interrupt for human review of tool calls"""
+async def allm_call(state: State):
+    """Async variant of llm_call"""
+
+    return {
+        "messages": [
+            await agent_model().ainvoke(
+                [
+                    {"role": "system", "content": agent_prompt()}
+                ]
+                + await context_manager.aprepare(state["messages"])
+            )
+        ]
+    }
+
+def interrupt_request(email_input: dict, tool_call: dict) -> dict:
+    """Build the Agent Inbox interrupt request for a tool call that needs human review"""
+
+    # Get original email from email_input
+    author, to, subject, email_thread = parse_email(email_input)
+    original_email_markdown = format_email_markdown(subject, author, to, email_thread)
+    
+    # Format tool call for display and prepend the original email
+    tool_display = format_for_display(tool_call)
+    description = original_email_markdown + tool_display
+
+    # Configure what actions are allowed in Agent Inbox
+    if tool_call["name"] == "write_email":
+        config = {
+            "allow_ignore": True,
+            "allow_respond": True,
+            "allow_edit": True,
+            "allow_accept": True,
+        }
+    elif tool_call["name"] == "schedule_meeting":
+        config = {
+            "allow_ignore": True,
+            "allow_respond": True,
+            "allow_edit": True,
+            "allow_accept": True,
+        }
+    elif tool_call["name"] == "Question":
+        config = {
+            "allow_ignore": True,
+            "allow_respond": True,
+            "allow_edit": False,
+            "allow_accept": False,
+        }
+    else:
+        raise ValueError(f"Invalid tool call: {tool_call['name']}")
+
+    # Create the interrupt request
+    request = {
+        "action_request": {
+            "action": tool_call["name"],
+            "args": tool_call["args"]
+        },
+        "config": config,
+        "description": description,
+    }
+
+    return request
+
+def review_tool_calls(state: State) -> dict:
+    """Ask the user to review the tool calls of the last message that need it, without running any tool.
+
+    Resuming an interrupted node replays it from the start, so every interrupt comes before
+    any tool runs, and no tool runs twice. interrupt_handler and ainterrupt_handler then only
+    differ in how they execute the calls (see review_command).
+
+    Returns:
+        dict: "messages" for the state, with None where a tool message is still to come;
+        "pending" (index, tool_call_id) of those; "unreviewed" calls that run without review;
+        "approved" calls to run as reviewed; and "goto", the next node
+    """
     
     # Store messages
     result = []
+    pending = []
 
     # Go to the LLM call node next
     goto = "llm_call"
 
+    # Allowed tools for HITL
+    hitl_tools = ["write_email", "schedule_meeting", "Question"]
+
+    # Tools that don't need review run without interruption
+    tool_calls = state["messages"][-1].tool_calls
+    unreviewed = [tc for tc in tool_calls if tc["name"] not in hitl_tools]
+    approved = []
+
+    def tool_message_slot(tool_call):
+        # Leave a slot for the tool message of a call that runs once the review is over
+        pending.append((len(result), tool_call["id"]))
+        result.append(None)
+
     # Iterate over the tool calls in the last message
-    for tool_call in state["messages"][-1].tool_calls:
+    for tool_call in tool_calls:
         
-        # Allowed tools for HITL
-        hitl_tools = ["write_email", "schedule_meeting", "Question"]
-        
-        # If tool is not in our HITL list, execute it directly without interruption
+        # If tool is not in our HITL list, it runs without interruption
         if tool_call["name"] not in hitl_tools:
-
-            # Execute search_memory and other tools without interruption
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            result.append({"role": "tool", "content": observation, "tool_call_id": tool_call["id"]})
+            tool_message_slot(tool_call)
             continue
             
-        # Get original email from email_input in state
-        email_input = state["email_input"]
-        author, to, subject, email_thread = parse_email(email_input)
-        original_email_markdown = format_email_markdown(subject, author, to, email_thread)
-        
-        # Format tool call for display and prepend the original email
-        tool_display = format_for_display(tool_call)
-        description = original_email_markdown + tool_display
-
-        # Configure what actions are allowed in Agent Inbox
-        if tool_call["name"] == "write_email":
-            config = {
-                "allow_ignore": True,
-                "allow_respond": True,
-                "allow_edit": True,
-                "allow_accept": True,
-            }
-        elif tool_call["name"] == "schedule_meeting":
-            config = {
-                "allow_ignore": True,
-                "allow_respond": True,
-                "allow_edit": True,
-                "allow_accept": True,
-            }
-        elif tool_call["name"] == "Question":
-            config = {
-                "allow_ignore": True,
-                "allow_respond": True,
-                "allow_edit": False,
-                "allow_accept": False,
-            }
-        else:
-            raise ValueError(f"Invalid tool call: {tool_call['name']}")
-
         # Create the interrupt request
-        request = {
-            "action_request": {
-                "action": tool_call["name"],
-                "args": tool_call["args"]
-            },
-            "config": config,
-            "description": description,
-        }
+        request = interrupt_request(state["email_input"], tool_call)
 
         # Send to Agent Inbox and wait for response
         response = interrupt([request])[0]
@@ -251,15 +410,11 @@ def interrupt_handler(state: State) -> Command[Literal["llm_call", "__end__"]]:
         if response["type"] == "accept":
 
             # Execute the tool with original args
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            result.append({"role": "tool", "content": observation, "tool_call_id": tool_call["id"]})
+            approved.append(tool_call)
+            tool_message_slot(tool_call)
                         
         elif response["type"] == "edit":
 
-            # Tool selection 
-            tool = tools_by_name[tool_call["name"]]
-            
             # Get edited args from Agent Inbox
             edited_args = response["args"]["args"]
 
@@ -277,24 +432,12 @@ def interrupt_handler(state: State) -> Command[Literal["llm_call", "__end__"]]:
             # This ensures state immutability and prevents side effects in other parts of the code
             result.append(ai_message.model_copy(update={"tool_calls": updated_tool_calls}))
 
-            # Update the write_email tool call with the edited content from Agent Inbox
-            if tool_call["name"] == "write_email":
-                
-                # Execute the tool with edited args
-                observation = tool.invoke(edited_args)
-                
-                # Add only the tool response message
-                result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
-            
-            # Update the schedule_meeting tool call with the edited content from Agent Inbox
-            elif tool_call["name"] == "schedule_meeting":
-                
+            # Update the write_email or schedule_meeting tool call with the edited content from Agent Inbox
+            if tool_call["name"] in ("write_email", "schedule_meeting"):
                 
-                # Execute the tool with edited args
-                observation = tool.invoke(edited_args)
-                
-                # Add only the tool response message
-                result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
+                # Execute the tool with edited args, adding only the tool response message
+                approved.append({"name": tool_call["name"], "args": edited_args, "id": current_id})
+                tool_message_slot(tool_call)
             
             # Catch all other tool calls
             else:
@@ -337,13 +480,56 @@ def interrupt_handler(state: State) -> Command[Literal["llm_call", "__end__"]]:
         # Catch all other responses
         else:
             raise ValueError(f"Invalid response: {response}")
-            
+
+    return {
+        "messages": result,
+        "pending": pending,
+        "unreviewed": unreviewed,
+        "approved": approved,
+        "goto": goto,
+    }
+
+def review_command(review: dict, executed: list[dict], observations: list) -> Command[Literal["llm_call", "__end__"]]:
+    """Routing Command of the interrupt handler once the tools of a review ran.
+
+    Args:
+        review: Result of review_tool_calls
+        executed: Tool messages of review["unreviewed"], as returned by run_tool_calls
+        observations: Outputs of the review["approved"] tools, in the same order
+    """
+    tool_messages = {message["tool_call_id"]: message for message in executed}
+    for tool_call, observation in zip(review["approved"], observations):
+        tool_messages[tool_call["id"]] = {"role": "tool", "content": observation, "tool_call_id": tool_call["id"]}
+
+    # Fill in the tool messages in the order of the tool calls
+    result = list(review["messages"])
+    for index, tool_call_id in review["pending"]:
+        result[index] = tool_messages[tool_call_id]
+
     # Update the state 
     update = {
         "messages": result,
     }
 
-    return Command(goto=goto, update=update)
+    return Command(goto=review["goto"], update=update)
+
+def interrupt_handler(state: State) -> Command[Literal["llm_call", "__end__"]]:
+    """Creates an interrupt for human review of tool calls"""
+    review = review_tool_calls(state)
+    tools_by_name = load_tools_by_name()
+
+    # Tools that don't need review run concurrently, the reviewed ones one at a time
+    executed = run_tool_calls(review["unreviewed"], tools_by_name)
+    observations = [invoke_tool(tools_by_name[tool_call["name"]], tool_call["args"]) for tool_call in review["approved"]]
+    return review_command(review, executed, observations)
+
+async def ainterrupt_handler(state: State) -> Command[Literal["llm_call", "__end__"]]:
+    """Async variant of interrupt_handler"""
+    review = review_tool_calls(state)
+    tools_by_name = load_tools_by_name()
+    executed = await arun_tool_calls(review["unreviewed"], tools_by_name)
+    observations = [await ainvoke_tool(tools_by_name[tool_call["name"]], tool_call["args"]) for tool_call in review["approved"]]
+    return review_command(review, executed, observations)
 
 # Conditional edge function
 def should_continue(state: State) -> Literal["interrupt_handler", "__end__"]:
@@ -358,34 +544,94 @@ def should_continue(state: State) -> Literal["interrupt_handler", "__end__"]:
                 return "interrupt_handler"
 
 # Build workflow
-agent_builder = StateGraph(State)
-
-# Add nodes
-agent_builder.add_node("llm_call", llm_call)
-agent_builder.add_node("interrupt_handler", interrupt_handler)
-
-# Add edges
-agent_builder.add_edge(START, "llm_call")
-agent_builder.add_conditional_edges(
-    "llm_call",
-    should_continue,
-    {
-        "interrupt_handler": "interrupt_handler",
-        END: END,
-    },
-)
-
-# Compile the agent
-response_agent = agent_builder.compile()
+def build_response_agent(llm_call, interrupt_handler):
+    """Build the response agent from sync or async node functions"""
+    agent_builder = StateGraph(State)
+
+    # Add nodes
+    agent_builder.add_node("llm_call", instrument_node("llm_call", llm_call))
+    agent_builder.add_node("interrupt_handler", instrument_node("interrupt_handler", interrupt_handler))
+
+    # Add edges
+    agent_builder.add_edge(START, "llm_call")
+    agent_builder.add_conditional_edges(
+        "llm_call",
+        should_continue,
+        {
+            "interrupt_handler": "interrupt_handler",
+            END: END,
+        },
+    )
 
-# Build overall workflow
-overall_workflow = (
-    StateGraph(State, input=StateInput)
-    .add_node(triage_router)
-    .add_node(triage_interrupt_handler)
-    .add_node("response_agent", response_agent)
-    .add_edge(START, "triage_router")
-    
-)
+    # Compile the agent
+    return agent_builder.compile()
 
-email_assistant = overall_workflow.compile()
\ No newline at end of file
+# Build overall workflow
+def build_email_assistant(triage_router, triage_interrupt_handler, response_agent, checkpointer=None, store=None):
+    """Build the overall workflow from triage nodes and a compiled response agent, optionally with a checkpointer and store"""
+    overall_workflow = (
+        StateGraph(State, input=StateInput)
+        .add_node("triage_router", instrument_node("triage_router", triage_router))
+        .add_node("triage_interrupt_handler", instrument_node("triage_interrupt_handler", triage_interrupt_handler))
+        .add_node("response_agent", response_agent)
+        .add_edge(START, "triage_router")
+    )
+    return overall_workflow.compile(checkpointer=checkpointer, store=store)
+
+# Compiled graphs by name, built on first use
+GRAPHS = {
+    "response_agent": lambda: build_response_agent(llm_call, interrupt_handler),
+    "async_response_agent": lambda: build_response_agent(allm_call, ainterrupt_handler),
+    "email_assistant": lambda: build_email_assistant(triage_router, triage_interrupt_handler, get_graph("response_agent")),
+    # Async graph: run it with ainvoke, or many emails at once with async_runner.run_emails.
+    # triage_interrupt_handler does no I/O, so the sync node is shared.
+    "async_email_assistant": lambda: build_email_assistant(atriage_router, triage_interrupt_handler, get_graph("async_response_agent")),
+}
+
+@cache
+def get_graph(name: str):
+    """Compiled graph by name (a key of GRAPHS), built once on first use"""
+    return GRAPHS[name]()
+
+# Module attributes built on first access, so e.g. `from email_assistant.email_assistant_hitl import email_assistant` still works
+LAZY_ATTRIBUTES = {
+    "tools": load_tools,
+    "tools_by_name": load_tools_by_name,
+    "llm_router": router_model,
+    "llm_batch_router": batch_router_model,
+    "llm_with_tools": agent_model,
+}
+
+def __getattr__(name):
+    if name in GRAPHS:
+        return get_graph(name)
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """Build the tools, models and compiled graphs now (e.g. when a worker starts) instead of on the first email"""
+    load_tools_by_name()
+    # router_model() is the tiered router; build the models of both of its tiers
+    router_model().warm_up()
+    batch_router_model()
+    agent_model()
+    # Reads the learned sender statistics
+    get_pre_triage()
+    for name in GRAPHS:
+        get_graph(name)
+
+def durable_email_assistants(path: str = DEFAULT_DB_PATH):
+    """Compile the sync and async graphs with the SQLite checkpointer and store.
+
+    Interrupted threads wait for review in SQLite instead of memory, so they survive a
+    restart; resume them with Command(resume=...) on the same thread_id.
+
+    Returns:
+        tuple: (email_assistant, async_email_assistant) sharing one database
+    """
+    checkpointer, store = get_persistence(path)
+    return (
+        build_email_assistant(triage_router, triage_interrupt_handler, get_graph("response_agent"), checkpointer=checkpointer, store=store),
+        build_email_assistant(atriage_router, triage_interrupt_handler, get_graph("async_response_agent"), checkpointer=checkpointer, store=store),
+    )
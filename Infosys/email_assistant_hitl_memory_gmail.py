@@ -1,135 +1,205 @@
+from functools import cache
 from typing import Literal
 
-from langchain.chat_models import init_chat_model
-
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, START, END
 from langgraph.store.base import BaseStore
 from langgraph.types import interrupt, Command
 
 from email_assistant.tools import get_tools, get_tools_by_name
 from email_assistant.tools.gmail.prompt_templates import GMAIL_TOOLS_PROMPT
-from email_assistant.tools.gmail.gmail_tools import mark_as_read
-from email_assistant.prompts import triage_system_prompt, triage_user_prompt, agent_system_prompt_hitl_memory, default_triage_instructions, default_background, default_response_preferences, default_cal_preferences, MEMORY_UPDATE_INSTRUCTIONS, MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT
-from email_assistant.schemas import State, RouterSchema, StateInput, UserPreferences
+from email_assistant.prompts import triage_system_prompt, triage_user_prompt, agent_system_prompt_hitl_memory, default_triage_instructions, default_background, default_response_preferences, default_cal_preferences, MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT
+from email_assistant.schemas import State, StateInput
 from email_assistant.utils import parse_gmail, format_for_display, format_gmail_markdown
-from dotenv import load_dotenv
-
-load_dotenv(".env")
-
-# Get tools with Gmail tools
-tools = get_tools(["send_email_tool", "schedule_meeting_tool", "check_calendar_tool", "Question", "Done"], include_gmail=True)
-tools_by_name = get_tools_by_name(tools)
-
-# Initialize the LLM for use with router / structured output
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_router = llm.with_structured_output(RouterSchema) 
-
-# Initialize the LLM, enforcing tool use (of any available tools) for agent
-llm = init_chat_model("openai:gpt-4.1", temperature=0.0)
-llm_with_tools = llm.bind_tools(tools, tool_choice="required")
+from email_assistant.batch_triage import BatchRouterSchema, batch_triage, DEFAULT_BATCH_SIZE
+from email_assistant.tool_executor import run_tool_calls, arun_tool_calls, invoke_tool, ainvoke_tool
+from email_assistant.prompt_cache import prompt_cache
+from email_assistant.tiered_triage import tiered_router
+from email_assistant.model_registry import get_structured_model, get_tool_model, load_environment
+from email_assistant.context import context_manager
+from email_assistant.telemetry import get_logger, instrument_node, instrumented
+from email_assistant.pre_triage import get_pre_triage
+from email_assistant.tenants import current_tenant
+from email_assistant.thread_coalescer import SUPERSEDED_KEY
+from email_assistant.episodic_memory import remember_episode, search_memory
+from email_assistant.prompts import SEARCH_MEMORY_TOOL_PROMPT
+from email_assistant.sqlite_persistence import DEFAULT_DB_PATH, get_persistence
+from email_assistant.gmail_pool import get_label_batcher
+from email_assistant.memory_worker import get_memory_queue
+from email_assistant.preference_rules import render_rules, revision, rulebook
+
+logger = get_logger(__name__)
+
+# Tools and models are built on first use rather than at import, so importing this module stays
+# cheap for CLI runs, test collection and autoscaled workers; warm_up() builds everything up front
+@cache
+def load_tools():
+    """Tools of this assistant, loaded once on first use"""
+    load_environment()
+    # search_memory looks up past replies to similar emails (episodic memory); it runs without review
+    return get_tools(["send_email_tool", "schedule_meeting_tool", "check_calendar_tool", "Question", "Done"], include_gmail=True) + [search_memory]
+
+@cache
+def load_tools_by_name():
+    """Tools of this assistant by name"""
+    return get_tools_by_name(load_tools())
+
+# LLM for use with router / structured output: a fast model first, escalating to the
+# large one only when unsure (models built once per process by the model registry)
+def router_model():
+    return tiered_router
+
+def batch_router_model():
+    return get_structured_model("router", BatchRouterSchema)
+
+# LLM, enforcing tool use (of any available tools) for agent
+def agent_model():
+    return get_tool_model("agent", load_tools(), tool_choice="required")
+
+def get_memory(store, namespace, default_content=None, email_inputs=()):
+    """Get the preference rules of a namespace that apply to the emails at hand.
 
-def get_memory(store, namespace, default_content=None):
-    """Get memory from the store or initialize with default if it doesn't exist.
-    
     Args:
         store: LangGraph BaseStore instance to search for existing memory
         namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
-        default_content: Default content to use if memory doesn't exist
-        
+        default_content: Default preferences to start the rules from if memory doesn't exist
+        email_inputs: Emails the prompt is for; rules with keywords are included only if they match one
+
     Returns:
-        str: The content of the memory profile, either from existing memory or the default
+        str: The relevant rules as a bulleted list
     """
-    # Search for existing memory with namespace and key
-    user_preferences = store.get(namespace, "user_preferences")
-    
-    # If memory exists, return its content (the value)
-    if user_preferences:
-        return user_preferences.value
-    
-    # If memory doesn't exist, add it to the store and return the default content
-    else:
-        # Namespace, key, value
-        store.put(namespace, "user_preferences", default_content)
-        user_preferences = default_content
-    
-    # Return the default content
-    return user_preferences 
+    # Rules are created from the old free-text profile, or default_content, on first use
+    document = rulebook.load(store, namespace, default_content)
+    return render_rules(rulebook.select(store, namespace, document, email_inputs))
 
+@instrumented("update_memory")
 def update_memory(store, namespace, messages):
-    """Update memory profile in the store.
-    
+    """Update the preference rules in the store from user feedback.
+
+    The memory updater sees only the rules related to the feedback and returns add, modify
+    and delete operations, which are applied to the stored rules.
+
     Args:
         store: LangGraph BaseStore instance to update memory
         namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
         messages: List of messages to update the memory with
     """
+    # Bumps the namespace in prompt_cache when any rule changed
+    rulebook.update(store, namespace, messages)
 
-    # Get the existing memory
-    user_preferences = store.get(namespace, "user_preferences")
-    # Update the memory
-    llm = init_chat_model("openai:gpt-4.1", temperature=0.0).with_structured_output(UserPreferences)
-    result = llm.invoke(
-        [
-            {"role": "system", "content": MEMORY_UPDATE_INSTRUCTIONS.format(current_profile=user_preferences.value, namespace=namespace)},
-        ] + messages
-    )
-    # Save the updated memory to the store
-    store.put(namespace, "user_preferences", result.user_preferences)
+async def aget_memory(store, namespace, default_content=None, email_inputs=()):
+    """Async variant of get_memory, using the store's async API."""
+    document = await rulebook.aload(store, namespace, default_content)
+    return render_rules(rulebook.select(store, namespace, document, email_inputs))
 
-# Nodes 
-def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
-    """Analyze email content to decide if we should respond, notify, or ignore.
+@instrumented("update_memory")
+async def aupdate_memory(store, namespace, messages):
+    """Async variant of update_memory, using ainvoke and the store's async API."""
+    await rulebook.aupdate(store, namespace, messages)
 
-    The triage step prevents the assistant from wasting time on:
-    - Marketing emails and spam
-    - Company-wide announcements
-    - Messages meant for other teams
-    """
-    
-    # Parse the email input
-    author, to, subject, email_thread, email_id = parse_gmail(state["email_input"])
-    user_prompt = triage_user_prompt.format(
-        author=author, to=to, subject=subject, email_thread=email_thread
-    )
+def enqueue_memory_update(store, namespace, messages):
+    """Record feedback for a memory namespace without waiting for the reflection LLM.
 
-    # Create email markdown for Agent Inbox in case of notification  
-    email_markdown = format_gmail_markdown(subject, author, to, email_thread, email_id)
+    The background queue coalesces bursts of feedback for the same namespace into one
+    update_memory call and journals pending events so they survive a crash.
 
+    Args:
+        store: LangGraph BaseStore instance to update memory
+        namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
+        messages: List of messages to update the memory with
+    """
+    get_memory_queue(store, update_memory).enqueue(namespace, messages)
+
+# Prompts: built from the preference rules relevant to the email(s) at hand, and cached per
+# selection of rules until update_memory changes a namespace they read
+# Namespaces and defaults come from the run's tenant (see tenants.py); without one, the single-user ones
+def format_triage_prompt(store, tenant, triage_instructions):
+    """Triage system prompt for the given triage_preferences rules, cached until their namespace changes"""
+    def build():
+        return triage_system_prompt.format(
+            background=tenant.preference("background", default_background),
+            triage_instructions=triage_instructions,
+        )
+    return prompt_cache.get(("triage_system_prompt", triage_instructions), build, store, [tenant.namespace("triage_preferences")])
+
+def triage_prompt(store, tenant=None, email_inputs=()):
+    """Triage system prompt built from the triage_preferences rules that apply to the emails"""
+    tenant = tenant or current_tenant()
     # Search for existing triage_preferences memory
-    triage_instructions = get_memory(store, ("email_assistant", "triage_preferences"), default_triage_instructions)
+    triage_instructions = get_memory(store, tenant.namespace("triage_preferences"), tenant.preference("triage_preferences", default_triage_instructions), email_inputs)
+    return format_triage_prompt(store, tenant, triage_instructions)
 
-    # Format system prompt with background and triage instructions
-    system_prompt = triage_system_prompt.format(
-        background=default_background,
-        triage_instructions=triage_instructions,
-    )
+def triage_revision(store, tenant):
+    """Revision of the tenant's stored triage_preferences rules, which cached triage decisions are checked against.
 
-    # Run the router LLM
-    result = llm_router.invoke(
-        [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-    )
+    Rules are re-read at most every few seconds (see RuleBook), so an update made by another
+    process also invalidates the decisions this process cached.
+    """
+    return revision(rulebook.load(store, tenant.namespace("triage_preferences"), tenant.preference("triage_preferences", default_triage_instructions)))
 
-    # Decision
-    classification = result.classification
+async def atriage_revision(store, tenant):
+    """Async variant of triage_revision"""
+    return revision(await rulebook.aload(store, tenant.namespace("triage_preferences"), tenant.preference("triage_preferences", default_triage_instructions)))
+
+async def atriage_prompt(store, tenant=None, email_inputs=()):
+    """Async variant of triage_prompt"""
+    tenant = tenant or current_tenant()
+    triage_instructions = await aget_memory(store, tenant.namespace("triage_preferences"), tenant.preference("triage_preferences", default_triage_instructions), email_inputs)
+    return format_triage_prompt(store, tenant, triage_instructions)
+
+def format_agent_prompt(store, tenant, cal_preferences, response_preferences):
+    """Response agent system prompt for the given preference rules, cached until their namespaces change.
+
+    The tools prompt and background come first and the preferences last, so the stable
+    prefix stays byte-identical across emails for provider-side prompt caching.
+    """
+    def build():
+        return agent_system_prompt_hitl_memory.format(
+            tools_prompt=GMAIL_TOOLS_PROMPT + SEARCH_MEMORY_TOOL_PROMPT,
+            background=tenant.preference("background", default_background),
+            response_preferences=response_preferences, 
+            cal_preferences=cal_preferences
+        )
+    return prompt_cache.get(("agent_system_prompt_hitl_memory", cal_preferences, response_preferences), build, store, [tenant.namespace("cal_preferences"), tenant.namespace("response_preferences")])
+
+def agent_prompt(store, email_input=None):
+    """Response agent system prompt built from the cal_preferences and response_preferences rules that apply to the email"""
+    tenant = current_tenant()
+    email_inputs = [email_input] if email_input else []
+    # Search for existing cal_preferences memory
+    cal_preferences = get_memory(store, tenant.namespace("cal_preferences"), tenant.preference("cal_preferences", default_cal_preferences), email_inputs)
+
+    # Search for existing response_preferences memory
+    response_preferences = get_memory(store, tenant.namespace("response_preferences"), tenant.preference("response_preferences", default_response_preferences), email_inputs)
+    return format_agent_prompt(store, tenant, cal_preferences, response_preferences)
+
+async def aagent_prompt(store, email_input=None):
+    """Async variant of agent_prompt"""
+    tenant = current_tenant()
+    email_inputs = [email_input] if email_input else []
+    cal_preferences = await aget_memory(store, tenant.namespace("cal_preferences"), tenant.preference("cal_preferences", default_cal_preferences), email_inputs)
+    response_preferences = await aget_memory(store, tenant.namespace("response_preferences"), tenant.preference("response_preferences", default_response_preferences), email_inputs)
+    return format_agent_prompt(store, tenant, cal_preferences, response_preferences)
+
+# Nodes 
+def triage_command(classification: str, email_markdown: str) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
+    """Turn a triage classification into the routing Command for the graph."""
 
     # Process the classification decision
     if classification == "respond":
-        print("📧 Classification: RESPOND - This email requires a response")
+        logger.info("📧 Classification: RESPOND - This email requires a response", classification=classification)
         # Next node
         goto = "response_agent"
         # Update the state
         update = {
-            "classification_decision": result.classification,
+            "classification_decision": classification,
             "messages": [{"role": "user",
                             "content": f"Respond to the email: {email_markdown}"
                         }],
         }
         
     elif classification == "ignore":
-        print("🚫 Classification: IGNORE - This email can be safely ignored")
+        logger.info("🚫 Classification: IGNORE - This email can be safely ignored", classification=classification)
 
         # Next node
         goto = END
@@ -139,7 +209,7 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
         }
 
     elif classification == "notify":
-        print("🔔 Classification: NOTIFY - This email contains important information") 
+        logger.info("🔔 Classification: NOTIFY - This email contains important information", classification=classification) 
 
         # Next node
         goto = "triage_interrupt_handler"
@@ -153,6 +223,140 @@ def triage_router(state: State, store: BaseStore) -> Command[Literal["triage_int
     
     return Command(goto=goto, update=update)
 
+def triage_lookup(state: State, config: RunnableConfig, rules_revision: int):
+    """Parse the email for triage and look for a decision that needs no router LLM call.
+
+    Shared by triage_router and atriage_router, which only differ in how they call the router
+    and read the revision of the triage rules (see triage_revision).
+
+    Returns:
+        tuple: (author, subject and thread of the email, user prompt, email markdown, decision or None)
+    """
+    # Parse the email input
+    author, to, subject, email_thread, email_id = parse_gmail(state["email_input"])
+    user_prompt = triage_user_prompt.format(
+        author=author, to=to, subject=subject, email_thread=email_thread
+    )
+
+    # Create email markdown for Agent Inbox in case of notification  
+    email_markdown = format_gmail_markdown(subject, author, to, email_thread, email_id)
+
+    # Use a decision made ahead of time (e.g. by run_batch), otherwise try the pre-triage rules
+    tenant = current_tenant(config)
+    result = config.get("configurable", {}).get("triage_result")
+    if result is None:
+        # Obvious bulk and automated mail is classified from its headers without the LLM
+        result = tenant.pre_triage.classify(author, subject, state["email_input"].get("headers"))
+    if result is None:
+        # Recurring emails (build reports, digests, ...) reuse the decision made for an earlier near-duplicate
+        result = tenant.triage_cache.get(author, subject, email_thread, rules_revision)
+    return (author, subject, email_thread), user_prompt, email_markdown, result
+
+def triage_messages(system_prompt: str, user_prompt: str) -> list[dict]:
+    """Messages for the router LLM"""
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def triage_learn(email, result, rules_revision: int, tenant):
+    """Learn from (and cache) a decision of the router LLM for an (author, subject, thread) email"""
+    author, subject, email_thread = email
+    # Learn which senders are always classified the same way
+    tenant.pre_triage.learn(author, result.classification)
+    tenant.triage_cache.put(author, subject, email_thread, result, rules_revision)
+
+def triage_router(state: State, config: RunnableConfig, store: BaseStore) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
+    """Analyze email content to decide if we should respond, notify, or ignore.
+
+    The triage step prevents the assistant from wasting time on:
+    - Marketing emails and spam
+    - Company-wide announcements
+    - Messages meant for other teams
+    """
+    tenant = current_tenant(config)
+    rules_revision = triage_revision(store, tenant)
+    email, user_prompt, email_markdown, result = triage_lookup(state, config, rules_revision)
+    if result is None:
+        # Format system prompt with background and triage_preferences memory
+        system_prompt = triage_prompt(store, tenant, [state["email_input"]])
+
+        # Run the router LLM
+        result = router_model().invoke(triage_messages(system_prompt, user_prompt), namespace=tenant.namespace("triage_preferences"))
+        triage_learn(email, result, rules_revision, tenant)
+
+    # Decision
+    return triage_command(result.classification, email_markdown)
+
+async def atriage_router(state: State, config: RunnableConfig, store: BaseStore) -> Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]:
+    """Async variant of triage_router"""
+    tenant = current_tenant(config)
+    rules_revision = await atriage_revision(store, tenant)
+    email, user_prompt, email_markdown, result = triage_lookup(state, config, rules_revision)
+    if result is None:
+        system_prompt = await atriage_prompt(store, tenant, [state["email_input"]])
+        result = await router_model().ainvoke(triage_messages(system_prompt, user_prompt), namespace=tenant.namespace("triage_preferences"))
+        triage_learn(email, result, rules_revision, tenant)
+    return triage_command(result.classification, email_markdown)
+
+def batch_triage_router(email_inputs: list[dict], store: BaseStore, batch_size: int = DEFAULT_BATCH_SIZE, config: RunnableConfig | None = None) -> list[Command[Literal["triage_interrupt_handler", "response_agent", "__end__"]]]:
+    """Triage many emails at once, sending the triage system prompt once per batch.
+
+    Args:
+        email_inputs: List of Gmail email_input dicts, as passed to email_assistant
+        store: LangGraph BaseStore instance holding the triage_preferences memory
+        batch_size: Maximum number of emails classified by one router call
+        config: Run config; its tenant_id selects the tenant's memory and caches
+
+    Returns:
+        list[Command]: One routing Command per email, in input order
+    """
+    parsed_emails = [parse_gmail(email_input) for email_input in email_inputs]
+    results = classify_batch(email_inputs, store, batch_size, config, [parsed[:4] for parsed in parsed_emails])
+    return [
+        triage_command(result.classification, format_gmail_markdown(subject, author, to, email_thread, email_id))
+        for (author, to, subject, email_thread, email_id), result in zip(parsed_emails, results)
+    ]
+
+def classify_batch(email_inputs, store, batch_size=DEFAULT_BATCH_SIZE, config=None, parsed_emails=None):
+    """Classify Gmail emails with the pre-triage rules, the triage cache and the batched router; one RouterSchema per email."""
+    tenant = current_tenant(config)
+    # Callers that already parsed the emails (e.g. batch_triage_router) pass in their first four fields
+    parsed_emails = parsed_emails or [parse_gmail(email_input)[:4] for email_input in email_inputs]
+
+    # Obvious bulk and automated mail, and near-duplicates of emails seen before, never reach the LLM
+    rules_revision = triage_revision(store, tenant)
+    decided = [
+        tenant.pre_triage.classify(author, subject, email_input.get("headers")) or tenant.triage_cache.get(author, subject, email_thread, rules_revision)
+        for email_input, (author, to, subject, email_thread) in zip(email_inputs, parsed_emails)
+    ]
+
+    # Triage preferences are read once for the whole burst, with the rules relevant to any of its emails
+    system_prompt = triage_prompt(store, tenant, email_inputs)
+    results = batch_triage(parsed_emails, batch_router_model(), router_model(), system_prompt, batch_size=batch_size, decided=decided)
+
+    # Learn from (and cache) the LLM's decisions only
+    for (author, to, subject, email_thread), rule_result, result in zip(parsed_emails, decided, results):
+        if rule_result is None:
+            triage_learn((author, subject, email_thread), result, rules_revision, tenant)
+    return results
+
+def run_batch(email_inputs: list[dict], store: BaseStore, batch_size: int = DEFAULT_BATCH_SIZE, config: RunnableConfig | None = None) -> list[dict]:
+    """Triage a burst of emails in batches, then run each through email_assistant.
+
+    Each graph run reuses its precomputed decision, so triage_router does not call the LLM again.
+    Any other settings in config (e.g. callbacks or tags) are passed through to every run.
+    """
+    config = config or {}
+    results = classify_batch(email_inputs, store, batch_size, config)
+    return [
+        get_graph("email_assistant").invoke(
+            {"email_input": email_input},
+            config={**config, "configurable": {**config.get("configurable", {}), "triage_result": result}},
+        )
+        for email_input, result in zip(email_inputs, results)
+    ]
+
 def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal["response_agent", "__end__"]]:
     """Handles interrupts from the triage step"""
     
@@ -194,11 +398,13 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
                         "content": f"User wants to reply to the email. Use this feedback to respond: {user_input}"
                         })
         # Update memory with feedback
-        update_memory(store, ("email_assistant", "triage_preferences"), [{
+        enqueue_memory_update(store, current_tenant().namespace("triage_preferences"), [{
             "role": "user",
             "content": f"The user decided to respond to the email, so update the triage preferences to capture this."
         }] + messages)
 
+        # Count the user's decision in this sender's history
+        current_tenant().pre_triage.learn(author, "respond")
         goto = "response_agent"
 
     # If user ignores email, go to END
@@ -208,7 +414,8 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
                         "content": f"The user decided to ignore the email even though it was classified as notify. Update triage preferences to capture this."
                         })
         # Update memory with feedback 
-        update_memory(store, ("email_assistant", "triage_preferences"), messages)
+        enqueue_memory_update(store, current_tenant().namespace("triage_preferences"), messages)
+        current_tenant().pre_triage.learn(author, "ignore")
         goto = END
 
     # Catch all other responses
@@ -222,98 +429,133 @@ def triage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal[
 
     return Command(goto=goto, update=update)
 
+async def atriage_interrupt_handler(state: State, store: BaseStore) -> Command[Literal["response_agent", "__end__"]]:
+    """Async variant of triage_interrupt_handler; it makes no model, tool or store call to await"""
+    return triage_interrupt_handler(state, store)
+
 def llm_call(state: State, store: BaseStore):
     """LLM decides whether to call a tool or not"""
+
+    return {
+        "messages": [
+            agent_model().invoke(
+                [
+                    {"role": "system", "content": agent_prompt(store, state["email_input"])}
+                ]
+                + context_manager.prepare(state["messages"])
+            )
+        ]
+    }
     
-    # Search for existing cal_preferences memory
-    cal_preferences = get_memory(store, ("email_assistant", "cal_preferences"), default_cal_preferences)
-    
-    # Search for existing response_preferences memory
-    response_preferences = get_memory(store, ("email_assistant", "response_preferences"), default_response_preferences)
+
+async def allm_call(state: State, store: BaseStore):
+    """Async variant of llm_call"""
 
     return {
         "messages": [
-            llm_with_tools.invoke(
+            await agent_model().ainvoke(
                 [
-                    {"role": "system", "content": agent_system_prompt_hitl_memory.format(
-                        tools_prompt=GMAIL_TOOLS_PROMPT,
-                        background=default_background,
-                        response_preferences=response_preferences, 
-                        cal_preferences=cal_preferences
-                    )}
+                    {"role": "system", "content": await aagent_prompt(store, state["email_input"])}
                 ]
-                + state["messages"]
+                + await context_manager.aprepare(state["messages"])
             )
         ]
     }
     
-def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_call", "__end__"]]:
-    """Creates an interrupt for human review of tool calls"""
+def interrupt_request(email_input: dict, tool_call: dict) -> dict:
+    """Build the Agent Inbox interrupt request for a tool call that needs human review"""
+
+    # Get original email from email_input
+    author, to, subject, email_thread, email_id = parse_gmail(email_input)
+    original_email_markdown = format_gmail_markdown(subject, author, to, email_thread, email_id)
+    
+    # Format tool call for display and prepend the original email
+    tool_display = format_for_display(tool_call)
+    description = original_email_markdown + tool_display
+
+    # Configure what actions are allowed in Agent Inbox
+    if tool_call["name"] == "send_email_tool":
+        config = {
+            "allow_ignore": True,
+            "allow_respond": True,
+            "allow_edit": True,
+            "allow_accept": True,
+        }
+    elif tool_call["name"] == "schedule_meeting_tool":
+        config = {
+            "allow_ignore": True,
+            "allow_respond": True,
+            "allow_edit": True,
+            "allow_accept": True,
+        }
+    elif tool_call["name"] == "Question":
+        config = {
+            "allow_ignore": True,
+            "allow_respond": True,
+            "allow_edit": False,
+            "allow_accept": False,
+        }
+    else:
+        raise ValueError(f"Invalid tool call: {tool_call['name']}")
+
+    # Create the interrupt request
+    request = {
+        "action_request": {
+            "action": tool_call["name"],
+            "args": tool_call["args"]
+        },
+        "config": config,
+        "description": description,
+    }
+
+    return request
+
+def review_tool_calls(state: State) -> dict:
+    """Ask the user to review the tool calls of the last message that need it, without running any tool.
+
+    Resuming an interrupted node replays it from the start, so every interrupt comes before
+    any tool runs or any feedback is saved, and nothing is done twice. interrupt_handler and
+    ainterrupt_handler then only differ in how they execute the calls (see review_command).
+
+    Returns:
+        dict: "messages" for the state, with None where a tool message is still to come;
+        "pending" (index, tool_call_id) of those; "unreviewed" calls that run without review;
+        "approved" calls to run as reviewed; "feedback" for memory as (namespace, number of
+        leading messages it includes or None for the note alone, note); "needs_context" if any
+        feedback includes the conversation; and "goto", the next node
+    """
     
     # Store messages
     result = []
+    pending = []
+    feedback = []
 
     # Go to the LLM call node next
     goto = "llm_call"
 
+    # Allowed tools for HITL
+    hitl_tools = ["send_email_tool", "schedule_meeting_tool", "Question"]
+
+    # search_memory and other tools that don't need review run without interruption
+    tool_calls = state["messages"][-1].tool_calls
+    unreviewed = [tc for tc in tool_calls if tc["name"] not in hitl_tools]
+    approved = []
+
+    def tool_message_slot(tool_call):
+        # Leave a slot for the tool message of a call that runs once the review is over
+        pending.append((len(result), tool_call["id"]))
+        result.append(None)
+
     # Iterate over the tool calls in the last message
-    for tool_call in state["messages"][-1].tool_calls:
+    for tool_call in tool_calls:
         
-        # Allowed tools for HITL
-        hitl_tools = ["send_email_tool", "schedule_meeting_tool", "Question"]
-        
-        # If tool is not in our HITL list, execute it directly without interruption
+        # If tool is not in our HITL list, it runs without interruption
         if tool_call["name"] not in hitl_tools:
-
-            # Execute search_memory and other tools without interruption
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            result.append({"role": "tool", "content": observation, "tool_call_id": tool_call["id"]})
+            tool_message_slot(tool_call)
             continue
             
-        # Get original email from email_input in state
-        email_input = state["email_input"]
-        author, to, subject, email_thread, email_id = parse_gmail(email_input)
-        original_email_markdown = format_gmail_markdown(subject, author, to, email_thread, email_id)
-        
-        # Format tool call for display and prepend the original email
-        tool_display = format_for_display(tool_call)
-        description = original_email_markdown + tool_display
-
-        # Configure what actions are allowed in Agent Inbox
-        if tool_call["name"] == "send_email_tool":
-            config = {
-                "allow_ignore": True,
-                "allow_respond": True,
-                "allow_edit": True,
-                "allow_accept": True,
-            }
-        elif tool_call["name"] == "schedule_meeting_tool":
-            config = {
-                "allow_ignore": True,
-                "allow_respond": True,
-                "allow_edit": True,
-                "allow_accept": True,
-            }
-        elif tool_call["name"] == "Question":
-            config = {
-                "allow_ignore": True,
-                "allow_respond": True,
-                "allow_edit": False,
-                "allow_accept": False,
-            }
-        else:
-            raise ValueError(f"Invalid tool call: {tool_call['name']}")
-
         # Create the interrupt request
-        request = {
-            "action_request": {
-                "action": tool_call["name"],
-                "args": tool_call["args"]
-            },
-            "config": config,
-            "description": description,
-        }
+        request = interrupt_request(state["email_input"], tool_call)
 
         # Send to Agent Inbox and wait for response
         response = interrupt([request])[0]
@@ -322,14 +564,11 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
         if response["type"] == "accept":
 
             # Execute the tool with original args
-            tool = tools_by_name[tool_call["name"]]
-            observation = tool.invoke(tool_call["args"])
-            result.append({"role": "tool", "content": observation, "tool_call_id": tool_call["id"]})
+            approved.append(tool_call)
+            tool_message_slot(tool_call)
                         
         elif response["type"] == "edit":
 
-            # Tool selection 
-            tool = tools_by_name[tool_call["name"]]
             initial_tool_call = tool_call["args"]
             
             # Get edited args from Agent Inbox
@@ -352,32 +591,28 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
             # Save feedback in memory and update the write_email tool call with the edited content from Agent Inbox
             if tool_call["name"] == "send_email_tool":
                 
-                # Execute the tool with edited args
-                observation = tool.invoke(edited_args)
-                
-                # Add only the tool response message
-                result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
+                # Execute the tool with edited args, adding only the tool response message
+                approved.append({"name": tool_call["name"], "args": edited_args, "id": current_id})
+                tool_message_slot(tool_call)
 
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "response_preferences"), [{
+                feedback.append((current_tenant().namespace("response_preferences"), None, {
                     "role": "user",
                     "content": f"User edited the email response. Here is the initial email generated by the assistant: {initial_tool_call}. Here is the edited email: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
             
             # Save feedback in memory and update the schedule_meeting tool call with the edited content from Agent Inbox
             elif tool_call["name"] == "schedule_meeting_tool":
                 
-                # Execute the tool with edited args
-                observation = tool.invoke(edited_args)
-                
-                # Add only the tool response message
-                result.append({"role": "tool", "content": observation, "tool_call_id": current_id})
+                # Execute the tool with edited args, adding only the tool response message
+                approved.append({"name": tool_call["name"], "args": edited_args, "id": current_id})
+                tool_message_slot(tool_call)
 
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "cal_preferences"), [{
+                feedback.append((current_tenant().namespace("cal_preferences"), None, {
                     "role": "user",
                     "content": f"User edited the calendar invitation. Here is the initial calendar invitation generated by the assistant: {initial_tool_call}. Here is the edited calendar invitation: {edited_args}. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
             
             # Catch all other tool calls
             else:
@@ -391,10 +626,10 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                 # Go to END
                 goto = END
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "triage_preferences"), state["messages"] + result + [{
+                feedback.append((current_tenant().namespace("triage_preferences"), len(result), {
                     "role": "user",
                     "content": f"The user ignored the email draft. That means they did not want to respond to the email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
 
             elif tool_call["name"] == "schedule_meeting_tool":
                 # Don't execute the tool, and tell the agent how to proceed
@@ -402,10 +637,10 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                 # Go to END
                 goto = END
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "triage_preferences"), state["messages"] + result + [{
+                feedback.append((current_tenant().namespace("triage_preferences"), len(result), {
                     "role": "user",
                     "content": f"The user ignored the calendar meeting draft. That means they did not want to schedule a meeting for this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
 
             elif tool_call["name"] == "Question":
                 # Don't execute the tool, and tell the agent how to proceed
@@ -413,10 +648,10 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                 # Go to END
                 goto = END
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "triage_preferences"), state["messages"] + result + [{
+                feedback.append((current_tenant().namespace("triage_preferences"), len(result), {
                     "role": "user",
                     "content": f"The user ignored the Question. That means they did not want to answer the question or deal with this email. Update the triage preferences to ensure emails of this type are not classified as respond. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
 
             else:
                 raise ValueError(f"Invalid tool call: {tool_call['name']}")
@@ -428,19 +663,19 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
                 # Don't execute the tool, and add a message with the user feedback to incorporate into the email
                 result.append({"role": "tool", "content": f"User gave feedback, which can we incorporate into the email. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "response_preferences"), state["messages"] + result + [{
+                feedback.append((current_tenant().namespace("response_preferences"), len(result), {
                     "role": "user",
                     "content": f"User gave feedback, which we can use to update the response preferences. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
 
             elif tool_call["name"] == "schedule_meeting_tool":
                 # Don't execute the tool, and add a message with the user feedback to incorporate into the email
                 result.append({"role": "tool", "content": f"User gave feedback, which can we incorporate into the meeting request. Feedback: {user_feedback}", "tool_call_id": tool_call["id"]})
                 # This is new: update the memory
-                update_memory(store, ("email_assistant", "cal_preferences"), state["messages"] + result + [{
+                feedback.append((current_tenant().namespace("cal_preferences"), len(result), {
                     "role": "user",
                     "content": f"User gave feedback, which we can use to update the calendar preferences. Follow all instructions above, and remember: {MEMORY_UPDATE_INSTRUCTIONS_REINFORCEMENT}."
-                }])
+                }))
 
             elif tool_call["name"] == "Question":
                 # Don't execute the tool, and add a message with the user feedback to incorporate into the email
@@ -449,12 +684,69 @@ def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_ca
             else:
                 raise ValueError(f"Invalid tool call: {tool_call['name']}")
 
+        # Catch all other responses
+        else:
+            raise ValueError(f"Invalid response: {response}")
+
+    return {
+        "messages": result,
+        "pending": pending,
+        "unreviewed": unreviewed,
+        "approved": approved,
+        "feedback": feedback,
+        "needs_context": any(count is not None for _, count, _ in feedback),
+        "goto": goto,
+    }
+
+def review_command(store: BaseStore, review: dict, executed: list[dict], observations: list, context: list) -> Command[Literal["llm_call", "__end__"]]:
+    """Routing Command of the interrupt handler once the tools of a review ran, saving the user's feedback.
+
+    Args:
+        store: LangGraph BaseStore instance the feedback is saved to
+        review: Result of review_tool_calls
+        executed: Tool messages of review["unreviewed"], as returned by run_tool_calls
+        observations: Outputs of the review["approved"] tools, in the same order
+        context: Conversation prepared by context_manager, for feedback that includes it
+    """
+    tool_messages = {message["tool_call_id"]: message for message in executed}
+    for tool_call, observation in zip(review["approved"], observations):
+        tool_messages[tool_call["id"]] = {"role": "tool", "content": observation, "tool_call_id": tool_call["id"]}
+
+    # Fill in the tool messages in the order of the tool calls
+    result = list(review["messages"])
+    for index, tool_call_id in review["pending"]:
+        result[index] = tool_messages[tool_call_id]
+
+    # Feedback goes to the memory update queue, with the conversation up to the reviewed call if it asks for it
+    for namespace, count, note in review["feedback"]:
+        enqueue_memory_update(store, namespace, (context + result[:count] if count is not None else []) + [note])
+
     # Update the state 
     update = {
         "messages": result,
     }
 
-    return Command(goto=goto, update=update)
+    return Command(goto=review["goto"], update=update)
+
+def interrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_call", "__end__"]]:
+    """Creates an interrupt for human review of tool calls"""
+    review = review_tool_calls(state)
+    tools_by_name = load_tools_by_name()
+
+    # Tools that don't need review run concurrently, the reviewed ones one at a time
+    executed = run_tool_calls(review["unreviewed"], tools_by_name)
+    observations = [invoke_tool(tools_by_name[tool_call["name"]], tool_call["args"]) for tool_call in review["approved"]]
+    context = context_manager.prepare(state["messages"]) if review["needs_context"] else []
+    return review_command(store, review, executed, observations, context)
+
+async def ainterrupt_handler(state: State, store: BaseStore) -> Command[Literal["llm_call", "__end__"]]:
+    """Async variant of interrupt_handler"""
+    review = review_tool_calls(state)
+    tools_by_name = load_tools_by_name()
+    executed = await arun_tool_calls(review["unreviewed"], tools_by_name)
+    observations = [await ainvoke_tool(tools_by_name[tool_call["name"]], tool_call["args"]) for tool_call in review["approved"]]
+    context = await context_manager.aprepare(state["messages"]) if review["needs_context"] else []
+    return review_command(store, review, executed, observations, context)
 
 # Conditional edge function
 def should_continue(state: State, store: BaseStore) -> Literal["interrupt_handler", "mark_as_read_node"]:
@@ -469,43 +761,121 @@ def should_continue(state: State, store: BaseStore) -> Literal["interrupt_handle
             else:
                 return "interrupt_handler"
 
+def tenant_label_batcher():
+    """Label batcher for the Gmail account of the run's tenant"""
+    token_path = current_tenant().token_path
+    return get_label_batcher(token_path) if token_path else get_label_batcher()
+
 def mark_as_read_node(state: State):
     email_input = state["email_input"]
     author, to, subject, email_thread, email_id = parse_gmail(email_input)
-    mark_as_read(email_id)
+    # Queued and sent with other emails' label changes in one Gmail batchModify call
+    tenant_label_batcher().mark_as_read(email_id)
+    # Older messages of the thread that this run covers (see thread_coalescer)
+    for superseded_id in email_input.get(SUPERSEDED_KEY, []):
+        tenant_label_batcher().mark_as_read(superseded_id)
+    # Keep the email and the reply sent for search_memory (embedded in the background)
+    remember_episode(state)
+
+async def amark_as_read_node(state: State):
+    """Async variant of mark_as_read_node; queuing the label change never blocks"""
+    mark_as_read_node(state)
 
 # Build workflow
-agent_builder = StateGraph(State)
-
-# Add nodes - with store parameter
-agent_builder.add_node("llm_call", llm_call)
-agent_builder.add_node("interrupt_handler", interrupt_handler)
-agent_builder.add_node("mark_as_read_node", mark_as_read_node)
-
-# Add edges
-agent_builder.add_edge(START, "llm_call")
-agent_builder.add_conditional_edges(
-    "llm_call",
-    should_continue,
-    {
-        "interrupt_handler": "interrupt_handler",
-        "mark_as_read_node": "mark_as_read_node",
-    },
-)
-agent_builder.add_edge("mark_as_read_node", END)
-
-# Compile the agent
-response_agent = agent_builder.compile()
+def build_response_agent(llm_call, interrupt_handler, mark_as_read_node):
+    """Build the response agent from sync or async node functions"""
+    agent_builder = StateGraph(State)
+
+    # Add nodes - with store parameter
+    agent_builder.add_node("llm_call", instrument_node("llm_call", llm_call))
+    agent_builder.add_node("interrupt_handler", instrument_node("interrupt_handler", interrupt_handler))
+    agent_builder.add_node("mark_as_read_node", instrument_node("mark_as_read_node", mark_as_read_node))
+
+    # Add edges
+    agent_builder.add_edge(START, "llm_call")
+    agent_builder.add_conditional_edges(
+        "llm_call",
+        should_continue,
+        {
+            "interrupt_handler": "interrupt_handler",
+            "mark_as_read_node": "mark_as_read_node",
+        },
+    )
+    agent_builder.add_edge("mark_as_read_node", END)
+
+    # Compile the agent
+    return agent_builder.compile()
 
 # Build overall workflow with store and checkpointer
-overall_workflow = (
-    StateGraph(State, input=StateInput)
-    .add_node(triage_router)
-    .add_node(triage_interrupt_handler)
-    .add_node("response_agent", response_agent)
-    .add_node("mark_as_read_node", mark_as_read_node)
-    .add_edge(START, "triage_router")
-    .add_edge("mark_as_read_node", END)
-)
-
-email_assistant = overall_workflow.compile()
\ No newline at end of file
+def build_email_assistant(triage_router, triage_interrupt_handler, response_agent, mark_as_read_node, checkpointer=None, store=None):
+    """Build the overall workflow from triage nodes, a compiled response agent and the mark-as-read node, optionally with a checkpointer and store"""
+    overall_workflow = (
+        StateGraph(State, input=StateInput)
+        .add_node("triage_router", instrument_node("triage_router", triage_router))
+        .add_node("triage_interrupt_handler", instrument_node("triage_interrupt_handler", triage_interrupt_handler))
+        .add_node("response_agent", response_agent)
+        .add_node("mark_as_read_node", instrument_node("mark_as_read_node", mark_as_read_node))
+        .add_edge(START, "triage_router")
+        .add_edge("mark_as_read_node", END)
+    )
+    return overall_workflow.compile(checkpointer=checkpointer, store=store)
+
+# Compiled graphs by name, built on first use
+GRAPHS = {
+    "response_agent": lambda: build_response_agent(llm_call, interrupt_handler, mark_as_read_node),
+    "async_response_agent": lambda: build_response_agent(allm_call, ainterrupt_handler, amark_as_read_node),
+    "email_assistant": lambda: build_email_assistant(triage_router, triage_interrupt_handler, get_graph("response_agent"), mark_as_read_node),
+    # Async graph: run it with ainvoke, or many emails at once with async_runner.run_emails
+    "async_email_assistant": lambda: build_email_assistant(atriage_router, atriage_interrupt_handler, get_graph("async_response_agent"), amark_as_read_node),
+}
+
+@cache
+def get_graph(name: str):
+    """Compiled graph by name (a key of GRAPHS), built once on first use"""
+    return GRAPHS[name]()
+
+# Module attributes built on first access, so e.g. `from email_assistant.email_assistant_hitl_memory_gmail import email_assistant` still works
+LAZY_ATTRIBUTES = {
+    "tools": load_tools,
+    "tools_by_name": load_tools_by_name,
+    "llm_router": router_model,
+    "llm_batch_router": batch_router_model,
+    "llm_with_tools": agent_model,
+}
+
+def __getattr__(name):
+    if name in GRAPHS:
+        return get_graph(name)
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    """Build the tools, models and compiled graphs now (e.g. when a worker starts) instead of on the first email"""
+    load_tools_by_name()
+    # router_model() is the tiered router; build the models of both of its tiers
+    router_model().warm_up()
+    batch_router_model()
+    agent_model()
+    # Reads the learned sender statistics of the default tenant
+    get_pre_triage()
+    for name in GRAPHS:
+        get_graph(name)
+
+def durable_email_assistants(path: str = DEFAULT_DB_PATH):
+    """Compile the sync and async graphs with the SQLite checkpointer and store.
+
+    Interrupted threads wait for review in SQLite instead of memory, and the memory profiles
+    written by update_memory persist there too, so both survive a restart. The store's
+    memory update queue is started too, replaying feedback journaled before a crash.
+
+    Returns:
+        tuple: (email_assistant, async_email_assistant) sharing one database
+    """
+    checkpointer, store = get_persistence(path)
+    # Start the memory queue now, so feedback a crashed process left in the journal is applied
+    get_memory_queue(store, update_memory)
+    return (
+        build_email_assistant(triage_router, triage_interrupt_handler, get_graph("response_agent"), mark_as_read_node, checkpointer=checkpointer, store=store),
+        build_email_assistant(atriage_router, atriage_interrupt_handler, get_graph("async_response_agent"), amark_as_read_node, checkpointer=checkpointer, store=store),
+    )
@@ -0,0 +1,422 @@
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.tools import tool
+
+from email_assistant.model_registry import get_embeddings
+from email_assistant.resilience import call
+from email_assistant.telemetry import get_logger
+from email_assistant.tenants import current_tenant
+
+try:
+    import fcntl
+except ImportError:  # Windows: adds from several processes are not serialized
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Episodes of each namespace are kept under this directory, one index per namespace
+DEFAULT_MEMORY_DIR = "episodic_memory"
+# Precedents returned by search_memory
+DEFAULT_K = 3
+# Below this many episodes the index is scanned in full; from here on it is clustered (IVF)
+DEFAULT_TRAIN_THRESHOLD = 4096
+# Clusters scanned per query, and a hard cap on vectors scored, which bound search latency
+DEFAULT_NPROBE = 16
+DEFAULT_MAX_CANDIDATES = 20000
+# Clusters are re-trained once the index has grown this much since the last training
+RETRAIN_GROWTH = 4
+MAX_LISTS = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 32768
+# Rows the vector file grows by at a time (it doubles from here)
+INITIAL_CAPACITY = 1024
+# Email and reply text kept per episode
+MAX_EPISODE_CHARS = 2000
+# Tool calls whose arguments are the reply that was sent
+REPLY_TOOLS = {"send_email_tool": "response_text", "write_email": "content"}
+# Namespace labels become directory names under the memory root, so only these characters are allowed
+PATH_LABEL = re.compile(r"[A-Za-z0-9_-]+")
+
+class HashingEmbeddings:
+    """Deterministic bag-of-words embeddings by feature hashing.
+
+    Needs no API or network, so benchmarks and offline runs can use episodic memory with
+    register_embeddings("episodic_memory", HashingEmbeddings()). Only words in common
+    count as similar, so it is much weaker than a real embedding model.
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dimensions] += 1.0 if digest >> 63 else -1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+def _normalized(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _kmeans(vectors: np.ndarray, clusters: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means: unit-length centroids maximizing cosine similarity."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(clusters):
+            members = vectors[assignment == cluster]
+            # An empty cluster keeps its centroid
+            if len(members):
+                centroids[cluster] = _normalized(members.sum(axis=0))
+    return centroids
+
+class VectorIndex:
+    """Inverted-file (IVF) index of unit vectors, persisted in memory-mapped files.
+
+    Vectors live in vectors.f32 and each vector's cluster in lists.i32, both opened with
+    np.memmap, so a large index costs page cache rather than Python memory. Episode records
+    are JSON lines in records.jsonl, found through offsets.i64. index.json holds the counts
+    and is written last, so an add interrupted by a crash is simply not there on reopen.
+
+    Small indexes are scanned in full. From train_threshold vectors on, the vectors are
+    clustered with k-means (about sqrt(n) clusters) and a query scores only the vectors of
+    its nprobe nearest clusters, at most max_candidates of them.
+
+    Several processes can share an index (e.g. a worker fleet): an add holds an exclusive
+    lock on index.lock and first catches up with the adds other processes made, and a
+    search catches up whenever index.json changed, so every process sees every episode.
+    """
+
+    def __init__(self, path: str, dimensions: int, nprobe: int = DEFAULT_NPROBE, max_candidates: int = DEFAULT_MAX_CANDIDATES,
+                 train_threshold: int = DEFAULT_TRAIN_THRESHOLD):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.nprobe = nprobe
+        self.max_candidates = max_candidates
+        self.train_threshold = train_threshold
+        self._lock = threading.RLock()
+        self.dimensions = dimensions
+        self.count = self.trained_count = self._records_bytes = 0
+        self._capacity = INITIAL_CAPACITY
+        self._centroids = self._lists = None
+        # (inode, mtime) of the index.json this process last caught up with
+        self._meta_stamp = None
+
+        with self._lock, self._file_lock():
+            meta = self._read_meta()
+            if meta and meta["dimensions"] != dimensions:
+                raise ValueError(f"Index {path} holds {meta['dimensions']}-dimensional vectors, not {dimensions}")
+            self._open_files()
+            self._refresh()
+            # Drop whatever a crash left behind the last complete add (no other add runs while the lock is held)
+            with open(self._file("records.jsonl"), "ab") as f:
+                f.truncate(self._records_bytes)
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on index.lock, so processes sharing the index add one at a time."""
+        if fcntl is None:
+            yield
+            return
+        with open(self._file("index.lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _meta_stat(self):
+        try:
+            stat = os.stat(self._file("index.json"))
+        except FileNotFoundError:
+            return None
+        # index.json is replaced, never rewritten in place, so a new inode means a new version
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _refresh(self):
+        """Catch up with the adds (and re-training) other processes saved since this one last looked."""
+        stamp = self._meta_stat()
+        if stamp is None or stamp == self._meta_stamp:
+            return
+        meta = self._read_meta()
+        if meta.get("capacity", INITIAL_CAPACITY) != self._capacity:
+            self._capacity = meta["capacity"]
+            self._open_files()
+        count, trained_count = meta.get("count", 0), meta.get("trained_count", 0)
+        if self._lists is not None and trained_count == self.trained_count:
+            # Same clusters: new vectors join the lists they were assigned to
+            for vector_id in range(self.count, count):
+                self._lists[int(self._assignments[vector_id])].append(vector_id)
+            self.count = count
+        else:
+            self.count, self.trained_count = count, trained_count
+            self._centroids = np.load(self._file("centroids.npy")) if trained_count and os.path.exists(self._file("centroids.npy")) else None
+            self._build_lists()
+        self._records_bytes = meta.get("records_bytes", 0)
+        self._meta_stamp = stamp
+
+    def _read_meta(self) -> dict:
+        if os.path.exists(self._file("index.json")):
+            with open(self._file("index.json")) as f:
+                return json.load(f)
+        return {}
+
+    def _write_meta(self):
+        meta = {
+            "dimensions": self.dimensions, "count": self.count, "capacity": self._capacity,
+            "records_bytes": self._records_bytes, "trained_count": self.trained_count,
+        }
+        tmp_path = self._file("index.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file("index.json"))
+        self._meta_stamp = self._meta_stat()
+
+    def _memmap(self, name, dtype, shape):
+        path = self._file(name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, "ab") as f:
+            # Grow (sparse) to the capacity; never shrink
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open_files(self):
+        self._vectors = self._memmap("vectors.f32", np.float32, (self._capacity, self.dimensions))
+        self._assignments = self._memmap("lists.i32", np.int32, (self._capacity,))
+        self._offsets = self._memmap("offsets.i64", np.int64, (self._capacity,))
+
+    def _grow(self):
+        for array in (self._vectors, self._assignments, self._offsets):
+            array.flush()
+        self._capacity *= 2
+        self._open_files()
+
+    def _build_lists(self):
+        """Inverted lists (vector ids per cluster) from the persisted assignments."""
+        if self._centroids is None:
+            self._lists = None
+            return
+        assignments = np.asarray(self._assignments[:self.count])
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(1, len(self._centroids)))
+        # Lists, not arrays, so later adds can append to them
+        self._lists = [ids.tolist() for ids in np.split(order, bounds)]
+
+    def _train(self):
+        """Cluster the index and assign every vector to its nearest centroid."""
+        start = time.perf_counter()
+        clusters = min(MAX_LISTS, max(1, int(np.sqrt(self.count))))
+        sample = self._vectors[:self.count]
+        if self.count > KMEANS_SAMPLE:
+            sample = sample[np.sort(np.random.default_rng(0).choice(self.count, KMEANS_SAMPLE, replace=False))]
+        self._centroids = _kmeans(np.asarray(sample), clusters)
+        for begin in range(0, self.count, 65536):
+            end = min(self.count, begin + 65536)
+            self._assignments[begin:end] = np.argmax(self._vectors[begin:end] @ self._centroids.T, axis=1)
+        self._assignments.flush()
+        # Replaced whole, so a search in another process never loads half-written centroids
+        tmp_path = self._file("centroids.npy.tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, self._centroids)
+        os.replace(tmp_path, self._file("centroids.npy"))
+        self.trained_count = self.count
+        self._build_lists()
+        logger.info(f"🧠 Clustered {self.count} episodes into {clusters} lists in {time.perf_counter() - start:.1f}s",
+                    path=self.path, episodes=self.count, clusters=clusters)
+
+    def add(self, vector, record: dict) -> int:
+        """Append a vector with its record; returns the vector id."""
+        vector = _normalized(vector)
+        line = (json.dumps(record) + "\n").encode()
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.count == self._capacity:
+                self._grow()
+            vector_id = self.count
+            self._vectors[vector_id] = vector
+            self._offsets[vector_id] = self._records_bytes
+            if self._centroids is not None:
+                cluster = int(np.argmax(self._centroids @ vector))
+                self._assignments[vector_id] = cluster
+                self._lists[cluster].append(vector_id)
+            with open(self._file("records.jsonl"), "r+b") as f:
+                # Over anything a crashed add left behind
+                f.seek(self._records_bytes)
+                f.write(line)
+                f.truncate()
+            self._records_bytes += len(line)
+            self.count += 1
+
+            if self.count >= max(self.train_threshold, RETRAIN_GROWTH * self.trained_count):
+                self._train()
+            self._write_meta()
+            return vector_id
+
+    def _candidates(self, query):
+        if self._centroids is None:
+            return np.arange(self.count)
+        nearest = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        ids = itertools.islice(itertools.chain.from_iterable(self._lists[cluster] for cluster in nearest), self.max_candidates)
+        return np.fromiter(ids, dtype=np.int64)
+
+    def search(self, vector, k: int = DEFAULT_K) -> list[tuple[int, float]]:
+        """Approximate top-k vectors by cosine similarity, as (vector id, score), best first."""
+        query = _normalized(vector)
+        with self._lock:
+            self._refresh()
+            if not self.count:
+                return []
+            candidates = self._candidates(query)
+            scores = self._vectors[candidates] @ query
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top])]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def record(self, vector_id: int) -> dict:
+        """The record stored with a vector."""
+        with open(self._file("records.jsonl"), "rb") as f:
+            f.seek(int(self._offsets[vector_id]))
+            return json.loads(f.readline())
+
+    def flush(self):
+        with self._lock:
+            for array in (self._vectors, self._assignments, self._offsets):
+                array.flush()
+
+class EpisodicMemory:
+    """Long-term memory of past emails and the replies sent to them, searchable by similarity.
+
+    Each tenant's episodes go to their own VectorIndex under root (namespace
+    ("email_assistant", tenant, "episodes")). Recording an episode embeds the email with the
+    "episodic_memory" embedding model in a background thread, off the response path;
+    search embeds the query and returns the top-k most similar past emails with their replies.
+    """
+
+    def __init__(self, root: str = DEFAULT_MEMORY_DIR, role: str = "episodic_memory", **index_kwargs):
+        self.root = root
+        self.role = role
+        self.index_kwargs = index_kwargs
+        self._indexes = {}
+        self._lock = threading.Lock()
+        # One writer thread, so adds to an index never race
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="episodic-memory")
+
+    def _embed(self, text: str):
+        return call("embeddings", lambda: get_embeddings(self.role).embed_query(text))
+
+    def _path(self, namespace) -> str:
+        for label in namespace:
+            if not PATH_LABEL.fullmatch(label):
+                raise ValueError(f"Invalid episodic memory namespace label {label!r}: only letters, digits, '_' and '-' are allowed")
+        return os.path.join(self.root, *namespace)
+
+    def index(self, namespace, dimensions: int | None = None) -> VectorIndex | None:
+        """Index of a namespace; None if it has no episodes yet and dimensions is not given."""
+        path = self._path(namespace)
+        with self._lock:
+            if path not in self._indexes:
+                if dimensions is None:
+                    if not os.path.exists(os.path.join(path, "index.json")):
+                        return None
+                    with open(os.path.join(path, "index.json")) as f:
+                        dimensions = json.load(f)["dimensions"]
+                self._indexes[path] = VectorIndex(path, dimensions, **self.index_kwargs)
+            return self._indexes[path]
+
+    def add(self, namespace, email: str, reply: str, metadata: dict | None = None) -> int:
+        """Embed and store one episode (email text and the reply sent); returns its vector id."""
+        vector = self._embed(email)
+        record = {
+            "id": str(uuid.uuid4()), "email": email[:MAX_EPISODE_CHARS], "reply": reply[:MAX_EPISODE_CHARS],
+            "created_at": time.time(), **(metadata or {}),
+        }
+        return self.index(namespace, len(vector)).add(vector, record)
+
+    def add_later(self, namespace, email: str, reply: str, metadata: dict | None = None):
+        """Queue add on the background writer; failures are logged, never raised."""
+        def add():
+            try:
+                self.add(namespace, email, reply, metadata)
+            except Exception as error:
+                logger.warning(f"⚠️ Failed to record episode: {error}", namespace=list(namespace))
+        return self._executor.submit(add)
+
+    def search(self, namespace, query: str, k: int = DEFAULT_K) -> list[dict]:
+        """Past episodes most similar to query, best first, each with its "score"."""
+        index = self.index(namespace)
+        if index is None:
+            return []
+        return [{**index.record(vector_id), "score": score} for vector_id, score in index.search(self._embed(query), k)]
+
+    def flush(self):
+        """Wait for queued adds and flush every index to disk."""
+        self._executor.submit(lambda: None).result()
+        with self._lock:
+            indexes = list(self._indexes.values())
+        for index in indexes:
+            index.flush()
+
+# Shared by the assistants and the search_memory tool
+episodic_memory = EpisodicMemory()
+
+def email_text(email_input: dict) -> str:
+    """Text of an email that is embedded and shown as a precedent (parse_gmail and parse_email shapes)."""
+    author = email_input.get("from") or email_input.get("author", "")
+    body = email_input.get("body") or email_input.get("email_thread", "")
+    return f"From: {author}\nSubject: {email_input.get('subject', '')}\n\n{body}"
+
+def sent_reply(messages) -> str | None:
+    """Text of the last reply the agent sent in a run (after any edits in Agent Inbox), if any."""
+    for message in reversed(messages):
+        for tool_call in reversed(getattr(message, "tool_calls", None) or []):
+            if tool_call["name"] in REPLY_TOOLS:
+                return tool_call["args"].get(REPLY_TOOLS[tool_call["name"]])
+    return None
+
+def remember_episode(state: dict):
+    """Record a finished email and the reply sent to it in the tenant's episodic memory (in the background)."""
+    reply = sent_reply(state.get("messages", []))
+    if reply:
+        email_input = state["email_input"]
+        episodic_memory.add_later(current_tenant().namespace("episodes"), email_text(email_input), reply,
+                                  {"email_id": email_input.get("id"), "subject": email_input.get("subject", "")})
+
+@tool
+def search_memory(query: str) -> str:
+    """Search past emails and the replies that were sent to them.
+
+    Use it to find how a similar email was answered before, to stay consistent with earlier replies.
+
+    Args:
+        query: What to look for, e.g. the sender and the gist of the email
+    """
+    episodes = episodic_memory.search(current_tenant().namespace("episodes"), query)
+    if not episodes:
+        return "No similar past emails found."
+    return "\n\n".join(
+        f"Precedent {n} (similarity {episode['score']:.2f}):\n{episode['email']}\n\nReply sent:\n{episode['reply']}"
+        for n, episode in enumerate(episodes, 1)
+    )
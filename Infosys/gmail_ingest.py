@@ -0,0 +1,428 @@
+import asyncio
+import base64
+import email
+import email.policy
+import html
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+
+from googleapiclient.errors import HttpError
+
+from email_assistant.async_runner import DEFAULT_MAX_CONCURRENCY, ainvoke_once, email_config
+from email_assistant.gmail_pool import get_gmail_service
+from email_assistant.resilience import call, get_breaker
+from email_assistant.tenants import current_tenant, tenant_config, tenant_registry
+from email_assistant.thread_coalescer import SUPERSEDED_KEY, thread_coalescer
+from email_assistant.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Unread inbox mail, fetched a page at a time
+DEFAULT_QUERY = "is:unread in:inbox"
+DEFAULT_PAGE_SIZE = 50
+# Last fully processed history ID is saved here so a restart resumes where it stopped
+DEFAULT_CHECKPOINT_PATH = "gmail_ingest_state.json"
+# An email that failed this many times is dead-lettered (written next to the checkpoint as
+# <checkpoint>.dead_letter.jsonl), so it stops holding the checkpoint back
+DEFAULT_MAX_ATTEMPTS = 3
+# Emails held for the coalescing window at once; fetching pauses beyond this (backpressure)
+DEFAULT_MAX_HELD = 256
+
+# Headers kept on each email for pre-triage rules (bulk mail, mailing lists, auto-replies)
+TRIAGE_HEADERS = ["List-Unsubscribe", "List-Id", "Precedence", "Auto-Submitted", "Reply-To", "X-Mailer"]
+
+def html_to_text(markup: str) -> str:
+    """Very small HTML to text conversion for emails without a text/plain part."""
+    markup = re.sub(r"(?is)<(script|style).*?</\1>", "", markup)
+    markup = re.sub(r"(?i)<br\s*/?>|</p>|</div>|</tr>", "\n", markup)
+    text = html.unescape(re.sub(r"<[^>]+>", "", markup))
+    return re.sub(r"\n\s*\n+", "\n\n", text).strip()
+
+def decode_message(message: dict) -> dict:
+    """Decode a Gmail API message fetched with format="raw" into the parse_gmail shape.
+
+    Args:
+        message: Gmail API message resource with id, threadId, historyId and raw
+
+    Returns:
+        dict: email_input with from, to, subject, body, id, thread_id, send_time, history_id and headers
+    """
+    raw = base64.urlsafe_b64decode(message["raw"].encode("ascii") + b"==")
+    parsed = email.message_from_bytes(raw, policy=email.policy.default)
+
+    # Prefer the plain-text body; fall back to HTML converted to text
+    part = parsed.get_body(preferencelist=("plain", "html"))
+    body = ""
+    if part is not None:
+        body = part.get_content()
+        if part.get_content_type() == "text/html":
+            body = html_to_text(body)
+
+    send_time = parsed.get("Date", "")
+    try:
+        send_time = parsedate_to_datetime(send_time).isoformat()
+    except (TypeError, ValueError):
+        pass
+
+    return {
+        "from": str(parsed.get("From", "")),
+        "to": str(parsed.get("To", "")),
+        "subject": str(parsed.get("Subject", "")),
+        "body": body.strip(),
+        "id": message["id"],
+        "thread_id": message.get("threadId", ""),
+        "send_time": send_time,
+        "history_id": message.get("historyId", ""),
+        "headers": {name: str(parsed[name]) for name in TRIAGE_HEADERS if parsed.get(name) is not None},
+    }
+
+class GmailInboxStream:
+    """Bounded-memory stream of unread inbox emails with history-ID based incremental sync.
+
+    The first sync pages through messages.list; later syncs only read users.history.list from
+    the last checkpointed history ID. Messages are fetched one page at a time as the consumer
+    pulls them, so memory stays bounded by the page size. The checkpoint only moves forward
+    once every email of a sync has been acknowledged (ack) or dead-lettered, so a crash
+    re-delivers unprocessed email (run them on a checkpointer keyed by message id to make
+    that harmless; feed_graph does).
+
+    Until the checkpoint moves, the ids of emails already acknowledged are kept with it, and
+    a later sync skips them, so one failing email does not send every email since the
+    checkpoint through the graph again. A failure is reported with fail(); after
+    max_attempts failures the email is dead-lettered.
+
+    sync() may run in a worker thread while ack() and fail() are called from the event loop
+    (feed_graph does), so the checkpoint state is only changed under a lock.
+    """
+
+    def __init__(self, service, checkpoint_path: str = DEFAULT_CHECKPOINT_PATH, query: str = DEFAULT_QUERY,
+                 page_size: int = DEFAULT_PAGE_SIZE, user_id: str = "me", max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.service = service
+        self.checkpoint_path = checkpoint_path
+        self.dead_letter_path = f"{os.path.splitext(checkpoint_path)[0]}.dead_letter.jsonl"
+        self.query = query
+        self.page_size = page_size
+        self.user_id = user_id
+        self.max_attempts = max_attempts
+        self.dead_lettered = 0
+        # Acknowledged (or dead-lettered) since the checkpoint, and failures per message id
+        self._done = set()
+        self._attempts = {}
+        self.history_id = self._load_checkpoint()
+        self._pending = set()
+        self._sync_history_id = None
+        self._sync_complete = False
+        self._lock = threading.RLock()
+
+    def _load_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                state = json.load(f)
+            self._done = set(state.get("done", []))
+            self._attempts = dict(state.get("attempts", {}))
+            return state.get("history_id")
+        return None
+
+    def _save_checkpoint(self, history_id):
+        # Write then rename so a crash never leaves a half-written checkpoint
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"history_id": history_id, "done": sorted(self._done), "attempts": self._attempts}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+        self.history_id = history_id
+
+    def _execute(self, request):
+        # Deadline, retries on 429 / 5xx and the Gmail circuit breaker; a 404 is not retried
+        return call("gmail", request.execute)
+
+    def _get(self, message_id):
+        return self._execute(self.service.users().messages().get(userId=self.user_id, id=message_id, format="raw"))
+
+    def _full_sync_ids(self):
+        """Message ids of all unread inbox mail, page by page."""
+        page_token = None
+        while True:
+            response = self._execute(self.service.users().messages().list(
+                userId=self.user_id, q=self.query, maxResults=self.page_size, pageToken=page_token
+            ))
+            for message in response.get("messages", []):
+                yield message["id"]
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _incremental_ids(self, start_history_id):
+        """Ids of messages added to the inbox since start_history_id, page by page."""
+        page_token = None
+        seen = set()
+        while True:
+            response = self._execute(self.service.users().history().list(
+                userId=self.user_id, startHistoryId=start_history_id, historyTypes=["messageAdded"],
+                labelId="INBOX", maxResults=self.page_size, pageToken=page_token,
+            ))
+            for record in response.get("history", []):
+                for added in record.get("messagesAdded", []):
+                    message = added["message"]
+                    if message["id"] not in seen and "UNREAD" in message.get("labelIds", ["UNREAD"]):
+                        seen.add(message["id"])
+                        yield message["id"]
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _deliver(self, message_ids, delivered: set):
+        """Fetch and decode the messages not yet acknowledged or delivered in this sync."""
+        for message_id in message_ids:
+            if message_id in self._done or message_id in delivered:
+                continue
+            try:
+                message = self._get(message_id)
+            except HttpError as error:
+                # Deleted between listing and fetching
+                if error.resp.status == 404:
+                    continue
+                raise
+            email_input = decode_message(message)
+            delivered.add(message_id)
+            with self._lock:
+                self._pending.add(email_input["id"])
+            yield email_input
+
+    def sync(self):
+        """Yield unread emails (parse_gmail shape) that arrived since the last checkpoint."""
+        # The mailbox's current history id becomes the checkpoint once this sync is fully acknowledged.
+        # Anything left unacknowledged by an earlier sync is delivered again, since the checkpoint did not move.
+        sync_history_id = self._execute(self.service.users().getProfile(userId=self.user_id))["historyId"]
+        with self._lock:
+            self._sync_history_id = sync_history_id
+            self._sync_complete = False
+            self._pending = set()
+        delivered = set()
+
+        if self.history_id is None:
+            yield from self._deliver(self._full_sync_ids(), delivered)
+        else:
+            try:
+                yield from self._deliver(self._incremental_ids(self.history_id), delivered)
+            except HttpError as error:
+                # History older than about a week is gone; start over with a full sync,
+                # skipping what this sync already delivered
+                if error.resp.status != 404:
+                    raise
+                logger.warning("⚠️ Gmail history expired, falling back to a full inbox sync", history_id=self.history_id)
+                self.history_id = None
+                yield from self._deliver(self._full_sync_ids(), delivered)
+
+        with self._lock:
+            self._sync_complete = True
+            if not self._maybe_advance():
+                # Some email failed: keep what was acknowledged, so the next sync skips it
+                self._save_checkpoint(self.history_id)
+
+    def ack(self, email_input: dict):
+        """Mark an email as processed; the checkpoint advances once a whole sync is acknowledged."""
+        with self._lock:
+            self._pending.discard(email_input["id"])
+            self._done.add(email_input["id"])
+            self._attempts.pop(email_input["id"], None)
+            self._maybe_advance()
+
+    def fail(self, email_input: dict, error) -> bool:
+        """Record a failed attempt at an email; dead-letter it after max_attempts.
+
+        Returns:
+            bool: True if the email was dead-lettered (it will not be delivered again)
+        """
+        email_id = email_input["id"]
+        with self._lock:
+            self._attempts[email_id] = self._attempts.get(email_id, 0) + 1
+            if self._attempts[email_id] < self.max_attempts:
+                # Saved right away, so failures before a crash still count
+                self._save_checkpoint(self.history_id)
+                return False
+
+            with open(self.dead_letter_path, "a") as f:
+                f.write(json.dumps({
+                    "id": email_id, "thread_id": email_input.get("thread_id", ""), "from": email_input.get("from", ""),
+                    "subject": email_input.get("subject", ""), "attempts": self._attempts[email_id], "error": repr(error), "at": time.time(),
+                }) + "\n")
+            self.dead_lettered += 1
+            logger.error(f"❌ Dead-lettered email {email_id} after {self._attempts[email_id]} failed attempts: {error}",
+                         email_id=email_id, attempts=self._attempts[email_id], dead_letter_path=self.dead_letter_path)
+            self._pending.discard(email_id)
+            self._done.add(email_id)
+            del self._attempts[email_id]
+            if not self._maybe_advance():
+                self._save_checkpoint(self.history_id)
+            return True
+
+    def _maybe_advance(self) -> bool:
+        if self._sync_complete and not self._pending:
+            # Nothing from before the new history id is delivered again by history.list
+            self._done, self._attempts = set(), {}
+            self._save_checkpoint(self._sync_history_id)
+            return True
+        return False
+
+async def feed_graph(graph, stream: GmailInboxStream, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, config: dict | None = None,
+                     coalescer=thread_coalescer, scheduler=None, max_held: int = DEFAULT_MAX_HELD):
+    """Run every email from one sync of the stream through an async-compiled graph.
+
+    At most max_concurrency emails are in flight and at most max_concurrency more are buffered,
+    so fetching pauses (backpressure) whenever the workers are busy. Quick replies in one
+    thread are run once, on the newest message (see thread_coalescer); pass coalescer=None
+    to run every message. Emails wait out the coalescing window before they are queued, so
+    held emails (at most max_held) never occupy a worker, and the messages folded into a run
+    are acknowledged with it. With a scheduler (see priority_scheduler) shared by several
+    feeds, or smaller than max_concurrency, waiting emails start in priority order.
+
+    Returns:
+        int: Number of emails processed
+    """
+    queue = asyncio.Queue(maxsize=max_concurrency)
+    done = object()
+    processed = 0
+    # Delivered emails not yet acknowledged or failed, by id
+    delivered = {}
+    holding = asyncio.Semaphore(max_held)
+
+    async def hold(email_input):
+        try:
+            # Only the newest message of a thread reaches the queue, carrying the ids it covers
+            survivor = await coalescer.hold(email_input, config)
+            if survivor is not None:
+                await queue.put(survivor)
+        finally:
+            holding.release()
+
+    async def produce():
+        emails = stream.sync()
+        holds = set()
+        try:
+            while True:
+                # The Gmail client is blocking, so pull the next email in a worker thread
+                email_input = await asyncio.to_thread(next, emails, done)
+                if email_input is done:
+                    await asyncio.gather(*holds)
+                    await queue.put(done)
+                    return
+                delivered[email_input["id"]] = email_input
+                if coalescer is None:
+                    await queue.put(email_input)
+                else:
+                    await holding.acquire()
+                    task = asyncio.create_task(hold(email_input))
+                    holds.add(task)
+                    task.add_done_callback(holds.discard)
+        except BaseException:
+            # Held emails stay unacknowledged, so the next sync delivers them again
+            for task in holds:
+                task.cancel()
+            raise
+
+    async def run(email_input):
+        # Hold emails back while the model provider's circuit is open
+        await get_breaker("llm").wait_until_available()
+        # With a scheduler, its slot comes first: it admits emails within the tenant's limits (see PriorityScheduler)
+        gate = nullcontext() if scheduler is None else scheduler.slot(email_input, config)
+        async with gate, current_tenant(config).slot(throttle=scheduler is None):
+            # An email whose thread already ran (e.g. re-delivered by a full sync) is not run again
+            await ainvoke_once(graph, email_input, email_config(email_input, config))
+
+    async def work():
+        nonlocal processed
+        while True:
+            email_input = await queue.get()
+            if email_input is done:
+                # Let the other workers see the end of the stream too
+                await queue.put(done)
+                return
+            try:
+                await run(email_input)
+            except Exception as error:
+                # Left unacknowledged, so the next sync delivers it again (resuming from its checkpoint), until it is dead-lettered;
+                # the messages folded into it are left unacknowledged too, and coalesced with it again
+                logger.warning(f"⚠️ Failed to process email {email_input['id']}: {error}", email_id=email_input["id"])
+                delivered.pop(email_input["id"], None)
+                stream.fail(email_input, error)
+                continue
+            # Older messages of the thread folded into this run are done with it
+            for email_id in [email_input["id"], *email_input.get(SUPERSEDED_KEY, [])]:
+                if email_id in delivered:
+                    stream.ack(delivered.pop(email_id))
+                    processed += 1
+
+    workers = [asyncio.create_task(work()) for _ in range(max_concurrency)]
+    try:
+        await produce()
+    except BaseException:
+        # The end of the stream never reaches the queue, so the workers would wait for it forever;
+        # emails they were running stay unacknowledged and resume from their checkpoints next sync
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+    await asyncio.gather(*workers)
+    return processed
+
+def feed_queue(stream: GmailInboxStream, queue, config: dict | None = None) -> int:
+    """Move every email from one sync of the stream into a worker fleet's JobQueue.
+
+    An email is acknowledged to the stream once it is durably queued; the worker fleet
+    (see worker_fleet) runs it from there.
+
+    Returns:
+        int: Number of emails queued (emails already in the queue are not counted)
+    """
+    queued = 0
+    for email_input in stream.sync():
+        queued += queue.enqueue(email_input, config)
+        stream.ack(email_input)
+    return queued
+
+async def poll_inbox(graph, stream: GmailInboxStream, interval_seconds: float = 60.0, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, config: dict | None = None,
+                     coalescer=thread_coalescer, scheduler=None):
+    """Keep syncing the inbox and feeding new email to the graph every interval_seconds.
+
+    A failed sync (Gmail unavailable after its retries, or its circuit open) is logged and
+    tried again at the next interval, so one inbox's outage never stops the poller.
+    """
+    while True:
+        try:
+            processed = await feed_graph(graph, stream, max_concurrency=max_concurrency, config=config, coalescer=coalescer, scheduler=scheduler)
+        except Exception as error:
+            logger.error(f"❌ Inbox sync failed, retrying in {interval_seconds:g}s: {error}", checkpoint_path=stream.checkpoint_path)
+        else:
+            if processed:
+                logger.info(f"📥 Processed {processed} new email(s)", processed=processed)
+        await asyncio.sleep(interval_seconds)
+
+async def poll_tenants(graph, interval_seconds: float = 60.0, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, tenant_ids=None, config: dict | None = None,
+                       scheduler=None):
+    """Poll every registered tenant's inbox and feed it to one shared graph.
+
+    Each tenant gets its own Gmail stream (from its token_path) and checkpoint file, and its
+    runs carry its tenant_id, so memory, threads and limits stay per tenant while the compiled
+    graph and the pooled model clients are shared.
+
+    Args:
+        graph: Async-compiled graph, e.g. email_assistant_hitl_memory_gmail.async_email_assistant
+        interval_seconds: Time between syncs of each inbox
+        max_concurrency: Workers per tenant; the tenant's own max_concurrency still applies
+        tenant_ids: Tenants to serve; defaults to every registered tenant
+        config: Base run config shared by every tenant
+        scheduler: Optional PriorityScheduler shared by every tenant, to start urgent email
+            first and share capacity between tenants by weight
+    """
+    async def poll(tenant_id):
+        tenant = tenant_registry.get(tenant_id)
+        service = get_gmail_service(tenant.token_path) if tenant.token_path else get_gmail_service()
+        stream = GmailInboxStream(service, checkpoint_path=f"{os.path.splitext(DEFAULT_CHECKPOINT_PATH)[0]}.{tenant_id}.json")
+        await poll_inbox(graph, stream, interval_seconds, max_concurrency, config=tenant_config(tenant_id, config), scheduler=scheduler)
+
+    await asyncio.gather(*(poll(tenant_id) for tenant_id in tenant_ids or tenant_registry.ids()))
@@ -0,0 +1,165 @@
+import atexit
+import os
+import threading
+
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+from email_assistant.resilience import call
+from email_assistant.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Scopes needed to read, label and send mail
+SCOPES = ["https://www.googleapis.com/auth/gmail.modify", "https://www.googleapis.com/auth/gmail.send"]
+DEFAULT_TOKEN_PATH = "token.json"
+
+# Gmail's batchModify accepts up to 1000 message ids per call
+MAX_BATCH_IDS = 1000
+DEFAULT_FLUSH_SECONDS = 2.0
+
+_lock = threading.RLock()
+_credentials = {}
+# httplib2 is not thread-safe, so each thread gets its own built service and transport
+_local = threading.local()
+
+def get_credentials(token_path: str = DEFAULT_TOKEN_PATH, scopes=None) -> Credentials:
+    """Load OAuth credentials once per process and refresh them when they expire.
+
+    The refreshed token is written back to token_path so other processes pick it up.
+    """
+    scopes = tuple(scopes or SCOPES)
+    key = (os.path.abspath(token_path), scopes)
+    with _lock:
+        creds = _credentials.get(key)
+        if creds is None:
+            if not os.path.exists(token_path):
+                raise FileNotFoundError(f"No Gmail token at {token_path}; run the OAuth flow first to create it")
+            creds = Credentials.from_authorized_user_file(token_path, list(scopes))
+            _credentials[key] = creds
+        if not creds.valid and creds.refresh_token:
+            creds.refresh(Request())
+            with open(token_path, "w") as token:
+                token.write(creds.to_json())
+        return creds
+
+def get_gmail_service(token_path: str = DEFAULT_TOKEN_PATH, scopes=None, api_endpoint: str | None = None):
+    """Return a Gmail API client for this thread, building it only once.
+
+    Args:
+        token_path: OAuth token file of the mailbox
+        scopes: OAuth scopes; defaults to SCOPES
+        api_endpoint: Override the API host, e.g. a local fake Gmail server in tests
+
+    Returns:
+        googleapiclient Resource for Gmail v1, reusing one HTTP connection per thread
+    """
+    creds = get_credentials(token_path, scopes)
+    services = getattr(_local, "services", None)
+    if services is None:
+        services = _local.services = {}
+    key = (os.path.abspath(token_path), api_endpoint)
+    if key not in services:
+        # AuthorizedHttp refreshes the shared credentials on a 401, so the service never needs rebuilding
+        http = AuthorizedHttp(creds, http=httplib2.Http(timeout=60))
+        client_options = {"api_endpoint": api_endpoint} if api_endpoint else None
+        services[key] = build("gmail", "v1", http=http, cache_discovery=False, client_options=client_options)
+    return services[key]
+
+class LabelBatcher:
+    """Collects label changes (e.g. mark as read) and applies them with Gmail's batchModify.
+
+    Changes with the same labels to add and remove are grouped, and each group is sent as one
+    batchModify call of up to MAX_BATCH_IDS ids, when it fills up, every flush_seconds, on
+    flush() or at exit.
+    """
+
+    def __init__(self, token_path: str = DEFAULT_TOKEN_PATH, flush_seconds: float = DEFAULT_FLUSH_SECONDS, api_endpoint: str | None = None):
+        self.token_path = token_path
+        self.api_endpoint = api_endpoint
+        self.flush_seconds = flush_seconds
+        # (add_label_ids, remove_label_ids) -> message ids, in arrival order
+        self._groups = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="gmail-label-batcher", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def modify(self, message_id: str, add_labels=(), remove_labels=()):
+        """Queue a label change for a message."""
+        key = (tuple(sorted(add_labels)), tuple(sorted(remove_labels)))
+        with self._condition:
+            ids = self._groups.setdefault(key, {})
+            ids[message_id] = None
+            full = len(ids) >= MAX_BATCH_IDS
+        if full:
+            self.flush()
+
+    def mark_as_read(self, message_id: str):
+        """Queue removal of the UNREAD label."""
+        self.modify(message_id, remove_labels=["UNREAD"])
+
+    def flush(self):
+        """Send every queued change now."""
+        with self._condition:
+            groups, self._groups = self._groups, {}
+        if not groups:
+            return
+        service = get_gmail_service(self.token_path, api_endpoint=self.api_endpoint)
+
+        # One batchModify call per chunk of up to MAX_BATCH_IDS ids with the same label change
+        chunks = [
+            (labels, ids[start:start + MAX_BATCH_IDS])
+            for labels, ids in ((labels, list(ids)) for labels, ids in groups.items())
+            for start in range(0, len(ids), MAX_BATCH_IDS)
+        ]
+        for sent, ((add_labels, remove_labels), ids) in enumerate(chunks):
+            try:
+                # Deadline, retries on 429 / 5xx and the Gmail circuit breaker
+                call("gmail", service.users().messages().batchModify(
+                    userId="me",
+                    body={"ids": ids, "addLabelIds": list(add_labels), "removeLabelIds": list(remove_labels)},
+                ).execute)
+            except Exception:
+                # Put back everything not yet sent so the next flush retries it
+                with self._condition:
+                    for labels, unsent in chunks[sent:]:
+                        group = self._groups.setdefault(labels, {})
+                        group.update(dict.fromkeys(unsent))
+                raise
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(self.flush_seconds)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception as error:
+                logger.warning(f"⚠️ Gmail label batch failed: {error}")
+
+    def stop(self):
+        """Flush what is queued and stop the background thread."""
+        if self._stopped:
+            return
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout=5)
+        self.flush()
+
+# One batcher per mailbox, created on first use
+_batchers = {}
+
+def get_label_batcher(token_path: str = DEFAULT_TOKEN_PATH) -> LabelBatcher:
+    """Return the process-wide label batcher for a mailbox."""
+    with _lock:
+        key = os.path.abspath(token_path)
+        if key not in _batchers:
+            _batchers[key] = LabelBatcher(token_path)
+        return _batchers[key]
@@ -0,0 +1,323 @@
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Literal
+
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from langgraph.types import Command
+from pydantic import BaseModel
+
+from email_assistant.async_runner import DEFAULT_MAX_CONCURRENCY, email_config
+from email_assistant.memory_worker import hold_memory_updates
+from email_assistant.sqlite_persistence import DEFAULT_DB_PATH, DEFAULT_PAGE_SIZE, PendingIndex, get_persistence, run_configurable
+from email_assistant.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+MAX_PAGE_SIZE = 500
+# Events buffered per WebSocket before a slow reviewer is disconnected
+MAX_QUEUED_EVENTS = 1000
+
+# Which response types each interrupt's config allows
+ALLOW_KEYS = {"accept": "allow_accept", "edit": "allow_edit", "ignore": "allow_ignore", "response": "allow_respond"}
+
+class ReviewResponse(BaseModel):
+    """A reviewer's answer to an interrupt, in the Agent Inbox response format."""
+    type: Literal["accept", "edit", "ignore", "response"]
+    args: Any = None
+
+class BulkDecision(ReviewResponse):
+    """A reviewer's answer to one of many pending threads."""
+    thread_id: str
+
+class BulkReview(BaseModel):
+    """Answers to many pending threads, resumed together."""
+    decisions: list[BulkDecision]
+
+class Broadcaster:
+    """Fans events out to every connected WebSocket through per-connection queues."""
+
+    def __init__(self, max_queued: int = MAX_QUEUED_EVENTS):
+        self.max_queued = max_queued
+        self._subscribers = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event: dict):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A reviewer this far behind reloads the list instead of getting every event:
+                # drop the backlog and leave only the signal to close the connection
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+class AgentInbox:
+    """Runs emails through an async HITL graph and tracks the interrupts waiting for review.
+
+    Args:
+        graph: Async graph compiled with a checkpointer, e.g. from durable_email_assistants
+        db: SqliteDatabase holding the pending_interrupts table
+        max_concurrency: Maximum number of graph runs (new emails and resumes) at once
+    """
+
+    def __init__(self, graph, db, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.graph = graph
+        self.pending = PendingIndex(db)
+        self.events = Broadcaster()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Threads being resumed right now, so a double click cannot resume twice
+        self._resuming = set()
+        # Background runs, referenced so they are not garbage collected mid-run
+        self._tasks = set()
+
+    def _start(self, thread_id, value, config, claimed=None):
+        task = asyncio.create_task(self._run(thread_id, value, config, claimed))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, thread_id, value, config, claimed=None):
+        """Run the graph until it finishes or stops at the next interrupt.
+
+        claimed is the pending item a resume answers; it is put back if the run fails.
+        """
+        try:
+            async with self._semaphore:
+                result = await self.graph.ainvoke(value, config)
+        except Exception as error:
+            logger.warning(f"⚠️ Run for thread {thread_id} failed: {error}", thread_id=thread_id)
+            self.events.publish({"event": "failed", "thread_id": thread_id, "error": str(error)})
+            if claimed is not None:
+                # The thread still waits at its interrupt, so it goes back on the list to be answered again
+                await self.pending.restore([claimed])
+                self.events.publish({"event": "interrupt", "thread_id": thread_id, "request": claimed["request"]})
+            return
+
+        request = await self.pending.record(result, config)
+        if request is not None:
+            self.events.publish({"event": "interrupt", "thread_id": thread_id, "request": request})
+        else:
+            self.events.publish({"event": "completed", "thread_id": thread_id})
+
+    def _resume_config(self, item):
+        # LangGraph does not restore configurable values (tenant_id, ...) on resume, so the run's own are passed again
+        return {"configurable": {**item["configurable"], "thread_id": item["thread_id"]}}
+
+    async def reconcile(self) -> int:
+        """List threads waiting for review that have no pending item, and return how many were added.
+
+        Covers runs started outside this service without a SQLite checkpointer's index, and
+        resumes lost when a process died after claiming their item.
+        """
+        added = 0
+        for thread_id in await self.pending.unindexed_threads():
+            state = await self.graph.aget_state({"configurable": {"thread_id": thread_id}})
+            interrupts = [interrupt for task in state.tasks for interrupt in task.interrupts]
+            if interrupts:
+                await self.pending.add(thread_id, interrupts[0].value[0], run_configurable(state.metadata or {}))
+                added += 1
+        if added:
+            logger.info(f"📬 Reconciled {added} pending interrupt(s) from checkpoints", added=added)
+        return added
+
+    async def submit(self, email_input: dict, config: dict | None = None) -> str:
+        """Start a run for an email in the background and return its thread_id."""
+        config = email_config(email_input, config)
+        thread_id = config["configurable"]["thread_id"]
+        self._start(thread_id, {"email_input": email_input}, config)
+        return thread_id
+
+    def _check(self, item, response):
+        """Raise ValueError unless the pending item's interrupt allows this response."""
+        allowed = item["request"].get("config", {})
+        if not allowed.get(ALLOW_KEYS[response["type"]], False):
+            raise ValueError(f"Response type '{response['type']}' is not allowed for {item['request']['action_request']['action']}")
+        if response["type"] == "edit" and not isinstance(response.get("args"), dict):
+            raise ValueError("An edit response needs args of the form {\"args\": {...}}")
+
+    async def respond(self, thread_id: str, response: dict):
+        """Resume a pending thread with a reviewer's response; it runs in the background.
+
+        Raises:
+            KeyError: If the thread has no pending interrupt
+            ValueError: If the interrupt does not allow this response type
+        """
+        if thread_id in self._resuming:
+            raise KeyError(thread_id)
+        self._resuming.add(thread_id)
+        try:
+            item = await self.pending.get(thread_id)
+            if item is None:
+                raise KeyError(thread_id)
+            self._check(item, response)
+            await self.pending.remove(thread_id)
+        finally:
+            self._resuming.discard(thread_id)
+
+        self.events.publish({"event": "resolved", "thread_id": thread_id, "type": response["type"]})
+        self._start(thread_id, Command(resume=[response]), self._resume_config(item), claimed=item)
+
+    async def respond_many(self, decisions) -> dict:
+        """Resume many pending threads at once, e.g. approving a page of drafted replies.
+
+        The accepted threads are claimed with one query and one delete, then resumed in the
+        background at most max_concurrency at a time. Memory updates are held until every
+        resume has finished, so each memory namespace gets one reflection pass for the batch.
+
+        Args:
+            decisions: List of (thread_id, response) pairs; a repeated thread keeps its first decision
+
+        Returns:
+            dict: thread_id -> "resumed", or the reason that thread was rejected
+        """
+        results = {}
+        claimed = []
+        for thread_id, response in decisions:
+            if thread_id in self._resuming or thread_id in results:
+                results[thread_id] = "already being resumed"
+            else:
+                self._resuming.add(thread_id)
+                claimed.append((thread_id, response))
+
+        accepted = []
+        try:
+            items = await self.pending.get_many([thread_id for thread_id, _ in claimed])
+            for thread_id, response in claimed:
+                if thread_id not in items:
+                    results[thread_id] = "no pending interrupt"
+                    continue
+                try:
+                    self._check(items[thread_id], response)
+                except ValueError as error:
+                    results[thread_id] = str(error)
+                    continue
+                accepted.append((items[thread_id], response))
+                results[thread_id] = "resumed"
+            await self.pending.remove_many([item["thread_id"] for item, _ in accepted])
+        finally:
+            for thread_id, _ in claimed:
+                self._resuming.discard(thread_id)
+
+        for item, response in accepted:
+            self.events.publish({"event": "resolved", "thread_id": item["thread_id"], "type": response["type"]})
+        if accepted:
+            task = asyncio.create_task(self._resume_all(accepted))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return results
+
+    async def _resume_all(self, accepted):
+        with hold_memory_updates():
+            await asyncio.gather(*(
+                self._run(item["thread_id"], Command(resume=[response]), self._resume_config(item), claimed=item)
+                for item, response in accepted
+            ))
+        logger.info(f"📬 Bulk review: resumed {len(accepted)} thread(s)", resumed=len(accepted))
+
+def create_app(graph, path: str = DEFAULT_DB_PATH, max_concurrency: int = DEFAULT_MAX_CONCURRENCY) -> FastAPI:
+    """Build the FastAPI app around an async graph compiled with the SQLite persistence at path.
+
+    Endpoints:
+        POST /emails                          Start a run for an email_input
+        GET  /interrupts?limit=50&cursor=...  Page through pending items, oldest first
+        GET  /interrupts/{thread_id}          One pending item
+        POST /interrupts/{thread_id}/respond  Answer it: {"type": "accept" | "edit" | "ignore" | "response", "args": ...}
+        POST /interrupts/respond              Answer many: {"decisions": [{"thread_id": ..., "type": ..., "args": ...}]}
+        WS   /ws                              Stream of {"event": "interrupt" | "resolved" | "completed" | "failed", ...}
+
+    On startup, threads waiting at an interrupt without a pending item are listed (see AgentInbox.reconcile).
+
+    Run it with: python -m email_assistant.inbox_service --port 8000
+    """
+    checkpointer, _ = get_persistence(path)
+    inbox = AgentInbox(graph, checkpointer.db, max_concurrency=max_concurrency)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Threads left waiting by other runners, or by a process that died mid-resume
+        await inbox.reconcile()
+        yield
+
+    app = FastAPI(title="Email Assistant Agent Inbox", lifespan=lifespan)
+    app.state.inbox = inbox
+
+    @app.post("/emails")
+    async def submit_email(email_input: dict):
+        return {"thread_id": await inbox.submit(email_input)}
+
+    @app.get("/interrupts")
+    async def list_interrupts(limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+        items, next_cursor = await inbox.pending.page(max(1, min(limit, MAX_PAGE_SIZE)), cursor)
+        return {"items": items, "next_cursor": next_cursor}
+
+    @app.post("/interrupts/respond")
+    async def respond_many(review: BulkReview):
+        results = await inbox.respond_many(
+            [(decision.thread_id, decision.model_dump(include={"type", "args"})) for decision in review.decisions]
+        )
+        return {"results": results}
+
+    @app.get("/interrupts/{thread_id}")
+    async def get_interrupt(thread_id: str):
+        item = await inbox.pending.get(thread_id)
+        if item is None:
+            raise HTTPException(status_code=404, detail=f"No pending interrupt for thread {thread_id}")
+        return item
+
+    @app.post("/interrupts/{thread_id}/respond")
+    async def respond(thread_id: str, response: ReviewResponse):
+        try:
+            await inbox.respond(thread_id, response.model_dump())
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"No pending interrupt for thread {thread_id}")
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        return {"thread_id": thread_id, "status": "resumed"}
+
+    @app.websocket("/ws")
+    async def events(websocket: WebSocket):
+        await websocket.accept()
+        queue = inbox.events.subscribe()
+        try:
+            await websocket.send_json({"event": "hello", "pending": await inbox.pending.count()})
+            while True:
+                event = await queue.get()
+                if event is None:
+                    await websocket.close(code=1013, reason="Too far behind; reload the pending list")
+                    return
+                await websocket.send_json(event)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            inbox.events.unsubscribe(queue)
+
+    return app
+
+def main():
+    import uvicorn
+
+    from email_assistant.email_assistant_hitl_memory_gmail import durable_email_assistants, warm_up
+
+    parser = argparse.ArgumentParser(description="Agent Inbox web service for the email assistant")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    args = parser.parse_args()
+
+    # Build tools and models before accepting requests, so the first email isn't slow
+    warm_up()
+    _, async_email_assistant = durable_email_assistants(args.db)
+    uvicorn.run(create_app(async_email_assistant, args.db, args.max_concurrency), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
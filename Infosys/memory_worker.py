@@ -0,0 +1,337 @@
+import atexit
+import concurrent.futures.thread
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from langchain_core.messages import convert_to_messages, messages_from_dict, messages_to_dict
+
+from email_assistant.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Wait this long after the last feedback event for a namespace before reflecting on it
+DEFAULT_DEBOUNCE_SECONDS = 5.0
+# ...but never hold a namespace's events longer than this
+DEFAULT_MAX_DELAY_SECONDS = 60.0
+# Pending events are journaled here so they survive a crash
+DEFAULT_JOURNAL_PATH = "memory_updates.sqlite"
+# A queue owns the events it journaled or claimed for this long, renewing the lease while it runs;
+# events whose owner stopped renewing (e.g. a crashed worker process) are claimed by another queue
+DEFAULT_LEASE_SECONDS = 60.0
+# Events whose update failed this many times are moved to the memory_dead_letters table
+DEFAULT_MAX_ATTEMPTS = 5
+
+def interpreter_exiting() -> bool:
+    """True once Python's exit has shut down thread pools, which happens before atexit handlers run."""
+    return getattr(concurrent.futures.thread, "_shutdown", False) or sys.is_finalizing()
+
+def journal_name(store) -> str:
+    """Journal name of a store: its database file for a SQLite store, so every store has its own events."""
+    path = getattr(getattr(store, "db", None), "path", None)
+    return f"sqlite:{os.path.abspath(path)}" if path else type(store).__name__
+
+class MemoryUpdateQueue:
+    """Background worker that applies memory updates off the HITL response path.
+
+    Feedback events are recorded per namespace and journaled to SQLite. A worker thread
+    waits until a namespace has been quiet for debounce_seconds (or max_delay_seconds have
+    passed since its first event), then runs update_fn once with all of that namespace's
+    events, so a burst of edits costs a single reflection call. Events are removed from the
+    journal only after the update succeeds.
+
+    Several processes can share a journal: each event is leased to one queue (the one that
+    journaled it), which renews the lease while it runs. Every lease_seconds / 3 a queue
+    claims the events of its journal name whose lease expired, so the events of a crashed
+    process are applied exactly once by whichever queue claims them, including at start.
+    After max_attempts failed updates an event is dead-lettered instead of retried forever.
+    """
+
+    def __init__(self, store, update_fn, name: str = "default", journal_path: str = DEFAULT_JOURNAL_PATH,
+                 debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS, max_delay_seconds: float = DEFAULT_MAX_DELAY_SECONDS,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.store = store
+        self.update_fn = update_fn
+        self.name = name
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.dead_lettered = 0
+        # Identifies this queue's leases in the journal
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._next_claim = 0.0
+
+        # namespace -> {"events": [(journal_id, messages, attempts)], "first_at": float, "last_at": float}
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        # While held (see hold), events are collected but not applied
+        self._holds = 0
+
+        self._journal = sqlite3.connect(journal_path, check_same_thread=False)
+        self._journal.execute("PRAGMA journal_mode=WAL")
+        self._journal.execute(
+            "CREATE TABLE IF NOT EXISTS memory_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, namespace TEXT NOT NULL, "
+            "messages TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        # Journals written before leases get the columns added
+        columns = {row[1] for row in self._journal.execute("PRAGMA table_info(memory_events)")}
+        for column, definition in [("owner", "TEXT"), ("lease_until", "REAL NOT NULL DEFAULT 0"), ("attempts", "INTEGER NOT NULL DEFAULT 0")]:
+            if column not in columns:
+                self._journal.execute(f"ALTER TABLE memory_events ADD COLUMN {column} {definition}")
+        self._journal.execute(
+            "CREATE TABLE IF NOT EXISTS memory_dead_letters ("
+            "id INTEGER PRIMARY KEY, queue TEXT NOT NULL, namespace TEXT NOT NULL, messages TEXT NOT NULL, "
+            "created_at REAL NOT NULL, attempts INTEGER NOT NULL, error TEXT NOT NULL, dead_at REAL NOT NULL)"
+        )
+        self._journal.commit()
+        with self._condition:
+            self._claim()
+
+        self._thread = threading.Thread(target=self._run, name=f"memory-updates-{name}", daemon=True)
+        self._thread.start()
+        # At exit the model calls' thread pools are already shut down, so pending events are
+        # released for the next start instead of applied
+        atexit.register(self.stop, flush=False)
+
+    def _claim(self):
+        """Renew this queue's leases and take over events whose owner stopped renewing theirs (call holding _condition)."""
+        now = time.time()
+        self._next_claim = now + self.lease_seconds / 3
+        self._journal.execute("BEGIN IMMEDIATE")
+        try:
+            self._journal.execute("UPDATE memory_events SET lease_until = ? WHERE owner = ?", (now + self.lease_seconds, self.owner))
+            rows = self._journal.execute(
+                "SELECT id, namespace, messages, created_at, attempts FROM memory_events "
+                "WHERE queue = ? AND (owner IS NULL OR owner != ?) AND lease_until < ? ORDER BY id",
+                (self.name, self.owner, now),
+            ).fetchall()
+            self._journal.executemany(
+                "UPDATE memory_events SET owner = ?, lease_until = ? WHERE id = ?",
+                [(self.owner, now + self.lease_seconds, row[0]) for row in rows],
+            )
+            self._journal.commit()
+        except BaseException:
+            self._journal.rollback()
+            raise
+        for journal_id, namespace, messages, created_at, attempts in rows:
+            self._add(tuple(json.loads(namespace)), journal_id, messages_from_dict(json.loads(messages)), created_at, attempts)
+        if rows:
+            logger.info(f"🧠 Recovered {len(rows)} pending memory update(s) for '{self.name}'", queue=self.name, recovered=len(rows))
+            self._condition.notify()
+
+    def _add(self, namespace, journal_id, messages, at, attempts=0):
+        entry = self._pending.setdefault(namespace, {"events": [], "first_at": at, "last_at": at})
+        entry["events"].append((journal_id, messages, attempts))
+        entry["last_at"] = max(entry["last_at"], at)
+
+    def enqueue(self, namespace, messages):
+        """Record a feedback event for a namespace and return immediately.
+
+        Args:
+            namespace: Tuple defining the memory namespace, e.g. ("email_assistant", "triage_preferences")
+            messages: List of messages (dicts or LangChain messages) to update the memory with
+        """
+        namespace = tuple(namespace)
+        messages = convert_to_messages(messages)
+        now = time.time()
+        with self._condition:
+            cursor = self._journal.execute(
+                "INSERT INTO memory_events (queue, namespace, messages, created_at, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, json.dumps(namespace), json.dumps(messages_to_dict(messages)), now, self.owner, now + self.lease_seconds),
+            )
+            self._journal.commit()
+            self._add(namespace, cursor.lastrowid, messages, now)
+            self._condition.notify()
+
+    def _due(self, now):
+        """Namespaces whose debounce window (or maximum delay) has passed."""
+        return [
+            namespace for namespace, entry in self._pending.items()
+            if now - entry["last_at"] >= self.debounce_seconds or now - entry["first_at"] >= self.max_delay_seconds
+        ]
+
+    def _next_deadline(self):
+        deadlines = [] if self._held() else [
+            min(entry["last_at"] + self.debounce_seconds, entry["first_at"] + self.max_delay_seconds) for entry in self._pending.values()
+        ]
+        # Leases are renewed (and expired ones claimed) even while nothing is pending
+        return min(deadlines + [self._next_claim])
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    self._claim_if_due()
+                    due = [] if self._held() else self._due(time.time())
+                    if due:
+                        break
+                    self._condition.wait(max(0.0, self._next_deadline() - time.time()))
+                if self._stopped:
+                    return
+                batches = [(namespace, self._pending.pop(namespace)["events"]) for namespace in due]
+            for namespace, events in batches:
+                # Slow updates must not let this queue's leases lapse
+                self._claim_if_due()
+                self._apply(namespace, events)
+
+    def _claim_if_due(self):
+        with self._condition:
+            if time.time() >= self._next_claim:
+                try:
+                    self._claim()
+                except sqlite3.Error as error:
+                    logger.warning(f"⚠️ Could not renew memory update leases: {error}", queue=self.name)
+
+    def _apply(self, namespace, events):
+        """Run one coalesced update for a namespace and drop its events from the journal."""
+        messages = []
+        if len(events) > 1:
+            messages.append({"role": "user", "content": f"The following {len(events)} pieces of user feedback were collected for this profile. Take all of them into account in a single update."})
+        for _, event_messages, _ in events:
+            messages.extend(event_messages)
+
+        try:
+            self.update_fn(self.store, namespace, messages)
+        except Exception as error:
+            if self._stopped or interpreter_exiting():
+                # Not an attempt: the events stay journaled, with their attempt count, for the next start
+                with self._condition:
+                    for journal_id, event_messages, attempts in events:
+                        self._add(namespace, journal_id, event_messages, time.time(), attempts)
+                logger.info(f"🧠 Memory update for {namespace} left for the next start: {error}", namespace=namespace, queue=self.name)
+                return
+            self._failed(namespace, events, error)
+            return
+
+        with self._condition:
+            self._journal.executemany("DELETE FROM memory_events WHERE id = ?", [(journal_id,) for journal_id, _, _ in events])
+            self._journal.commit()
+        logger.info(f"🧠 Updated memory {namespace} from {len(events)} feedback event(s)", namespace=namespace, events=len(events))
+
+    def _failed(self, namespace, events, error):
+        """Count a failed attempt: retry the events after the next debounce window, or dead-letter them after max_attempts."""
+        now = time.time()
+        retry = [(journal_id, event_messages, attempts + 1) for journal_id, event_messages, attempts in events]
+        dead = [journal_id for journal_id, _, attempts in retry if attempts >= self.max_attempts]
+        with self._condition:
+            self._journal.executemany("UPDATE memory_events SET attempts = ? WHERE id = ?", [(attempts, journal_id) for journal_id, _, attempts in retry])
+            if dead:
+                self._journal.executemany(
+                    "INSERT OR REPLACE INTO memory_dead_letters (id, queue, namespace, messages, created_at, attempts, error, dead_at) "
+                    "SELECT id, queue, namespace, messages, created_at, attempts, ?, ? FROM memory_events WHERE id = ?",
+                    [(repr(error), now, journal_id) for journal_id in dead],
+                )
+                self._journal.executemany("DELETE FROM memory_events WHERE id = ?", [(journal_id,) for journal_id in dead])
+            self._journal.commit()
+            # The rest stay journaled and are tried again after the next debounce window
+            for journal_id, event_messages, attempts in retry:
+                if journal_id not in dead:
+                    self._add(namespace, journal_id, event_messages, now, attempts)
+        if dead:
+            self.dead_lettered += len(dead)
+            logger.error(f"❌ Dead-lettered {len(dead)} memory update event(s) for {namespace} after {self.max_attempts} failed attempts: {error}",
+                         namespace=namespace, events=len(dead), queue=self.name)
+        if len(dead) < len(retry):
+            logger.warning(f"⚠️ Memory update for {namespace} failed, will retry: {error}", namespace=namespace)
+
+    def flush(self, namespace=None):
+        """Apply pending updates now, in the calling thread (all namespaces by default)."""
+        with self._condition:
+            namespaces = [tuple(namespace)] if namespace is not None else list(self._pending)
+            batches = [(ns, self._pending.pop(ns)["events"]) for ns in namespaces if ns in self._pending]
+        for ns, events in batches:
+            self._apply(ns, events)
+
+    def _held(self):
+        return self._holds > 0 or _global_holds > 0
+
+    @contextmanager
+    def hold(self):
+        """Collect feedback events without applying them until the block exits.
+
+        Used around bulk operations (e.g. resuming many reviewed threads at once), so every
+        namespace gets one reflection call for the whole batch instead of one per debounce window.
+        """
+        with self._condition:
+            self._holds += 1
+        try:
+            yield self
+        finally:
+            with self._condition:
+                self._holds -= 1
+                self._condition.notify()
+
+    def pending(self) -> dict:
+        """Number of pending events per namespace."""
+        with self._condition:
+            return {namespace: len(entry["events"]) for namespace, entry in self._pending.items()}
+
+    def stop(self, flush: bool = True):
+        """Stop the worker thread, applying what is pending first unless flush is False.
+
+        Events left pending are released, so the next queue to start on the journal applies them.
+        """
+        if self._stopped:
+            return
+        if flush:
+            self.flush()
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout=5)
+        with self._condition:
+            # Whatever is left is released, so another process claims it right away
+            self._journal.execute("UPDATE memory_events SET owner = NULL, lease_until = 0 WHERE owner = ?", (self.owner,))
+            self._journal.commit()
+
+# One queue per store, created on first use
+_queues = {}
+_queues_lock = threading.Lock()
+# Nesting depth of hold_memory_updates, which holds every queue (including ones created inside it)
+_global_holds = 0
+
+def get_memory_queue(store, update_fn, name: str | None = None, **kwargs) -> MemoryUpdateQueue:
+    """Return the background memory queue for a store, starting it on first use.
+
+    Start it when the process starts (see durable_email_assistants) so events a crashed
+    process left in the journal are applied without waiting for new feedback.
+
+    Args:
+        store: LangGraph BaseStore instance the updates are written to
+        update_fn: Function (store, namespace, messages) that runs the reflection LLM and saves the result
+        name: Journal name for this store; defaults to journal_name(store), so each database has its own events
+        **kwargs: Passed to MemoryUpdateQueue (journal_path, debounce_seconds, max_delay_seconds, lease_seconds, max_attempts)
+    """
+    with _queues_lock:
+        if id(store) not in _queues:
+            _queues[id(store)] = MemoryUpdateQueue(store, update_fn, name=name or journal_name(store), **kwargs)
+        return _queues[id(store)]
+
+@contextmanager
+def hold_memory_updates():
+    """Hold every memory queue for the duration of the block (see MemoryUpdateQueue.hold).
+
+    When the block exits, the events collected meanwhile are applied as one coalesced
+    update per namespace once their debounce window has passed.
+    """
+    global _global_holds
+    with _queues_lock:
+        _global_holds += 1
+    try:
+        yield
+    finally:
+        with _queues_lock:
+            _global_holds -= 1
+            queues = list(_queues.values())
+        for queue in queues:
+            with queue._condition:
+                queue._condition.notify()
@@ -0,0 +1,169 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+
+from email_assistant.resilience import ResilientModel
+from email_assistant.telemetry import telemetry_callbacks
+
+# Chat models used by the assistants, by role
+MODEL_SPECS = {
+    "router": {"model": "openai:gpt-4.1", "temperature": 0.0},
+    # First triage pass (see tiered_triage); unsure decisions escalate to "router"
+    "router_fast": {"model": "openai:gpt-4.1-mini", "temperature": 0.0},
+    "agent": {"model": "openai:gpt-4.1", "temperature": 0.0},
+    "memory_updater": {"model": "openai:gpt-4.1", "temperature": 0.0},
+    "summarizer": {"model": "openai:gpt-4.1-mini", "temperature": 0.0},
+}
+
+# Embedding models, by role
+EMBEDDING_SPECS = {
+    # Past emails in episodic memory (see episodic_memory)
+    "episodic_memory": {"model": "openai:text-embedding-3-small", "dimensions": 256},
+}
+
+# Connection pool limits shared by every OpenAI model in the process
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+_lock = threading.RLock()
+_env_loaded = False
+_http_clients = {}
+_models = {}
+_bound_models = {}
+_embeddings = {}
+
+def load_environment(path: str = ".env"):
+    """Load API keys from the .env file once per process, on first use rather than at import."""
+    global _env_loaded
+    with _lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            _env_loaded = True
+
+class LoopLocalTransport(httpx.AsyncBaseTransport):
+    """Async transport keeping one connection pool per event loop.
+
+    Pooled connections belong to the loop that opened them, so a single pool reused by
+    separate asyncio.run calls (e.g. repeated run_emails_sync) fails with "Event loop is
+    closed". The models keep one AsyncClient for the process; its requests go to the pool
+    of the loop they run on, and a loop's pool is dropped with the loop.
+    """
+
+    def __init__(self, limits: httpx.Limits = HTTP_LIMITS):
+        self.limits = limits
+        self._pools = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _pool(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            pool = self._pools.get(loop)
+            if pool is None:
+                pool = self._pools[loop] = httpx.AsyncHTTPTransport(limits=self.limits)
+            return pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._pool().handle_async_request(request)
+
+    async def aclose(self):
+        """Close the pool of the running loop (the others belong to loops that cannot run them)."""
+        with self._lock:
+            pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool.aclose()
+
+def http_clients():
+    """Process-wide pooled httpx clients (sync and async), created on first use.
+
+    The async client keeps a connection pool per event loop (see LoopLocalTransport).
+    """
+    with _lock:
+        if not _http_clients:
+            _http_clients["sync"] = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+            _http_clients["async"] = httpx.AsyncClient(transport=LoopLocalTransport(), timeout=HTTP_TIMEOUT)
+        return _http_clients["sync"], _http_clients["async"]
+
+def _spec_key(spec: dict):
+    return tuple(sorted(spec.items()))
+
+def get_model(role: str):
+    """Return the chat model for a role, building it once per process.
+
+    Roles with identical specs share one model instance, and every OpenAI model shares
+    the pooled HTTP clients, so connections are reused across router, agent and memory calls.
+    """
+    spec = MODEL_SPECS[role]
+    key = _spec_key(spec)
+    with _lock:
+        if key not in _models:
+            load_environment()
+            # langchain's model integrations are slow to import, so only when a model is first built
+            from langchain.chat_models import init_chat_model
+            kwargs = dict(spec)
+            model = kwargs.pop("model")
+            if model.startswith("openai:"):
+                kwargs["http_client"], kwargs["http_async_client"] = http_clients()
+                # Retries, deadlines and the circuit breaker are handled by the resilience layer
+                kwargs.setdefault("max_retries", 0)
+            # Every call is recorded by the telemetry callbacks (latency, tokens, cost)
+            _models[key] = init_chat_model(model, callbacks=[telemetry_callbacks], **kwargs)
+        return _models[key]
+
+def register_model(role: str, model):
+    """Use a prebuilt chat model for a role instead of building one from MODEL_SPECS.
+
+    Meant for benchmarks and tests (e.g. a fake model that replays recorded outputs). Roles
+    with identical specs share the model; the assistants look their models up on every call,
+    so it takes effect from the next model call.
+    """
+    key = _spec_key(MODEL_SPECS[role])
+    with _lock:
+        _models[key] = model
+        # Bindings made from the previous model are rebuilt on next use
+        for bound_key in [bound_key for bound_key in _bound_models if bound_key[1] == key]:
+            del _bound_models[bound_key]
+
+def get_structured_model(role: str, schema):
+    """Return the role's model bound to a structured output schema, built once per (role, schema).
+
+    Its invoke / ainvoke follow the role's call policy in resilience.CALL_POLICIES.
+    """
+    key = ("structured", _spec_key(MODEL_SPECS[role]), role, schema)
+    with _lock:
+        if key not in _bound_models:
+            _bound_models[key] = ResilientModel(get_model(role).with_structured_output(schema), role)
+        return _bound_models[key]
+
+def get_tool_model(role: str, tools, tool_choice=None):
+    """Return the role's model bound to tools, built once per (role, tool names, tool_choice).
+
+    Its invoke / ainvoke follow the role's call policy in resilience.CALL_POLICIES.
+    """
+    key = ("tools", _spec_key(MODEL_SPECS[role]), role, tuple(tool.name for tool in tools), tool_choice)
+    with _lock:
+        if key not in _bound_models:
+            _bound_models[key] = ResilientModel(get_model(role).bind_tools(tools, tool_choice=tool_choice), role)
+        return _bound_models[key]
+
+def get_embeddings(role: str):
+    """Return the embedding model for a role, building it once per process on the pooled HTTP clients."""
+    with _lock:
+        if role not in _embeddings:
+            load_environment()
+            kwargs = dict(EMBEDDING_SPECS[role])
+            provider, _, model = kwargs.pop("model").partition(":")
+            if provider != "openai":
+                raise ValueError(f"Unsupported embedding provider {provider!r} for {role}; register the model with register_embeddings")
+            from langchain_openai import OpenAIEmbeddings
+            http_client, http_async_client = http_clients()
+            # Retries are handled by the resilience layer
+            _embeddings[role] = OpenAIEmbeddings(model=model, http_client=http_client, http_async_client=http_async_client, max_retries=0, **kwargs)
+        return _embeddings[role]
+
+def register_embeddings(role: str, embeddings):
+    """Use a prebuilt embedding model for a role (e.g. episodic_memory.HashingEmbeddings in benchmarks)."""
+    with _lock:
+        _embeddings[role] = embeddings
@@ -0,0 +1,262 @@
+import atexit
+import json
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import cache
+from email.utils import parseaddr
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves from several processes are not serialized
+    fcntl = None
+
+from email_assistant.schemas import RouterSchema
+from email_assistant.telemetry import get_logger, record_pre_triage
+
+logger = get_logger(__name__)
+
+# Subjects that are safe to classify without the LLM
+DEFAULT_IGNORE_SUBJECTS = [
+    r"\bnewsletter\b",
+    r"\bweekly digest\b|\bdaily digest\b",
+    r"\bwebinar\b",
+    r"\b\d{1,2}% off\b|\bsale ends\b|\blimited time offer\b",
+    r"^(automatic reply|auto-reply|out of office)\b",
+]
+DEFAULT_NOTIFY_SUBJECTS = [
+    r"\bsecurity alert\b|\bnew sign-in\b",
+    r"\bpassword (was )?(changed|reset)\b",
+    r"\b(invoice|receipt|payment received)\b",
+    r"\b(build|deploy(ment)?) (failed|succeeded|passed)\b",
+]
+
+# Learned sender statistics are trusted only with enough samples and near-unanimous agreement
+DEFAULT_MIN_SENDER_SAMPLES = 5
+DEFAULT_MIN_SENDER_AGREEMENT = 0.95
+
+# Learned sender statistics are saved here (per tenant, see stats_path_for) every SAVE_EVERY
+# classifications learned and at exit, so they survive a restart
+DEFAULT_STATS_PATH = "pre_triage_stats.json"
+SAVE_EVERY = 50
+
+def stats_path_for(tenant_id: str | None) -> str:
+    """File of a tenant's learned sender statistics (DEFAULT_STATS_PATH for the default tenant)."""
+    if tenant_id is None:
+        return DEFAULT_STATS_PATH
+    root, extension = os.path.splitext(DEFAULT_STATS_PATH)
+    return f"{root}-{tenant_id}{extension}"
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive lock on path + ".lock", so worker processes sharing the file save one at a time."""
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def sender_address(author: str) -> str:
+    """Lower-cased email address from a From header such as 'Alice <alice@company.com>'."""
+    return parseaddr(author)[1].lower() or author.strip().lower()
+
+def compile_patterns(patterns):
+    """Compile a list of regexes into one case-insensitive alternation."""
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.I) if patterns else None
+
+class PreTriage:
+    """Deterministic pre-classifier that runs before the triage LLM.
+
+    Obvious mail is decided from headers alone: deny-listed senders, bulk or mailing-list
+    headers, known subject patterns and senders whose past classifications are near-unanimous.
+    Only ignore / notify are ever decided here; anything else (and every allow-listed sender)
+    falls through to the LLM. stats() reports how many router calls were skipped, and every
+    decision is counted in telemetry (email_assistant_pre_triage_total) by rule.
+
+    With a stats_path, learned sender statistics are loaded at start and saved in the
+    background every save_every classifications learned and at exit. A save adds this
+    process's new counts to the file under a file lock, so worker processes sharing the file
+    merge their statistics instead of overwriting each other's.
+    """
+
+    def __init__(self, allow_senders=(), deny_senders=(), ignore_subjects=DEFAULT_IGNORE_SUBJECTS, notify_subjects=DEFAULT_NOTIFY_SUBJECTS,
+                 min_sender_samples: int = DEFAULT_MIN_SENDER_SAMPLES, min_sender_agreement: float = DEFAULT_MIN_SENDER_AGREEMENT, stats_path: str | None = None, save_every: int = SAVE_EVERY):
+        # Entries are full addresses ("ceo@company.com") or domains ("@company.com")
+        self.allow_senders = {sender.lower() for sender in allow_senders}
+        self.deny_senders = {sender.lower() for sender in deny_senders}
+        self.ignore_subjects = compile_patterns(ignore_subjects)
+        self.notify_subjects = compile_patterns(notify_subjects)
+        self.min_sender_samples = min_sender_samples
+        self.min_sender_agreement = min_sender_agreement
+        self.stats_path = stats_path
+        self.save_every = save_every
+
+        self.seen = 0
+        self.skipped = Counter()
+        self._sender_stats = {}
+        # Counts learned since the last save, added to the file by the next one
+        self._unsaved = {}
+        self._unsaved_count = 0
+        self._saving = False
+        self._lock = threading.Lock()
+        if stats_path:
+            self._sender_stats = self._read()
+            atexit.register(self.save)
+
+    def _read(self) -> dict:
+        if not os.path.exists(self.stats_path):
+            return {}
+        try:
+            with open(self.stats_path) as f:
+                return {sender: Counter(counts) for sender, counts in json.load(f).items()}
+        except (OSError, ValueError) as error:
+            logger.warning(f"⚠️ Could not read pre-triage sender statistics from {self.stats_path}: {error}", path=self.stats_path)
+            return {}
+
+    def _listed(self, address, senders):
+        return address in senders or "@" + address.rsplit("@", 1)[-1] in senders
+
+    def _rule(self, author, subject, headers):
+        """Return (classification, rule name) if a rule is confident, otherwise None."""
+        address = sender_address(author)
+        headers = {name.lower(): value for name, value in (headers or {}).items()}
+
+        # Allow-listed senders always get the full LLM treatment
+        if self._listed(address, self.allow_senders):
+            return None
+        if self._listed(address, self.deny_senders):
+            return "ignore", "deny_list"
+
+        # Bulk mail and mailing lists
+        if headers.get("precedence", "").strip().lower() in ("bulk", "junk", "list") or "list-unsubscribe" in headers:
+            return "ignore", "bulk_headers"
+        if headers.get("auto-submitted", "no").strip().lower() not in ("", "no"):
+            return "ignore", "auto_submitted"
+
+        # Subject patterns
+        if self.notify_subjects and self.notify_subjects.search(subject):
+            return "notify", "notify_subject"
+        if self.ignore_subjects and self.ignore_subjects.search(subject):
+            return "ignore", "ignore_subject"
+
+        # What this sender's mail has been classified as before
+        with self._lock:
+            counts = self._sender_stats.get(address)
+            if counts:
+                total = sum(counts.values())
+                classification, count = counts.most_common(1)[0]
+                if classification != "respond" and total >= self.min_sender_samples and count / total >= self.min_sender_agreement:
+                    return classification, "sender_history"
+        return None
+
+    def classify(self, author: str, subject: str, headers: dict | None = None):
+        """Classify an email without the LLM when a rule is confident.
+
+        Args:
+            author: From header of the email
+            subject: Subject of the email
+            headers: Optional extra headers (List-Unsubscribe, Precedence, Auto-Submitted, ...)
+
+        Returns:
+            RouterSchema | None: The decision, or None to fall through to the triage LLM
+        """
+        decision = self._rule(author, subject, headers)
+        with self._lock:
+            self.seen += 1
+            if decision is not None:
+                self.skipped[decision[1]] += 1
+        record_pre_triage(decision[1] if decision is not None else None)
+        if decision is None:
+            return None
+        classification, rule = decision
+        return RouterSchema(reasoning=f"Pre-triage rule '{rule}' matched.", classification=classification)
+
+    def signal(self, author: str, subject: str, headers: dict | None = None) -> str | None:
+        """Likely classification of an email, for scheduling: a rule's decision, or "respond" for
+        senders whose mail is usually answered. Not counted in the skip-rate stats."""
+        decision = self._rule(author, subject, headers)
+        if decision is not None:
+            return decision[0]
+        with self._lock:
+            counts = self._sender_stats.get(sender_address(author))
+            if counts and sum(counts.values()) >= self.min_sender_samples and counts.most_common(1)[0][0] == "respond":
+                return "respond"
+        return None
+
+    def learn(self, author: str, classification: str):
+        """Record how an email from this sender was classified (by the LLM or by the user)."""
+        address = sender_address(author)
+        with self._lock:
+            self._sender_stats.setdefault(address, Counter())[classification] += 1
+            if not self.stats_path:
+                return
+            self._unsaved.setdefault(address, Counter())[classification] += 1
+            self._unsaved_count += 1
+            save = self._unsaved_count >= self.save_every and not self._saving
+            if save:
+                self._saving = True
+        if save:
+            # File I/O stays off the triage path
+            threading.Thread(target=self.save, name="pre-triage-save", daemon=True).start()
+
+    def save(self):
+        """Add the sender statistics learned since the last save to stats_path, if set.
+
+        The merged file (including what other processes saved meanwhile) becomes this
+        process's statistics, so every worker learns from the others' emails too.
+        """
+        if not self.stats_path:
+            return
+        with self._lock:
+            unsaved, self._unsaved, self._unsaved_count = self._unsaved, {}, 0
+            if not unsaved:
+                self._saving = False
+                return
+            self._saving = True
+        try:
+            with _file_lock(self.stats_path):
+                data = self._read()
+                for sender, counts in unsaved.items():
+                    data.setdefault(sender, Counter()).update(counts)
+                tmp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({sender: dict(counts) for sender, counts in data.items()}, f)
+                os.replace(tmp_path, self.stats_path)
+        except OSError as error:
+            logger.warning(f"⚠️ Could not save pre-triage sender statistics to {self.stats_path}: {error}", path=self.stats_path)
+            with self._lock:
+                for sender, counts in unsaved.items():
+                    self._unsaved.setdefault(sender, Counter()).update(counts)
+                    self._unsaved_count += sum(counts.values())
+                self._saving = False
+            return
+        with self._lock:
+            # Classifications learned while saving are in neither the file nor data yet
+            for sender, counts in self._unsaved.items():
+                data.setdefault(sender, Counter()).update(counts)
+            self._sender_stats = data
+            self._saving = False
+
+    def stats(self) -> dict:
+        """Skip-rate metrics: emails seen, router calls skipped, and skips per rule."""
+        with self._lock:
+            skipped = sum(self.skipped.values())
+            return {
+                "seen": self.seen,
+                "skipped": skipped,
+                "skip_rate": skipped / self.seen if self.seen else 0.0,
+                "by_rule": dict(self.skipped),
+            }
+
+# Shared pre-triage used by all assistant graphs; add allow / deny lists here. Built on first use
+# rather than at import, since it reads the learned sender statistics and registers their exit save
+@cache
+def get_pre_triage() -> PreTriage:
+    """Process-wide PreTriage of the default tenant, with its statistics in DEFAULT_STATS_PATH."""
+    return PreTriage(stats_path=DEFAULT_STATS_PATH)
@@ -0,0 +1,350 @@
+import atexit
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+from email_assistant.model_registry import get_structured_model
+from email_assistant.prompt_cache import prompt_cache
+from email_assistant.prompts import PREFERENCE_RULES_UPDATE_INSTRUCTIONS
+from email_assistant.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Store key of a namespace's rules; the free-text profile it replaces was kept under "user_preferences"
+RULES_KEY = "preference_rules"
+LEGACY_KEY = "user_preferences"
+# Store key of a namespace's rule hit counts, kept apart so saving them never races a rule update
+HITS_KEY = "preference_rule_hits"
+# Rules rendered into a prompt, and rules shown to the updater, at most (general rules first, then by hits)
+MAX_PROMPT_RULES = 12
+MAX_UPDATE_RULES = 40
+# Rules read from the store are reused this long: updates made in this process apply at once,
+# updates made by other processes (e.g. fleet workers) within this time
+DEFAULT_CACHE_SECONDS = 30.0
+# Hit counts are saved to the store after this many counted emails, and at exit
+SAVE_HITS_EVERY = 100
+# Emails remembered per process, so a rule's hit is counted once per email rather than once per prompt
+MAX_COUNTED_EMAILS = 10000
+
+WORD = re.compile(r"[a-z0-9@._+-]+")
+
+class RuleOperation(BaseModel):
+    """One change to the preference rules."""
+
+    op: Literal["add", "modify", "delete"] = Field(description="add a new rule, modify an existing rule, or delete one")
+    rule_id: str | None = Field(default=None, description="ID of the rule to modify or delete; leave empty for add")
+    text: str | None = Field(default=None, description="Full text of the new or modified rule, one self-contained instruction")
+    keywords: list[str] = Field(
+        default_factory=list,
+        description="Lowercase sender addresses, domains or topic words the rule is about; "
+        "leave empty for a rule that applies to every email",
+    )
+
+class RuleUpdate(BaseModel):
+    """Changes to make to the preference rules after user feedback (empty if nothing should change)."""
+
+    operations: list[RuleOperation] = Field(default_factory=list)
+
+def split_profile(profile: str) -> list[str]:
+    """Rules of a free-text profile: one per non-empty line, without list markers."""
+    lines = [line.strip().lstrip("-*•").strip() for line in (profile or "").splitlines()]
+    return [line for line in lines if line]
+
+def email_terms(email_inputs) -> tuple[set, str]:
+    """Words (addresses and domains included) and lowercase text of emails, for matching rule keywords."""
+    text = " ".join(
+        f"{email_input.get('from') or email_input.get('author', '')} {email_input.get('subject', '')} "
+        f"{email_input.get('body') or email_input.get('email_thread', '')}"
+        for email_input in email_inputs
+    ).lower()
+    words = set(WORD.findall(text))
+    # Senders match on their domain too, written with or without the "@"
+    domains = {word.rsplit("@", 1)[-1] for word in words if "@" in word}
+    words.update(domains)
+    words.update("@" + domain for domain in domains)
+    return words, text
+
+def matches(rule: dict, words: set, text: str) -> bool:
+    """Whether a rule applies: it has no keywords, or one of them occurs in the emails."""
+    return not rule["keywords"] or any(keyword in words or (" " in keyword and keyword in text) for keyword in rule["keywords"])
+
+def render_rules(rules: list[dict], with_ids: bool = False) -> str:
+    """Rules as a bulleted list for a prompt (with their IDs and keywords for the updater)."""
+    if with_ids:
+        return "\n".join(
+            f"- [{rule['id']}] {rule['text']}" + (f" (keywords: {', '.join(rule['keywords'])})" if rule["keywords"] else "")
+            for rule in rules
+        ) or "(no rules yet)"
+    return "\n".join(f"- {rule['text']}" for rule in rules)
+
+def revision(document: dict) -> int:
+    """Revision of a rules document: how many updates changed it (0 before the first one)."""
+    return document.get("revision", 0)
+
+def _content(message) -> str:
+    """Text of a message given as a dict or a LangChain message."""
+    content = message.content if hasattr(message, "content") else message.get("content", "")
+    return content if isinstance(content, str) else str(content)
+
+def _email_key(email_input: dict) -> str:
+    """Identity of an email for counting hits: its id, or its sender and subject."""
+    return str(email_input.get("id") or (email_input.get("from") or email_input.get("author", ""), email_input.get("subject", "")))
+
+def _keywords(keywords) -> list[str]:
+    return sorted({keyword.strip().lower() for keyword in keywords if keyword.strip()})
+
+def _new_rule(rule_id: str, text: str, keywords, source: str, now: float) -> dict:
+    return {
+        "id": rule_id,
+        "text": text.strip(),
+        "keywords": _keywords(keywords),
+        "source": source,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+class RuleBook:
+    """Preference memory kept as individual rules instead of one free-text profile.
+
+    Each namespace's rules live in one store item: an ID, the rule text, optional keywords,
+    provenance (default, migrated from the old profile, or the feedback that created it) and
+    timestamps. Prompts render only the rules relevant to the email at hand:
+    rules without keywords always, keyword rules when a keyword occurs in the email. The
+    updater sees only the rules relevant to the feedback and answers with add, modify and
+    delete operations, which are applied to the stored rules (read again after the call, so
+    concurrent updates from other processes are kept), so untouched rules can never be
+    dropped and the update call stays small as the memory grows.
+
+    Rules are cached per process until the namespace's prompt_cache version changes or
+    cache_seconds pass, so updates from other processes are picked up too. A rule's hits
+    (emails it was rendered for, counted once per email) decide which keyword rules are
+    kept when more apply than fit a prompt. They are counted in memory and added to the
+    namespace's hit counts in the store every save_every emails and at exit.
+    """
+
+    def __init__(self, max_prompt_rules: int = MAX_PROMPT_RULES, max_update_rules: int = MAX_UPDATE_RULES,
+                 cache_seconds: float = DEFAULT_CACHE_SECONDS, save_every: int = SAVE_HITS_EVERY):
+        self.max_prompt_rules = max_prompt_rules
+        self.max_update_rules = max_update_rules
+        self.cache_seconds = cache_seconds
+        self.save_every = save_every
+        # (id(store), namespace) -> (prompt_cache version, loaded at, rules document, saved hit counts)
+        self._documents = {}
+        # (id(store), namespace) -> hits counted since the last save, by rule id
+        self._hits = {}
+        self._stores = {}
+        # (id(store), namespace, email key) of the emails whose hits were counted
+        self._counted = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._exit_save = False
+
+    # Loading: the stored document, or one seeded from the old profile or the default preferences
+    def _seed(self, legacy, default_content) -> dict:
+        profile, source = (legacy.value, "migrated") if legacy else (default_content, "default")
+        if isinstance(profile, dict):
+            # Stores that only keep dict values hold the profile text under its fields
+            profile = "\n".join(str(value) for value in profile.values())
+        now = time.time()
+        rules = [_new_rule(f"r{index}", text, [], source, now) for index, text in enumerate(split_profile(profile), 1)]
+        return {"rules": {rule["id"]: rule for rule in rules}, "next_id": len(rules) + 1}
+
+    def _cached(self, store, namespace):
+        with self._lock:
+            cached = self._documents.get((id(store), namespace))
+        if cached and cached[0] == prompt_cache.version(store, namespace) and time.monotonic() - cached[1] < self.cache_seconds:
+            return cached[2]
+        return None
+
+    def _remember(self, store, namespace, document, saved_hits=None):
+        with self._lock:
+            if saved_hits is None:
+                # An update changes the rules, not their hit counts
+                saved_hits = self._documents.get((id(store), namespace), (None, None, None, {}))[3]
+            self._documents[(id(store), namespace)] = (prompt_cache.version(store, namespace), time.monotonic(), document, saved_hits)
+
+    def load(self, store, namespace, default_content=None) -> dict:
+        """Rules document of a namespace, created from the old profile or default_content on first use."""
+        namespace = tuple(namespace)
+        document = self._cached(store, namespace)
+        if document is None:
+            item = store.get(namespace, RULES_KEY)
+            if item:
+                document = item.value
+            else:
+                document = self._seed(store.get(namespace, LEGACY_KEY), default_content)
+                store.put(namespace, RULES_KEY, document)
+            hits = store.get(namespace, HITS_KEY)
+            self._remember(store, namespace, document, hits.value["hits"] if hits else {})
+        return document
+
+    async def aload(self, store, namespace, default_content=None) -> dict:
+        """Async variant of load, using the store's async API."""
+        namespace = tuple(namespace)
+        document = self._cached(store, namespace)
+        if document is None:
+            item = await store.aget(namespace, RULES_KEY)
+            if item:
+                document = item.value
+            else:
+                document = self._seed(await store.aget(namespace, LEGACY_KEY), default_content)
+                await store.aput(namespace, RULES_KEY, document)
+            hits = await store.aget(namespace, HITS_KEY)
+            self._remember(store, namespace, document, hits.value["hits"] if hits else {})
+        return document
+
+    # Selection
+    def _hit_counts(self, store, namespace) -> tuple:
+        """Hit counts of a namespace's rules: saved ones and those counted since."""
+        with self._lock:
+            cached = self._documents.get((id(store), namespace))
+            return (cached[3] if cached else {}, dict(self._hits.get((id(store), namespace), {})))
+
+    def relevant(self, document: dict, email_inputs, limit: int, hits=()) -> list[dict]:
+        """Rules that apply to the emails: general rules first, then keyword rules by hits (at most limit).
+
+        Args:
+            hits: Mappings of rule id to hit count, added up (see _hit_counts)
+        """
+        words, text = email_terms(email_inputs)
+        rules = [rule for rule in document["rules"].values() if matches(rule, words, text)]
+        # Over the limit, general rules are kept first, then the keyword rules with the most hits
+        # (rules created before hit counts were kept apart carry their old count as "hits")
+        if len(rules) > limit:
+            rules = sorted(rules, key=lambda rule: (
+                bool(rule["keywords"]), -(rule.get("hits", 0) + sum(counts.get(rule["id"], 0) for counts in hits)),
+            ))[:limit]
+        # Rendered in a stable order (general rules, then by ID), so the same email always gets the same prompt
+        return sorted(rules, key=lambda rule: (bool(rule["keywords"]), int(rule["id"][1:])))
+
+    def select(self, store, namespace, document: dict, email_inputs=()) -> list[dict]:
+        """Rules rendered into a prompt for these emails; counts a hit for each, once per email."""
+        namespace = tuple(namespace)
+        rules = self.relevant(document, email_inputs, self.max_prompt_rules, self._hit_counts(store, namespace))
+        self._count_hits(store, namespace, rules, email_inputs)
+        return rules
+
+    def _count_hits(self, store, namespace, rules, email_inputs):
+        key = (id(store), namespace)
+        with self._lock:
+            # Every prompt of an email's run (triage, each agent turn) selects rules; only the first counts
+            new = [email_key for email_key in (key + (_email_key(email_input),) for email_input in email_inputs) if email_key not in self._counted]
+            if not new or not rules:
+                return
+            for email_key in new:
+                self._counted[email_key] = True
+            while len(self._counted) > MAX_COUNTED_EMAILS:
+                self._counted.popitem(last=False)
+            self._hits.setdefault(key, Counter()).update({rule["id"]: len(new) for rule in rules})
+            self._stores[id(store)] = store
+            self._unsaved += len(new)
+            save = self._unsaved >= self.save_every
+            if save:
+                self._unsaved = 0
+            if not self._exit_save:
+                # Registered on first use, after the store, so it runs before the store closes at exit
+                self._exit_save = True
+                atexit.register(self.save_hits)
+        if save:
+            # Off the prompt path
+            threading.Thread(target=self.save_hits, name="preference-rule-hits", daemon=True).start()
+
+    def save_hits(self):
+        """Add the hits counted in this process to the namespaces' hit counts in the store."""
+        with self._save_lock:
+            with self._lock:
+                pending, self._hits = self._hits, {}
+                stores = dict(self._stores)
+            for (store_id, namespace), counts in pending.items():
+                try:
+                    item = stores[store_id].get(namespace, HITS_KEY)
+                    saved = Counter(item.value["hits"] if item else {})
+                    saved.update(counts)
+                    stores[store_id].put(namespace, HITS_KEY, {"hits": dict(saved)})
+                except Exception as error:
+                    logger.warning(f"⚠️ Could not save preference rule hits of {namespace}: {error}", namespace=namespace)
+                    with self._lock:
+                        self._hits.setdefault((store_id, namespace), Counter()).update(counts)
+                    continue
+                with self._lock:
+                    cached = self._documents.get((store_id, namespace))
+                    if cached:
+                        self._documents[(store_id, namespace)] = cached[:3] + (dict(saved),)
+
+    # Updating
+    def apply(self, document: dict, operations, provenance: str = "") -> tuple[dict, int]:
+        """New rules document with the operations applied, and how many of them changed something."""
+        rules = {rule_id: dict(rule) for rule_id, rule in document["rules"].items()}
+        next_id = document["next_id"]
+        now, applied = time.time(), 0
+        for operation in operations:
+            if operation.op == "add" and operation.text:
+                rule = _new_rule(f"r{next_id}", operation.text, operation.keywords, "feedback", now)
+                rule["provenance"] = provenance
+                rules[rule["id"]] = rule
+                next_id += 1
+            elif operation.op == "modify" and operation.rule_id in rules and operation.text:
+                rule = rules[operation.rule_id]
+                rule.update(text=operation.text.strip(), updated_at=now, provenance=provenance)
+                # Keywords are kept unless the updater gives new ones
+                if operation.keywords:
+                    rule["keywords"] = _keywords(operation.keywords)
+            elif operation.op == "delete" and operation.rule_id in rules:
+                del rules[operation.rule_id]
+            else:
+                logger.warning(f"⚠️ Skipped invalid preference rule operation {operation.op} {operation.rule_id!r}", op=operation.op, rule_id=operation.rule_id)
+                continue
+            applied += 1
+        # Stored with the rules, so every process can tell they changed (see triage_cache)
+        return {"rules": rules, "next_id": next_id, "revision": revision(document) + 1}, applied
+
+    def _update_messages(self, store, namespace, document, messages):
+        # Only the rules the feedback is about are shown to the updater
+        feedback = [{"body": _content(message)} for message in messages]
+        shown = self.relevant(document, feedback, self.max_update_rules, self._hit_counts(store, namespace))
+        return [
+            {"role": "system", "content": PREFERENCE_RULES_UPDATE_INSTRUCTIONS.format(rules=render_rules(shown, with_ids=True), namespace=namespace)},
+        ] + messages
+
+    def update(self, store, namespace, messages, default_content=None) -> int:
+        """Ask the memory updater for rule operations and apply them; returns how many were applied."""
+        namespace = tuple(namespace)
+        item = store.get(namespace, RULES_KEY)
+        document = item.value if item else self.load(store, namespace, default_content)
+        llm = get_structured_model("memory_updater", RuleUpdate)
+        result = llm.invoke(self._update_messages(store, namespace, document, messages))
+        # The call takes seconds, in which another process (e.g. a fleet worker's memory queue) may
+        # have changed the rules; the operations go to the rules as stored now, so its changes are kept
+        item = store.get(namespace, RULES_KEY)
+        document, applied = self.apply(item.value if item else document, result.operations, _content(messages[-1])[:200] if messages else "")
+        if applied:
+            store.put(namespace, RULES_KEY, document)
+            # Prompts built from the old rules are now stale
+            prompt_cache.bump(store, namespace)
+            self._remember(store, namespace, document)
+        logger.info(f"🧠 Applied {applied} preference rule operation(s) to {namespace}", namespace=namespace, applied=applied, rules=len(document["rules"]))
+        return applied
+
+    async def aupdate(self, store, namespace, messages, default_content=None) -> int:
+        """Async variant of update, using ainvoke and the store's async API."""
+        namespace = tuple(namespace)
+        item = await store.aget(namespace, RULES_KEY)
+        document = item.value if item else await self.aload(store, namespace, default_content)
+        llm = get_structured_model("memory_updater", RuleUpdate)
+        result = await llm.ainvoke(self._update_messages(store, namespace, document, messages))
+        item = await store.aget(namespace, RULES_KEY)
+        document, applied = self.apply(item.value if item else document, result.operations, _content(messages[-1])[:200] if messages else "")
+        if applied:
+            await store.aput(namespace, RULES_KEY, document)
+            prompt_cache.bump(store, namespace)
+            self._remember(store, namespace, document)
+        logger.info(f"🧠 Applied {applied} preference rule operation(s) to {namespace}", namespace=namespace, applied=applied, rules=len(document["rules"]))
+        return applied
+
+# Shared by every assistant with preference memory
+rulebook = RuleBook()
@@ -0,0 +1,238 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from email_assistant.async_runner import DEFAULT_MAX_CONCURRENCY
+from email_assistant.pre_triage import sender_address
+from email_assistant.telemetry import record_queue_depth, record_queue_wait
+from email_assistant.tenants import current_tenant
+
+# Priority lanes, most urgent first. sla_seconds is the longest an email of the lane should
+# wait for a slot; an email past it is served before any email that is not (aging), so a
+# steady stream of urgent mail never starves the bulk lane.
+LANES = {
+    "urgent": {"sla_seconds": 30.0},
+    "normal": {"sla_seconds": 300.0},
+    "bulk": {"sla_seconds": 1800.0},
+}
+
+# Run config key (under "configurable") that forces an email into a lane
+PRIORITY_KEY = "priority"
+
+def email_lane(email_input: dict, config: dict | None = None, lanes: dict = LANES) -> str:
+    """Lane of an email: the run config's "priority" if set, otherwise classify_lane."""
+    lane = (config or {}).get("configurable", {}).get(PRIORITY_KEY)
+    if lane is None:
+        return classify_lane(email_input, current_tenant(config))
+    if lane not in lanes:
+        raise ValueError(f"Unknown priority lane {lane!r}; expected one of {list(lanes)}")
+    return lane
+
+def classify_lane(email_input: dict, tenant) -> str:
+    """Lane of an email from its sender and the tenant's pre-triage signals.
+
+    VIP senders and senders whose mail is usually answered go to "urgent", mail pre-triage
+    would ignore (newsletters, bulk and automated mail) to "bulk", everything else to "normal".
+    """
+    # parse_gmail and parse_email shapes
+    author = email_input.get("from") or email_input.get("author", "")
+    address = sender_address(author)
+    if address in tenant.vip_senders or "@" + address.rsplit("@", 1)[-1] in tenant.vip_senders:
+        return "urgent"
+    signal = tenant.pre_triage.signal(author, email_input.get("subject", ""), email_input.get("headers"))
+    if signal == "respond":
+        return "urgent"
+    if signal == "ignore":
+        return "bulk"
+    return "normal"
+
+class _Entry:
+    """One email waiting for a slot."""
+
+    __slots__ = ("lane", "tenant", "tag", "enqueued", "deadline", "granted", "done")
+
+    def __init__(self, lane, tenant, tag, enqueued, deadline, granted):
+        self.lane = lane
+        self.tenant = tenant
+        self.tag = tag
+        self.enqueued = enqueued
+        self.deadline = deadline
+        self.granted = granted
+        # Served, or given up by its caller (granted cancelled); skipped when met again in the lane's queues
+        self.done = False
+
+class PriorityScheduler:
+    """Admits emails to the graph by priority lane, fairly across tenants, max_concurrency at a time.
+
+    Emails are put in a lane by classify_lane (or the "priority" key of the run config).
+    Free slots go to the most urgent non-empty lane. Within a lane, tenants share slots by
+    weighted fair queuing (self-clocked: each email is tagged with its tenant's virtual finish
+    time, 1 / tenant.weight after the tenant's previous one, and the smallest tag goes first),
+    so one tenant's backlog cannot hold back another's mail. An email waiting longer than its
+    lane's SLA goes before everything else, oldest deadline first.
+
+    Tenant limits are part of admission: an email is only granted a slot while its tenant has
+    fewer than tenant.max_concurrency emails running here, and its tenant's rate limit is
+    waited out before it queues, so a throttled tenant never holds a shared slot and its
+    urgent mail still goes before its bulk mail.
+
+    Use slot() in place of a semaphore around the graph run, outside the tenant's slot
+    (taken with throttle=False); queue depth and wait time per lane are exported through
+    telemetry.
+    """
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY, lanes: dict = LANES):
+        self.max_concurrency = max_concurrency
+        self.lanes = lanes
+        self.aged = 0
+        self._running = 0
+        self._seq = itertools.count()
+        # Per lane: WFQ heap of (tag, seq, entry), arrival-order queue for aging, and virtual time
+        self._heaps = {lane: [] for lane in lanes}
+        self._fifos = {lane: deque() for lane in lanes}
+        self._virtual_time = dict.fromkeys(lanes, 0.0)
+        self._last_tags = {}
+        # Emails running per tenant id, for the tenants' max_concurrency
+        self._tenant_running = {}
+        self._depth = dict.fromkeys(lanes, 0)
+        self._started = dict.fromkeys(lanes, 0)
+        self._waited = dict.fromkeys(lanes, 0.0)
+        self._max_wait = dict.fromkeys(lanes, 0.0)
+        self._lock = threading.Lock()
+
+    def lane(self, email_input: dict, config: dict | None = None) -> str:
+        """Lane of an email: the run config's "priority" if set, otherwise classify_lane."""
+        return email_lane(email_input, config, self.lanes)
+
+    def _enqueue(self, lane, tenant):
+        now = time.monotonic()
+        entry = _Entry(lane, tenant, 0.0, now, now + self.lanes[lane]["sla_seconds"], asyncio.get_running_loop().create_future())
+        with self._lock:
+            # Virtual finish time: after the tenant's previous email in this lane, or now if it has none waiting
+            key = (lane, tenant.tenant_id)
+            entry.tag = max(self._virtual_time[lane], self._last_tags.get(key, 0.0)) + 1.0 / tenant.weight
+            self._last_tags[key] = entry.tag
+            heapq.heappush(self._heaps[lane], (entry.tag, next(self._seq), entry))
+            self._fifos[lane].append(entry)
+            self._depth[lane] += 1
+        record_queue_depth(lane, self._depth[lane])
+        return entry
+
+    def _admissible(self, entry) -> bool:
+        """Whether the entry's tenant may start another email."""
+        limit = entry.tenant.max_concurrency
+        return not limit or self._tenant_running.get(entry.tenant.tenant_id, 0) < limit
+
+    def _pick(self):
+        """Next entry to serve: the most overdue one, otherwise the smallest tag of the most urgent lane.
+
+        Entries of tenants at their concurrency limit are passed over (and stay queued).
+        """
+        now = time.monotonic()
+        overdue = None
+        for lane, fifo in self._fifos.items():
+            while fifo and (fifo[0].done or fifo[0].granted.cancelled()):
+                fifo.popleft()
+            for entry in fifo:
+                if entry.deadline > now or (overdue is not None and entry.deadline >= overdue.deadline):
+                    break
+                if not (entry.done or entry.granted.cancelled()) and self._admissible(entry):
+                    overdue = entry
+                    break
+        if overdue is not None:
+            self.aged += 1
+            return overdue
+        for lane, heap in self._heaps.items():
+            skipped, found = [], None
+            while heap:
+                item = heapq.heappop(heap)
+                entry = item[2]
+                if entry.done or entry.granted.cancelled():
+                    continue
+                if self._admissible(entry):
+                    found = entry
+                    break
+                skipped.append(item)
+            for item in skipped:
+                heapq.heappush(heap, item)
+            if found is not None:
+                return found
+        return None
+
+    def _dispatch(self):
+        """Hand free slots to waiting emails."""
+        while True:
+            with self._lock:
+                if self._running >= self.max_concurrency:
+                    return
+                entry = self._pick()
+                if entry is None:
+                    return
+                entry.done = True
+                self._running += 1
+                self._tenant_running[entry.tenant.tenant_id] = self._tenant_running.get(entry.tenant.tenant_id, 0) + 1
+                self._depth[entry.lane] -= 1
+                self._virtual_time[entry.lane] = max(self._virtual_time[entry.lane], entry.tag)
+            record_queue_depth(entry.lane, self._depth[entry.lane])
+            entry.granted.set_result(None)
+
+    def _release(self, entry):
+        with self._lock:
+            self._running -= 1
+            self._tenant_running[entry.tenant.tenant_id] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, email_input: dict, config: dict | None = None):
+        """Wait for this email's turn, then hold one of the max_concurrency slots. Yields the lane."""
+        lane = self.lane(email_input, config)
+        tenant = current_tenant(config)
+        # Waited out before queueing, so a throttled tenant's email holds no slot meanwhile
+        await tenant.throttle()
+        entry = self._enqueue(lane, tenant)
+        self._dispatch()
+        try:
+            await entry.granted
+        except asyncio.CancelledError:
+            if entry.granted.cancelled():
+                # Gave up while still queued (_pick skips it from now on)
+                with self._lock:
+                    entry.done = True
+                    self._depth[lane] -= 1
+                record_queue_depth(lane, self._depth[lane])
+            else:
+                # Cancelled just after being granted the slot
+                self._release(entry)
+            raise
+
+        waited = time.monotonic() - entry.enqueued
+        with self._lock:
+            self._started[lane] += 1
+            self._waited[lane] += waited
+            self._max_wait[lane] = max(self._max_wait[lane], waited)
+        record_queue_wait(lane, waited)
+        try:
+            yield lane
+        finally:
+            self._release(entry)
+
+    def stats(self) -> dict:
+        """Slots in use, emails served past their SLA, and per lane: depth, emails started and wait times."""
+        with self._lock:
+            return {
+                "running": self._running,
+                "aged": self.aged,
+                "lanes": {
+                    lane: {
+                        "depth": self._depth[lane],
+                        "started": self._started[lane],
+                        "mean_wait_seconds": self._waited[lane] / self._started[lane] if self._started[lane] else 0.0,
+                        "max_wait_seconds": self._max_wait[lane],
+                    }
+                    for lane in self.lanes
+                },
+            }
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+class PromptCache:
+    """Cache of formatted system prompts, keyed on the memory namespaces they were built from.
+
+    Every namespace has a version counter that update_memory bumps after writing a new
+    profile. A cached prompt is reused for as long as the versions it was built from are
+    current, so a hit costs no store reads and no string formatting.
+
+    Versions live in this process only: a profile written by another process is picked up
+    once this process writes that namespace itself or the entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def version(self, store, namespace) -> int:
+        """Current version of a namespace in a store (0 until the first update)."""
+        return self._versions.get((id(store), tuple(namespace)), 0)
+
+    def bump(self, store, namespace):
+        """Mark a namespace as changed, dropping every prompt built from it."""
+        namespace = tuple(namespace)
+        with self._lock:
+            self._versions[(id(store), namespace)] = self._versions.get((id(store), namespace), 0) + 1
+            for key in [key for key in self._entries if key[1] == id(store) and any(ns == namespace for ns, _ in key[2])]:
+                del self._entries[key]
+
+    def _key(self, name, store, namespaces):
+        return (name, id(store), tuple((tuple(ns), self.version(store, ns)) for ns in namespaces))
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def _save(self, key, prompt):
+        with self._lock:
+            self._entries[key] = prompt
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get(self, name: str, build, store=None, namespaces=()):
+        """Return the cached prompt, building it with build() on a miss.
+
+        Args:
+            name: Name of the prompt template, e.g. "agent_system_prompt_hitl_memory"
+            build: Zero-argument callable that reads memory and formats the prompt
+            store: LangGraph BaseStore the memory is read from, if any
+            namespaces: Memory namespaces the prompt depends on
+
+        Returns:
+            str: The formatted prompt
+        """
+        key = self._key(name, store, namespaces)
+        prompt = self._lookup(key)
+        if prompt is None:
+            prompt = build()
+            self._save(key, prompt)
+        return prompt
+
+    async def aget(self, name: str, abuild, store=None, namespaces=()):
+        """Async variant of get; abuild is a zero-argument coroutine function."""
+        key = self._key(name, store, namespaces)
+        prompt = self._lookup(key)
+        if prompt is None:
+            prompt = await abuild()
+            self._save(key, prompt)
+        return prompt
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+# Process-wide cache shared by all assistant graphs
+prompt_cache = PromptCache()
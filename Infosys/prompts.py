@@ -11,6 +11,8 @@ default_background = "You are assisting a busy professional manage their inbox."
 # prompts.py
 
 # The core system prompt for your agent node
+# Static parts (background, tools) come before the memory-backed preferences so the
+# prefix stays identical between calls and can be served from the provider's prompt cache
 agent_system_prompt = """
 You are a helpful AI assistant. 
 {background}
@@ -28,5 +30,45 @@ default_background = "You are helping a busy professional triage and respond to
 default_response_preferences = "Keep responses professional, concise, and helpful."
 default_cal_preferences = "Always check for conflicts before suggesting a time."
 
+# Appended to the tools prompt of assistants with episodic memory (see episodic_memory.search_memory)
+SEARCH_MEMORY_TOOL_PROMPT = """
+search_memory(query) - Find past emails similar to this one and the replies that were sent to them.
+Use it before drafting a reply to stay consistent with how similar emails were answered.
+"""
+
 # (Include your triage prompts from the previous step here too)
-triage_system_prompt = "You are an email triage assistant..."
\ No newline at end of file
+triage_system_prompt = "You are an email triage assistant..."
+
+# Batch triage: several emails classified in a single router call
+batch_triage_user_prompt = """Please classify each of the following {count} emails independently.
+Return exactly one decision per email, using the index shown on each email.
+
+{emails}"""
+
+batch_triage_email_template = """<email index="{index}">
+From: {author}
+To: {to}
+Subject: {subject}
+
+{email_thread}
+</email>"""
+
+# Rolling summary of older agent turns, used when the message history is trimmed
+context_summary_prompt = """You are compressing the earlier part of an email assistant's working conversation.
+Summarize the steps below in a few short bullet points: what was checked or drafted, what the tools returned,
+and any feedback or decisions from the user. Keep names, dates, times and email addresses exactly.
+
+{previous_summary}"""
+
+# Diff-based preference memory (see preference_rules.RuleBook): the updater edits individual rules
+PREFERENCE_RULES_UPDATE_INSTRUCTIONS = """You maintain the {namespace} preferences of an email assistant as a list of rules.
+Below are the existing rules that may be related to the user's feedback, each with its ID:
+
+{rules}
+
+From the feedback that follows, return only the changes needed:
+- add: a new preference the feedback reveals. Give keywords (sender addresses, domains or topic words) when it only applies to some emails; leave them empty when it applies to every email.
+- modify: an existing rule the feedback refines or contradicts. Give its rule_id and the complete new text.
+- delete: an existing rule the feedback shows is wrong or no longer wanted.
+Never restate rules that stay the same, and prefer modifying a related rule over adding a near-duplicate.
+Return no operations if the feedback does not change any preference."""
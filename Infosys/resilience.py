@@ -0,0 +1,387 @@
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import httpx
+
+from email_assistant.telemetry import get_logger, record_circuit_open, record_retry
+
+logger = get_logger(__name__)
+
+# Policy per kind of outbound call: model roles of the model registry, plus "gmail".
+#   dependency:   calls sharing a dependency share one circuit breaker
+#   timeout:      seconds one attempt may take
+#   deadline:     seconds all attempts together (backoff included) may take
+#   max_attempts: attempts on retryable errors, the first one included
+#   hedge:        send a second request when the first is slower than usual (idempotent calls only)
+#   inline:       run sync calls on the caller's thread, leaving the attempt timeout to the client
+#                 (for clients that are not thread-safe, like Gmail's httplib2 transport)
+DEFAULT_POLICY = {"dependency": "llm", "timeout": 60.0, "deadline": 150.0, "max_attempts": 3, "hedge": False, "inline": False}
+CALL_POLICIES = {
+    "router": {"timeout": 20.0, "deadline": 45.0, "hedge": True},
+    # Failures of the fast triage tier escalate to the router model, so give up early; its own
+    # breaker, so fast-tier failures never open the circuit of the router model they fall back to
+    "router_fast": {"dependency": "llm_fast", "timeout": 10.0, "deadline": 15.0, "max_attempts": 2, "hedge": True},
+    "agent": {"timeout": 60.0, "deadline": 150.0},
+    "memory_updater": {"timeout": 60.0, "deadline": 150.0},
+    "summarizer": {"timeout": 30.0, "deadline": 40.0, "max_attempts": 2},
+    "embeddings": {"timeout": 10.0, "deadline": 20.0},
+    "gmail": {"dependency": "gmail", "timeout": 30.0, "deadline": 90.0, "max_attempts": 4, "inline": True},
+}
+
+# Jittered exponential backoff: attempt n waits uniformly up to min(BACKOFF_MAX, BACKOFF_BASE * 2**n)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+
+# Circuit breaker: open after this many consecutive failures, try again after the cool-down
+FAILURE_THRESHOLD = 5
+RESET_SECONDS = 30.0
+
+# Hedging: wait for the p95 latency of recent calls (at least MIN_HEDGE_DELAY) before the second request
+DEFAULT_HEDGE_DELAY = 3.0
+MIN_HEDGE_DELAY = 0.5
+HEDGE_SAMPLES = 200
+
+# HTTP statuses worth retrying: timeouts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+# Sync attempts run on a thread pool per dependency so they can be abandoned at their deadline
+# (the thread cannot be killed); one dependency's hung calls never hold another's threads
+MAX_THREADS_PER_DEPENDENCY = 16
+
+class AttemptNotStartedError(TimeoutError):
+    """Raised when a sync attempt waited for a free thread until the call's deadline.
+
+    The dependency was never called, so it does not count against its circuit breaker.
+    """
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, dependency: str, retry_after: float):
+        super().__init__(f"{dependency} is unavailable (circuit open); retry in {retry_after:.0f}s")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+def policy(name: str) -> dict:
+    """Call policy for a kind of call: CALL_POLICIES[name] over DEFAULT_POLICY."""
+    return {**DEFAULT_POLICY, **CALL_POLICIES.get(name, {})}
+
+def is_retryable(error: Exception) -> bool:
+    """True for timeouts, connection errors, rate limits and 5xx responses (OpenAI, httpx and Gmail errors)."""
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError)):
+        return True
+    # openai.APIStatusError has status_code; googleapiclient's HttpError has resp.status
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "resp", None), "status", None)
+    if status is not None:
+        return int(status) in RETRYABLE_STATUSES
+    # openai.APIConnectionError / APITimeoutError carry no status
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+
+def backoff(attempt: int) -> float:
+    """Seconds to wait before retry number attempt (1-based), with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker for one dependency.
+
+    Closed: calls go through. After failure_threshold consecutive retryable failures it opens
+    and calls fail fast with CircuitOpenError for reset_seconds. Then it is half-open: one
+    trial call goes through, and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, dependency: str, failure_threshold: int = FAILURE_THRESHOLD, reset_seconds: float = RESET_SECONDS):
+        self.dependency = dependency
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            return "open" if time.monotonic() - self.opened_at < self.reset_seconds else "half_open"
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a trial call through (0 when closed or half-open)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError unless a call may go through now.
+
+        Returns:
+            bool: True if the call is the half-open trial, which must end in record_success,
+            record_failure or release_trial
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            # Half-open: exactly one trial call at a time
+            if remaining <= 0 and not self._trial:
+                self._trial = True
+                return True
+        raise CircuitOpenError(self.dependency, max(remaining, 1.0))
+
+    def release_trial(self):
+        """Let another call make the trial when this one ended without telling whether the dependency is healthy."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"✅ {self.dependency} recovered, circuit closed", dependency=self.dependency)
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            trial, self._trial = self._trial, False
+            # A failed trial re-opens at once; otherwise open at the threshold
+            if trial or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                opened = True
+            else:
+                opened = False
+        if opened:
+            record_circuit_open(self.dependency)
+            logger.warning(f"⚠️ {self.dependency} unhealthy after {self.failures} failures, circuit open for {self.reset_seconds:g}s",
+                           dependency=self.dependency, failures=self.failures)
+
+    async def wait_until_available(self):
+        """Sleep while the circuit is open, e.g. to hold emails back instead of failing them."""
+        while (remaining := self.retry_after()) > 0:
+            await asyncio.sleep(remaining)
+
+_breakers = {}
+_latencies = {}
+_executors = {}
+_lock = threading.Lock()
+
+def _executor(dependency: str) -> ThreadPoolExecutor:
+    with _lock:
+        if dependency not in _executors:
+            _executors[dependency] = ThreadPoolExecutor(max_workers=MAX_THREADS_PER_DEPENDENCY, thread_name_prefix=f"resilience-{dependency}")
+        return _executors[dependency]
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    """Process-wide circuit breaker of a dependency ("llm", "gmail", ...)."""
+    with _lock:
+        if dependency not in _breakers:
+            _breakers[dependency] = CircuitBreaker(dependency)
+        return _breakers[dependency]
+
+def _record_latency(name, seconds):
+    with _lock:
+        _latencies.setdefault(name, deque(maxlen=HEDGE_SAMPLES)).append(seconds)
+
+def hedge_delay(name: str) -> float:
+    """How long a call waits before sending its hedge request: p95 of recent successful calls."""
+    with _lock:
+        samples = sorted(_latencies.get(name, ()))
+    if len(samples) < 20:
+        return DEFAULT_HEDGE_DELAY
+    return max(MIN_HEDGE_DELAY, samples[int(len(samples) * 0.95)])
+
+def _first_success(futures, timeout):
+    """Result of the first of futures to succeed within timeout; the last error if all fail."""
+    error = None
+    pending = set(futures)
+    end = time.monotonic() + timeout
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            raise TimeoutError(f"No response within {timeout:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+def _submit(fn, dependency):
+    """Run fn on the dependency's pool; the event is set once a thread has picked it up."""
+    started = threading.Event()
+    def run():
+        started.set()
+        return fn()
+    return _executor(dependency).submit(contextvars.copy_context().run, run), started
+
+def _attempt(fn, name, settings, end):
+    if settings["inline"]:
+        return fn()
+    future, started = _submit(fn, settings["dependency"])
+    # Time spent queued behind busy (or abandoned) threads counts against the deadline only;
+    # the attempt's timeout starts when it actually runs
+    if not started.wait(max(0.0, end - time.monotonic())):
+        future.cancel()
+        raise AttemptNotStartedError(f"No free {settings['dependency']} thread before the {settings['deadline']:g}s deadline")
+    timeout = min(settings["timeout"], max(0.0, end - time.monotonic()))
+    futures = [future]
+    if settings["hedge"]:
+        delay = min(hedge_delay(name), timeout)
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            futures.append(_submit(fn, settings["dependency"])[0])
+            timeout -= delay
+        else:
+            timeout = 0.0
+    return _first_success(futures, timeout)
+
+async def _afirst_success(tasks, timeout):
+    error = None
+    pending = set(tasks)
+    end = time.monotonic() + timeout
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, end - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"No response within {timeout:.1f}s")
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def _aattempt(afn, name, timeout, hedge):
+    tasks = [asyncio.ensure_future(afn())]
+    if hedge:
+        delay = min(hedge_delay(name), timeout)
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            tasks.append(asyncio.ensure_future(afn()))
+            timeout -= delay
+        else:
+            timeout = 0.0
+    return await _afirst_success(tasks, timeout)
+
+def call(name: str, fn):
+    """Run a blocking outbound call under its policy: deadline, retries with backoff, circuit breaker and hedging.
+
+    Args:
+        name: Kind of call, a key of CALL_POLICIES (e.g. "router", "gmail")
+        fn: Zero-argument callable making the call
+
+    Returns:
+        Whatever fn returns
+
+    Raises:
+        CircuitOpenError: The dependency's circuit is open
+        TimeoutError: The deadline passed
+        Exception: A non-retryable error from fn, or the last retryable one
+    """
+    settings = policy(name)
+    breaker = get_breaker(settings["dependency"])
+    end = time.monotonic() + settings["deadline"]
+    attempt = 0
+    while True:
+        attempt += 1
+        trial = breaker.before_call()
+        start = time.monotonic()
+        try:
+            result = _attempt(fn, name, settings, end)
+        except AttemptNotStartedError:
+            # The dependency was never called
+            if trial:
+                breaker.release_trial()
+            raise
+        except Exception as error:
+            if not is_retryable(error):
+                # The dependency answered; its error says nothing about its health
+                if trial:
+                    breaker.release_trial()
+                raise
+            breaker.record_failure()
+            delay = backoff(attempt)
+            if attempt >= settings["max_attempts"] or time.monotonic() + delay >= end:
+                raise
+            record_retry(name)
+            logger.warning(f"⚠️ {name} call failed ({error}), retry {attempt} in {delay:.1f}s", call=name, attempt=attempt)
+            time.sleep(delay)
+            continue
+        except BaseException:
+            # Cancelled or interrupted before an outcome, so the circuit stays as it is
+            if trial:
+                breaker.release_trial()
+            raise
+        breaker.record_success()
+        _record_latency(name, time.monotonic() - start)
+        return result
+
+async def acall(name: str, afn):
+    """Async variant of call; afn is a zero-argument coroutine function."""
+    settings = policy(name)
+    breaker = get_breaker(settings["dependency"])
+    end = time.monotonic() + settings["deadline"]
+    attempt = 0
+    while True:
+        attempt += 1
+        trial = breaker.before_call()
+        start = time.monotonic()
+        try:
+            result = await _aattempt(afn, name, min(settings["timeout"], end - start), settings["hedge"])
+        except Exception as error:
+            if not is_retryable(error):
+                if trial:
+                    breaker.release_trial()
+                raise
+            breaker.record_failure()
+            delay = backoff(attempt)
+            if attempt >= settings["max_attempts"] or time.monotonic() + delay >= end:
+                raise
+            record_retry(name)
+            logger.warning(f"⚠️ {name} call failed ({error}), retry {attempt} in {delay:.1f}s", call=name, attempt=attempt)
+            await asyncio.sleep(delay)
+            continue
+        except BaseException:
+            # e.g. asyncio.CancelledError when the email's run is cancelled
+            if trial:
+                breaker.release_trial()
+            raise
+        breaker.record_success()
+        _record_latency(name, time.monotonic() - start)
+        return result
+
+class ResilientModel:
+    """Chat model (or one bound to tools / structured output) whose invoke and ainvoke go through call / acall."""
+
+    def __init__(self, model, name: str):
+        self.model = model
+        self.name = name
+
+    def invoke(self, input, config=None, **kwargs):
+        return call(self.name, lambda: self.model.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await acall(self.name, lambda: self.model.ainvoke(input, config, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+def stats() -> dict:
+    """State of every circuit breaker and the current hedge delay per kind of call."""
+    with _lock:
+        breakers = dict(_breakers)
+        names = list(_latencies)
+    return {
+        "breakers": {dependency: {"state": breaker.state, "failures": breaker.failures} for dependency, breaker in breakers.items()},
+        "hedge_delay": {name: hedge_delay(name) for name in names},
+    }
@@ -0,0 +1,663 @@
+import asyncio
+import atexit
+import json
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+import aiosqlite
+from langgraph.checkpoint.base import WRITES_IDX_MAP, BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id, get_checkpoint_metadata
+from langgraph.store.base import BaseStore, GetOp, InvalidNamespaceError, Item, ListNamespacesOp, PutOp, SearchItem, SearchOp
+
+# One file holds checkpoints, pending writes, memory profiles and the Agent Inbox's pending interrupts
+DEFAULT_DB_PATH = "email_assistant.sqlite"
+# Read connections kept open; SQLite in WAL mode serves readers in parallel with the single writer
+DEFAULT_POOL_SIZE = 4
+# Most writes committed in one transaction
+DEFAULT_MAX_BATCH = 256
+# Pending interrupts listed per page by default
+DEFAULT_PAGE_SIZE = 50
+# Serialized values at least this large are zlib-compressed (long message lists compress well)
+COMPRESS_MIN_BYTES = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS store (
+    prefix TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (prefix, key)
+);
+CREATE TABLE IF NOT EXISTS pending_interrupts (
+    thread_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    action TEXT NOT NULL,
+    request TEXT NOT NULL,
+    configurable TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS pending_interrupts_created ON pending_interrupts (created_at, thread_id);
+"""
+
+# Columns added to tables of existing databases: table -> {column: definition}
+MIGRATIONS = {
+    "pending_interrupts": {"configurable": "TEXT NOT NULL DEFAULT '{}'"},
+}
+
+def dumps_compact(serde, obj):
+    """Serialize with the checkpoint serializer, compressing large payloads.
+
+    Returns:
+        tuple: (type, bytes); the type is prefixed with "zlib:" when the bytes are compressed
+    """
+    type_, data = serde.dumps_typed(obj)
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return f"zlib:{type_}", zlib.compress(data)
+    return type_, data
+
+def loads_compact(serde, type_, data):
+    """Inverse of dumps_compact."""
+    if type_.startswith("zlib:"):
+        type_, data = type_[len("zlib:"):], zlib.decompress(data)
+    return serde.loads_typed((type_, data))
+
+def timestamp(seconds: float) -> datetime:
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+class SqliteDatabase:
+    """Pooled aiosqlite connections to one WAL-mode database, driven by their own event loop.
+
+    Reads use a small pool of connections. Writes go through a single writer that commits
+    everything queued while the previous commit was running in one transaction (group
+    commit), so many suspending threads cost few fsyncs. The event loop runs in a background
+    thread, which lets the same database serve sync graphs (invoke) and async graphs (ainvoke)
+    from any thread or event loop.
+    """
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, pool_size: int = DEFAULT_POOL_SIZE, max_batch: int = DEFAULT_MAX_BATCH):
+        self.path = path
+        self.pool_size = pool_size
+        self.max_batch = max_batch
+        # Number of commits and of writes they carried, for monitoring batching
+        self.commits = 0
+        self.writes = 0
+        self._closed = False
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="sqlite-persistence", daemon=True)
+        self._thread.start()
+        self.run(self._open())
+        atexit.register(self.close)
+
+    async def _connect(self):
+        connection = aiosqlite.connect(self.path)
+        # An unclosed connection must not keep the interpreter alive at exit
+        connection.daemon = True
+        connection = await connection
+        await connection.execute("PRAGMA journal_mode=WAL")
+        await connection.execute("PRAGMA synchronous=NORMAL")
+        await connection.execute("PRAGMA busy_timeout=5000")
+        return connection
+
+    async def _open(self):
+        self._writer = await self._connect()
+        await self._writer.executescript(SCHEMA)
+        for table, added in MIGRATIONS.items():
+            async with self._writer.execute(f"PRAGMA table_info({table})") as cursor:
+                columns = {row[1] for row in await cursor.fetchall()}
+            for column, definition in added.items():
+                if column not in columns:
+                    await self._writer.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        await self._writer.commit()
+        self._readers = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self._readers.put_nowait(await self._connect())
+        self._write_queue = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._write_loop())
+
+    def run(self, coroutine):
+        """Run a coroutine on the database loop and wait for its result (sync callers)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def submit(self, coroutine):
+        """Run a coroutine on the database loop from any other event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+
+    async def read(self, sql: str, params=()):
+        """Fetch all rows of a query using a pooled connection (call on the database loop)."""
+        connection = await self._readers.get()
+        try:
+            async with connection.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+        finally:
+            self._readers.put_nowait(connection)
+
+    async def write(self, statements):
+        """Apply [(sql, rows)] statements atomically, returning once they are committed.
+
+        Each statement is run with executemany over its rows. Call on the database loop.
+        """
+        done = asyncio.get_running_loop().create_future()
+        self._write_queue.put_nowait((statements, done))
+        await done
+
+    async def _execute(self, items):
+        for statements, _ in items:
+            for sql, rows in statements:
+                await self._writer.executemany(sql, rows)
+        await self._writer.commit()
+
+    async def _write_loop(self):
+        while True:
+            items = [await self._write_queue.get()]
+            # Everything that queued up during the previous commit goes into this one
+            while len(items) < self.max_batch and not self._write_queue.empty():
+                items.append(self._write_queue.get_nowait())
+            stop = any(item is None for item in items)
+            items = [item for item in items if item is not None]
+
+            try:
+                await self._execute(items)
+                results = [None] * len(items)
+            except Exception:
+                await self._writer.rollback()
+                # Retry one by one so a bad write only fails its own caller
+                results = []
+                for item in items:
+                    try:
+                        await self._execute([item])
+                        results.append(None)
+                    except Exception as error:
+                        await self._writer.rollback()
+                        results.append(error)
+
+            self.commits += 1
+            self.writes += len(items)
+            for (_, done), error in zip(items, results):
+                if done.done():
+                    continue
+                if error is None:
+                    done.set_result(None)
+                else:
+                    done.set_exception(error)
+            if stop:
+                return
+
+    async def _close(self):
+        self._write_queue.put_nowait(None)
+        await self._writer_task
+        await self._writer.close()
+        while not self._readers.empty():
+            await self._readers.get_nowait().close()
+
+    def close(self):
+        """Commit pending writes, close every connection and stop the loop."""
+        if self._closed:
+            return
+        self._closed = True
+        self.run(self._close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """LangGraph checkpointer on a SqliteDatabase, usable from sync and async graphs.
+
+    Checkpoints and pending writes (including interrupts waiting for a human) live only in
+    SQLite, so thousands of suspended threads cost disk space but no memory.
+    """
+
+    def __init__(self, db: SqliteDatabase, *, serde=None):
+        super().__init__(serde=serde)
+        self.db = db
+
+    def _config(self, thread_id, checkpoint_ns, checkpoint_id):
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+    async def _tuple(self, thread_id, checkpoint_ns, row):
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = await self.db.read(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        )
+        return CheckpointTuple(
+            config=self._config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=loads_compact(self.serde, type_, checkpoint),
+            metadata=loads_compact(self.serde, metadata_type, metadata),
+            parent_config=self._config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, loads_compact(self.serde, value_type, value)) for task_id, channel, value_type, value in writes],
+        )
+
+    async def _get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        if checkpoint_id:
+            rows = await self.db.read(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            )
+        else:
+            rows = await self.db.read(
+                f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                (thread_id, checkpoint_ns),
+            )
+        return await self._tuple(thread_id, checkpoint_ns, rows[0]) if rows else None
+
+    async def _list(self, config, filter, before, limit):
+        conditions, params = [], []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before:
+            conditions.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = await self.db.read(
+            f"SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+            f"FROM checkpoints {where} ORDER BY checkpoint_id DESC",
+            params,
+        )
+
+        results = []
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and len(results) >= limit:
+                break
+            # Metadata is stored serialized, so the filter is applied here
+            if filter and any(loads_compact(self.serde, row[4], row[5]).get(key) != value for key, value in filter.items()):
+                continue
+            results.append(await self._tuple(thread_id, checkpoint_ns, row))
+        return results
+
+    async def _put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, data = dumps_compact(self.serde, checkpoint)
+        # Like LangGraph's own savers, keep the run's configurable values (tenant_id, ...) in the metadata
+        metadata_type, metadata_data = dumps_compact(self.serde, get_checkpoint_metadata(config, metadata))
+        await self.db.write([(
+            "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"), type_, data, metadata_type, metadata_data)],
+        )])
+        return self._config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    async def _put_writes(self, config, writes, task_id, task_path):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, WRITES_IDX_MAP.get(channel, idx), channel, *dumps_compact(self.serde, value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+        # Special writes (errors, interrupts, resume values) replace earlier ones; regular writes are written once
+        conflict = "REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "IGNORE"
+        await self.db.write([(
+            f"INSERT OR {conflict} INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )])
+
+    async def _delete_thread(self, thread_id):
+        await self.db.write([
+            ("DELETE FROM checkpoints WHERE thread_id = ?", [(thread_id,)]),
+            ("DELETE FROM writes WHERE thread_id = ?", [(thread_id,)]),
+        ])
+
+    async def _prune(self, keep_last):
+        # Older checkpoints are only needed for time travel; the latest one is enough to resume
+        ranked = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id FROM ("
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, "
+            "ROW_NUMBER() OVER (PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC) AS position FROM checkpoints"
+            ") WHERE position > ?"
+        )
+        rows = await self.db.read(ranked, (keep_last,))
+        await self.db.write([
+            ("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", rows),
+            ("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", rows),
+        ])
+        return len(rows)
+
+    # Sync API, used by graphs run with invoke / stream
+    def get_tuple(self, config):
+        return self.db.run(self._get_tuple(config))
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        return iter(self.db.run(self._list(config, filter, before, limit)))
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        return self.db.run(self._put(config, checkpoint, metadata, new_versions))
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self.db.run(self._put_writes(config, writes, task_id, task_path))
+
+    def delete_thread(self, thread_id):
+        self.db.run(self._delete_thread(thread_id))
+
+    def prune(self, keep_last: int = 1) -> int:
+        """Delete all but the newest keep_last checkpoints of every thread; returns the number deleted."""
+        return self.db.run(self._prune(keep_last))
+
+    # Async API, used by graphs run with ainvoke / astream
+    async def aget_tuple(self, config):
+        return await self.db.submit(self._get_tuple(config))
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint_tuple in await self.db.submit(self._list(config, filter, before, limit)):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await self.db.submit(self._put(config, checkpoint, metadata, new_versions))
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await self.db.submit(self._put_writes(config, writes, task_id, task_path))
+
+    async def adelete_thread(self, thread_id):
+        await self.db.submit(self._delete_thread(thread_id))
+
+    async def aprune(self, keep_last: int = 1) -> int:
+        """Async variant of prune."""
+        return await self.db.submit(self._prune(keep_last))
+
+    def get_next_version(self, current, channel):
+        if current is None:
+            current_version = 0
+        elif isinstance(current, int):
+            current_version = current
+        else:
+            current_version = int(current.split(".")[0])
+        return f"{current_version + 1:032}.{random.random():016}"
+
+def namespace_prefix(namespace) -> str:
+    """Stored prefix of a namespace: its labels joined with ".", which no label may contain."""
+    for label in namespace:
+        if "." in label:
+            # A dotted label would be read back as several labels and match other namespaces' prefixes
+            raise InvalidNamespaceError(f"Invalid namespace label {label!r} in {tuple(namespace)}; labels cannot contain '.'")
+    return ".".join(namespace)
+
+class SqliteStore(BaseStore):
+    """LangGraph BaseStore on a SqliteDatabase, holding the assistant's memory profiles.
+
+    Namespaces are stored as dot-joined prefixes (LangGraph namespace labels cannot contain
+    dots) and values as compact JSON. Semantic search is not supported: a search query is
+    ignored and results come back most recently updated first.
+    """
+
+    def __init__(self, db: SqliteDatabase):
+        self.db = db
+
+    def batch(self, ops):
+        return self.db.run(self._batch(list(ops)))
+
+    async def abatch(self, ops):
+        return await self.db.submit(self._batch(list(ops)))
+
+    async def _batch(self, ops):
+        results = [None] * len(ops)
+        # Only the last put for a key in a batch matters; puts are applied after the reads
+        puts = {}
+        for position, op in enumerate(ops):
+            if isinstance(op, GetOp):
+                results[position] = await self._get(op)
+            elif isinstance(op, SearchOp):
+                results[position] = await self._search(op)
+            elif isinstance(op, ListNamespacesOp):
+                results[position] = await self._list_namespaces(op)
+            elif isinstance(op, PutOp):
+                puts[(op.namespace, op.key)] = op
+            else:
+                raise ValueError(f"Unknown store operation: {op}")
+        if puts:
+            await self._put(list(puts.values()))
+        return results
+
+    async def _get(self, op):
+        rows = await self.db.read(
+            "SELECT value, created_at, updated_at FROM store WHERE prefix = ? AND key = ?", (namespace_prefix(op.namespace), op.key)
+        )
+        if not rows:
+            return None
+        value, created_at, updated_at = rows[0]
+        return Item(value=json.loads(value), key=op.key, namespace=op.namespace, created_at=timestamp(created_at), updated_at=timestamp(updated_at))
+
+    async def _search(self, op):
+        prefix = namespace_prefix(op.namespace_prefix)
+        rows = await self.db.read(
+            "SELECT prefix, key, value, created_at, updated_at FROM store "
+            "WHERE ? = '' OR prefix = ? OR substr(prefix, 1, ?) = ? ORDER BY updated_at DESC",
+            (prefix, prefix, len(prefix) + 1, prefix + "."),
+        )
+        items = []
+        for item_prefix, key, value, created_at, updated_at in rows:
+            value = json.loads(value)
+            if op.filter and any(value.get(name) != expected for name, expected in op.filter.items()):
+                continue
+            items.append(SearchItem(
+                namespace=tuple(item_prefix.split(".")), key=key, value=value,
+                created_at=timestamp(created_at), updated_at=timestamp(updated_at),
+            ))
+        return items[op.offset:op.offset + op.limit]
+
+    async def _list_namespaces(self, op):
+        rows = await self.db.read("SELECT DISTINCT prefix FROM store")
+        namespaces = set()
+        for (prefix,) in rows:
+            namespace = tuple(prefix.split("."))
+            if all(self._matches(namespace, condition) for condition in op.match_conditions or ()):
+                namespaces.add(namespace[:op.max_depth] if op.max_depth is not None else namespace)
+        return sorted(namespaces)[op.offset:op.offset + op.limit]
+
+    def _matches(self, namespace, condition):
+        path = tuple(condition.path)
+        if len(path) > len(namespace):
+            return False
+        part = namespace[:len(path)] if condition.match_type == "prefix" else namespace[len(namespace) - len(path):]
+        return all(expected == "*" or expected == label for expected, label in zip(path, part))
+
+    async def _put(self, ops):
+        now = datetime.now(timezone.utc).timestamp()
+        deletes = [(namespace_prefix(op.namespace), op.key) for op in ops if op.value is None]
+        upserts = [(namespace_prefix(op.namespace), op.key, json.dumps(op.value, separators=(",", ":")), now, now) for op in ops if op.value is not None]
+        await self.db.write([
+            ("DELETE FROM store WHERE prefix = ? AND key = ?", deletes),
+            (
+                "INSERT INTO store (prefix, key, value, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (prefix, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                upserts,
+            ),
+        ])
+
+# Configurable values that locate a checkpoint rather than describe the run; a resume goes to the latest one
+CHECKPOINT_KEYS = ("thread_id", "checkpoint_ns", "checkpoint_id", "checkpoint_map")
+# Checkpoint metadata written by LangGraph itself, next to the configurable values it keeps
+CHECKPOINT_METADATA_KEYS = ("source", "step", "parents", "writes", "run_id")
+
+def interrupt_request(result):
+    """Agent Inbox request a graph run stopped at, or None if the run finished."""
+    interrupts = result.get("__interrupt__") if isinstance(result, dict) else None
+    # The assistant's handlers interrupt with a one-element list of Agent Inbox requests
+    return interrupts[0].value[0] if interrupts else None
+
+def run_configurable(configurable: dict) -> dict:
+    """Configurable values a resume needs again (tenant_id, ...), i.e. the JSON ones that are not checkpoint keys.
+
+    LangGraph does not keep configurable values across an interrupt, so they are saved with it.
+    Also accepts checkpoint metadata, which holds the run's configurable values too.
+    """
+    return {
+        key: value for key, value in configurable.items()
+        if key not in CHECKPOINT_KEYS + CHECKPOINT_METADATA_KEYS and not key.startswith("__") and isinstance(value, (str, int, float, bool))
+    }
+
+class PendingIndex:
+    """Indexed table of threads waiting for review, in the persistence database.
+
+    Rows are written when a run stops at an interrupt and deleted when it is resumed, so
+    listing pending items is one indexed query and never reads checkpoints. Pages use a
+    (created_at, thread_id) keyset cursor, which stays fast however deep the page is.
+    Each row keeps the run's configurable values, which its resume runs with again.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    async def _add(self, thread_id, request, configurable):
+        await self.db.write([(
+            "INSERT OR REPLACE INTO pending_interrupts (thread_id, created_at, action, request, configurable) VALUES (?, ?, ?, ?, ?)",
+            [(thread_id, time.time(), request["action_request"]["action"], json.dumps(request), json.dumps(run_configurable(configurable)))],
+        )])
+
+    async def _remove(self, thread_id):
+        await self.db.write([("DELETE FROM pending_interrupts WHERE thread_id = ?", [(thread_id,)])])
+
+    async def _get(self, thread_id):
+        rows = await self.db.read("SELECT thread_id, created_at, request, configurable FROM pending_interrupts WHERE thread_id = ?", (thread_id,))
+        return self._item(rows[0]) if rows else None
+
+    async def _page(self, limit, cursor):
+        if cursor:
+            created_at, thread_id = cursor.split(":", 1)
+            rows = await self.db.read(
+                "SELECT thread_id, created_at, request, configurable FROM pending_interrupts WHERE (created_at, thread_id) > (?, ?) "
+                "ORDER BY created_at, thread_id LIMIT ?",
+                (float(created_at), thread_id, limit),
+            )
+        else:
+            rows = await self.db.read(
+                "SELECT thread_id, created_at, request, configurable FROM pending_interrupts ORDER BY created_at, thread_id LIMIT ?", (limit,)
+            )
+        items = [self._item(row) for row in rows]
+        next_cursor = f"{rows[-1][1]!r}:{rows[-1][0]}" if len(rows) == limit else None
+        return items, next_cursor
+
+    async def _get_many(self, thread_ids):
+        items = {}
+        # Stay well below SQLite's limit on query parameters
+        for start in range(0, len(thread_ids), 500):
+            chunk = thread_ids[start:start + 500]
+            rows = await self.db.read(
+                f"SELECT thread_id, created_at, request, configurable FROM pending_interrupts WHERE thread_id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            items.update((row[0], self._item(row)) for row in rows)
+        return items
+
+    async def _remove_many(self, thread_ids):
+        await self.db.write([("DELETE FROM pending_interrupts WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])])
+
+    async def _restore(self, items):
+        # Put claimed rows back as they were, unless the thread was interrupted again meanwhile
+        await self.db.write([(
+            "INSERT OR IGNORE INTO pending_interrupts (thread_id, created_at, action, request, configurable) VALUES (?, ?, ?, ?, ?)",
+            [(item["thread_id"], item["created_at"], item["request"]["action_request"]["action"], json.dumps(item["request"]), json.dumps(item["configurable"]))
+             for item in items],
+        )])
+
+    async def _unindexed_threads(self):
+        # Threads whose latest root checkpoint has interrupt writes (also those of a subgraph) but no row
+        rows = await self.db.read(
+            "SELECT DISTINCT w.thread_id FROM writes w WHERE w.channel = '__interrupt__' AND w.checkpoint_ns = '' "
+            "AND w.checkpoint_id = (SELECT MAX(c.checkpoint_id) FROM checkpoints c WHERE c.thread_id = w.thread_id AND c.checkpoint_ns = '') "
+            "AND w.thread_id NOT IN (SELECT thread_id FROM pending_interrupts)"
+        )
+        return [row[0] for row in rows]
+
+    async def _count(self):
+        return (await self.db.read("SELECT COUNT(*) FROM pending_interrupts"))[0][0]
+
+    def _item(self, row):
+        thread_id, created_at, request, configurable = row
+        return {"thread_id": thread_id, "created_at": created_at, "request": json.loads(request), "configurable": json.loads(configurable)}
+
+    # Callable from any event loop
+    async def add(self, thread_id: str, request: dict, configurable: dict | None = None):
+        await self.db.submit(self._add(thread_id, request, configurable or {}))
+
+    async def remove(self, thread_id: str):
+        await self.db.submit(self._remove(thread_id))
+
+    async def get(self, thread_id: str):
+        return await self.db.submit(self._get(thread_id))
+
+    async def get_many(self, thread_ids) -> dict:
+        return await self.db.submit(self._get_many(list(thread_ids)))
+
+    async def remove_many(self, thread_ids):
+        await self.db.submit(self._remove_many(list(thread_ids)))
+
+    async def restore(self, items):
+        """Put back items removed for a resume that failed, so they can be answered again."""
+        await self.db.submit(self._restore(list(items)))
+
+    async def unindexed_threads(self) -> list[str]:
+        """Threads that stopped at an interrupt in their latest checkpoint but have no row (see AgentInbox.reconcile)."""
+        return await self.db.submit(self._unindexed_threads())
+
+    async def page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+        return await self.db.submit(self._page(limit, cursor))
+
+    async def count(self) -> int:
+        return await self.db.submit(self._count())
+
+    async def record(self, result, config: dict):
+        """Add a row if a graph run's result stopped at an interrupt; returns the request, or None."""
+        request = interrupt_request(result)
+        if request is not None:
+            await self.add(config["configurable"]["thread_id"], request, config["configurable"])
+        return request
+
+def pending_index(checkpointer):
+    """PendingIndex of a SqliteCheckpointer's database; None for other checkpointers."""
+    return PendingIndex(checkpointer.db) if isinstance(checkpointer, SqliteCheckpointer) else None
+
+# One database (and checkpointer / store pair) per file, opened on first use
+_persistence = {}
+_lock = threading.Lock()
+
+def get_persistence(path: str = DEFAULT_DB_PATH, **kwargs):
+    """Return the SQLite checkpointer and store for a database file.
+
+    Args:
+        path: SQLite database file, created if missing
+        **kwargs: Passed to SqliteDatabase (pool_size, max_batch)
+
+    Returns:
+        tuple: (SqliteCheckpointer, SqliteStore) sharing one connection pool
+    """
+    with _lock:
+        if path not in _persistence:
+            db = SqliteDatabase(path, **kwargs)
+            _persistence[path] = (SqliteCheckpointer(db), SqliteStore(db))
+        return _persistence[path]
@@ -0,0 +1,357 @@
+import asyncio
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.errors import GraphInterrupt
+
+# Prometheus and OpenTelemetry are optional; without them metrics are only kept in-process
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+# USD per million (input, output) tokens, for the cost metric
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+}
+
+# Human review can take days, so interrupt waits get their own buckets
+INTERRUPT_WAIT_BUCKETS = (1, 10, 60, 300, 1800, 3600, 4 * 3600, 24 * 3600, 7 * 24 * 3600)
+# Queueing in the priority scheduler ranges from instant to the bulk lane's SLA
+QUEUE_WAIT_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+
+# Logging
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and the record's structured fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if trace is not None:
+            context = trace.get_current_span().get_span_context()
+            if context.is_valid:
+                entry["trace_id"] = format(context.trace_id, "032x")
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class StructuredLogger(logging.LoggerAdapter):
+    """Logger taking structured fields as keyword arguments: logger.info("Classified", classification="respond")."""
+
+    def process(self, msg, kwargs):
+        fields = {name: kwargs.pop(name) for name in list(kwargs) if name not in ("exc_info", "stack_info", "stacklevel", "extra")}
+        kwargs["extra"] = {**kwargs.get("extra", {}), "fields": fields}
+        return msg, kwargs
+
+_root_logger = logging.getLogger("email_assistant")
+# Until configure_logging is called, messages print like they always did
+if not _root_logger.handlers:
+    _default_handler = logging.StreamHandler(sys.stdout)
+    _default_handler.setFormatter(logging.Formatter("%(message)s"))
+    _root_logger.addHandler(_default_handler)
+    _root_logger.setLevel(logging.INFO)
+    _root_logger.propagate = False
+
+def get_logger(name: str) -> StructuredLogger:
+    """Logger for a module, under the "email_assistant" logger."""
+    return StructuredLogger(logging.getLogger(f"email_assistant.{name.rsplit('.', 1)[-1]}"), {})
+
+def configure_logging(level=logging.INFO, json_format: bool = True, stream=None):
+    """Send the assistant's logs to stream (stderr by default), as JSON lines unless json_format is False."""
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    for existing in list(_root_logger.handlers):
+        _root_logger.removeHandler(existing)
+    _root_logger.addHandler(handler)
+    _root_logger.setLevel(level)
+
+# Metrics
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, value=1):
+        pass
+
+    def set(self, value):
+        pass
+
+if prometheus_client is not None:
+    NODE_SECONDS = prometheus_client.Histogram("email_assistant_node_seconds", "Wall time per graph node run", ["node", "outcome"])
+    LLM_SECONDS = prometheus_client.Histogram("email_assistant_llm_seconds", "Latency of chat model calls", ["model"])
+    LLM_TOKENS = prometheus_client.Counter("email_assistant_llm_tokens_total", "Chat model tokens", ["model", "kind"])
+    LLM_COST = prometheus_client.Counter("email_assistant_llm_cost_usd_total", "Estimated chat model cost in USD", ["model"])
+    LLM_RETRIES = prometheus_client.Counter("email_assistant_llm_retries_total", "Chat model call retries", ["model"])
+    LLM_ERRORS = prometheus_client.Counter("email_assistant_llm_errors_total", "Failed chat model calls", ["model"])
+    TOOL_SECONDS = prometheus_client.Histogram("email_assistant_tool_seconds", "Tool call latency", ["tool", "outcome"])
+    CIRCUIT_OPENS = prometheus_client.Counter("email_assistant_circuit_opens_total", "Circuit breaker trips", ["dependency"])
+    COALESCED = prometheus_client.Counter("email_assistant_coalesced_total", "Emails folded into a later run of their thread", ["outcome"])
+    PRE_TRIAGE = prometheus_client.Counter(
+        "email_assistant_pre_triage_total", "Emails seen by pre-triage, by the rule that decided them (\"llm\" when none did)", ["outcome"]
+    )
+    QUEUE_DEPTH = prometheus_client.Gauge("email_assistant_queue_depth", "Emails waiting in the priority scheduler", ["lane"])
+    QUEUE_WAIT = prometheus_client.Histogram("email_assistant_queue_wait_seconds", "Time from enqueue to start of an email's run", ["lane"], buckets=QUEUE_WAIT_BUCKETS)
+    INTERRUPT_WAIT = prometheus_client.Histogram(
+        "email_assistant_interrupt_wait_seconds", "Time from an interrupt to its resume", ["node"], buckets=INTERRUPT_WAIT_BUCKETS
+    )
+    CONTEXT_TOKENS = prometheus_client.Counter(
+        "email_assistant_context_tokens_total", "Estimated agent prompt tokens before and after context trimming", ["stage"]
+    )
+    CONTEXT_SUMMARIZED = prometheus_client.Counter("email_assistant_context_summarized_turns_total", "Older agent turns replaced by a summary")
+else:
+    NODE_SECONDS = LLM_SECONDS = LLM_TOKENS = LLM_COST = LLM_RETRIES = LLM_ERRORS = TOOL_SECONDS = CIRCUIT_OPENS = COALESCED = PRE_TRIAGE = QUEUE_DEPTH = QUEUE_WAIT = INTERRUPT_WAIT = _NoopMetric()
+    CONTEXT_TOKENS = CONTEXT_SUMMARIZED = _NoopMetric()
+
+_lock = threading.Lock()
+# In-process totals, for benchmarks and quick checks without Prometheus
+_stats = defaultdict(lambda: {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+_totals = defaultdict(int)
+# (thread_id, node) -> time the node interrupted, to measure how long the review took
+_interrupted = {}
+MAX_TRACKED_INTERRUPTS = 100_000
+# Functions called with (kind, name, seconds) for every measurement
+_listeners = []
+
+def _record(kind, name, seconds):
+    with _lock:
+        entry = _stats[(kind, name)]
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+    for listener in _listeners:
+        listener(kind, name, seconds)
+
+def add_listener(listener):
+    """Call listener(kind, name, seconds) for every node run, tool call, model call and interrupt wait.
+
+    kind is "node", "tool", "llm", "interrupt_wait" or "queue_wait"; used e.g. to keep samples for percentiles.
+    """
+    _listeners.append(listener)
+
+def remove_listener(listener):
+    """Stop calling a listener added with add_listener."""
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def record_tool(name: str, seconds: float, outcome: str = "ok"):
+    """Record one tool call; outcome is "ok", "error" or "timeout"."""
+    TOOL_SECONDS.labels(name, outcome).observe(seconds)
+    _record("tool", name, seconds)
+
+def record_retry(model: str):
+    """Count a retried chat model call (model, or the call policy name such as "router" or "gmail")."""
+    LLM_RETRIES.labels(model).inc()
+    with _lock:
+        _totals["llm_retries"] += 1
+
+def record_circuit_open(dependency: str):
+    """Count a circuit breaker opening for a dependency ("llm", "gmail")."""
+    CIRCUIT_OPENS.labels(dependency).inc()
+    with _lock:
+        _totals[f"circuit_opens:{dependency}"] += 1
+
+def record_coalesced(outcome: str):
+    """Count an email whose run was folded into a newer message of its thread ("held" or "cancelled")."""
+    COALESCED.labels(outcome).inc()
+    with _lock:
+        _totals[f"coalesced:{outcome}"] += 1
+
+def record_pre_triage(rule: str | None):
+    """Count an email seen by pre-triage: the rule that classified it, or None when it goes to the LLM.
+
+    The skip rate is the share of outcomes other than "llm".
+    """
+    PRE_TRIAGE.labels(rule or "llm").inc()
+    with _lock:
+        _totals["pre_triage_seen"] += 1
+        if rule is not None:
+            _totals["pre_triage_skipped"] += 1
+
+def record_queue_depth(lane: str, depth: int):
+    """Set the number of emails waiting in a priority lane."""
+    QUEUE_DEPTH.labels(lane).set(depth)
+
+def record_queue_wait(lane: str, seconds: float):
+    """Record how long an email waited in its priority lane before its run started."""
+    QUEUE_WAIT.labels(lane).observe(seconds)
+    _record("queue_wait", lane, seconds)
+
+def record_context(tokens_before: int, tokens_after: int, summarized_turns: int):
+    """Record one bounded agent prompt: estimated tokens before and after trimming, and turns summarized.
+
+    The numbers are also set on the current span (the node run preparing the prompt), if any.
+    """
+    CONTEXT_TOKENS.labels("before").inc(tokens_before)
+    CONTEXT_TOKENS.labels("after").inc(tokens_after)
+    CONTEXT_SUMMARIZED.inc(summarized_turns)
+    with _lock:
+        _totals["context_tokens_before"] += tokens_before
+        _totals["context_tokens_after"] += tokens_after
+        _totals["context_summarized_turns"] += summarized_turns
+    if trace is not None:
+        trace.get_current_span().set_attributes(
+            {"context.tokens_before": tokens_before, "context.tokens_after": tokens_after, "context.summarized_turns": summarized_turns}
+        )
+
+def record_llm(model: str, seconds: float, input_tokens: int = 0, output_tokens: int = 0):
+    """Record one chat model call with its token usage and estimated cost."""
+    input_price, output_price = MODEL_PRICES.get(model.split(":")[-1], (0.0, 0.0))
+    cost = (input_tokens * input_price + output_tokens * output_price) / 1e6
+    LLM_SECONDS.labels(model).observe(seconds)
+    LLM_TOKENS.labels(model, "prompt").inc(input_tokens)
+    LLM_TOKENS.labels(model, "completion").inc(output_tokens)
+    LLM_COST.labels(model).inc(cost)
+    _record("llm", model, seconds)
+    with _lock:
+        _totals["prompt_tokens"] += input_tokens
+        _totals["completion_tokens"] += output_tokens
+        _totals["cost_usd"] += cost
+
+def stats() -> dict:
+    """In-process totals: count / seconds / max_seconds per node, tool, model and interrupt wait, plus tokens and cost."""
+    with _lock:
+        result = defaultdict(dict)
+        for (kind, name), entry in _stats.items():
+            result[kind][name] = dict(entry)
+        result["totals"] = dict(_totals)
+        return dict(result)
+
+def reset_stats():
+    """Clear the in-process totals (Prometheus counters are left alone)."""
+    with _lock:
+        _stats.clear()
+        _totals.clear()
+
+@contextmanager
+def span(name: str, **attributes):
+    """OpenTelemetry span around a block, if OpenTelemetry is installed."""
+    if trace is None:
+        yield None
+        return
+    with trace.get_tracer("email_assistant").start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+def _thread_id(args, kwargs):
+    config = kwargs.get("config") or next((arg for arg in args[1:] if isinstance(arg, dict) and "configurable" in arg), None)
+    if config is None:
+        try:
+            from langgraph.config import get_config
+            config = get_config()
+        except Exception:
+            return None
+    return config.get("configurable", {}).get("thread_id")
+
+@contextmanager
+def _node_run(name, args, kwargs):
+    thread_id = _thread_id(args, kwargs)
+    start = time.perf_counter()
+    with _lock:
+        interrupted_at = _interrupted.pop((thread_id, name), None)
+    if interrupted_at is not None:
+        INTERRUPT_WAIT.labels(name).observe(time.time() - interrupted_at)
+        _record("interrupt_wait", name, time.time() - interrupted_at)
+
+    outcome = "ok"
+    with span(f"node {name}", node=name, thread_id=str(thread_id)):
+        try:
+            yield
+        except GraphInterrupt:
+            # Waiting for a human is not a failure; remember when it started
+            outcome = "interrupt"
+            with _lock:
+                if len(_interrupted) < MAX_TRACKED_INTERRUPTS:
+                    _interrupted[(thread_id, name)] = time.time()
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            NODE_SECONDS.labels(name, outcome).observe(seconds)
+            _record("node", name, seconds)
+
+def instrument_node(name: str, fn):
+    """Wrap a graph node (sync or async) with timing, a span and interrupt-wait tracking.
+
+    The wrapper keeps fn's signature, so LangGraph still injects config and store.
+    """
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with _node_run(name, args, kwargs):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _node_run(name, args, kwargs):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def instrumented(name: str):
+    """Decorator form of instrument_node, for functions that are not graph nodes (e.g. update_memory)."""
+    return lambda fn: instrument_node(name, fn)
+
+class TelemetryCallbackHandler(BaseCallbackHandler):
+    """LangChain callback recording latency, token usage, cost, retries and errors of chat model calls."""
+
+    def __init__(self):
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = (metadata or {}).get("ls_model_name") or params.get("model") or params.get("model_name") or "unknown"
+        self._runs[run_id] = (model, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        model, start = self._runs.pop(run_id, ("unknown", time.perf_counter()))
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not input_tokens and response.llm_output:
+            usage = response.llm_output.get("token_usage") or {}
+            input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        record_llm(model, time.perf_counter() - start, input_tokens, output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        model, _ = self._runs.pop(run_id, ("unknown", 0.0))
+        LLM_ERRORS.labels(model).inc()
+
+    def on_retry(self, retry_state, *, run_id, **kwargs):
+        model, _ = self._runs.get(run_id, ("unknown", 0.0))
+        record_retry(model)
+
+# Attached to every model built by the model registry
+telemetry_callbacks = TelemetryCallbackHandler()
+
+def start_metrics_server(port: int = 9464):
+    """Expose the Prometheus metrics on http://0.0.0.0:port/metrics."""
+    if prometheus_client is None:
+        raise ValueError("prometheus_client is not installed; pip install prometheus-client")
+    prometheus_client.start_http_server(port)
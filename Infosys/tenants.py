@@ -0,0 +1,211 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
+from functools import cached_property
+
+from email_assistant.pre_triage import PreTriage, get_pre_triage, stats_path_for
+from email_assistant.triage_cache import TriageCache, triage_cache
+
+# Run config key (under "configurable") naming the tenant a run belongs to
+TENANT_KEY = "tenant_id"
+
+# Tenant ids become memory namespace labels (which the SQLite store joins with ".") and thread
+# id prefixes (joined with ":"), so they are limited to letters, digits, "_" and "-"
+TENANT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+# Per-tenant limits, so one busy mailbox cannot starve the others on a shared node
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RATE_PER_MINUTE = 60
+
+# Preferences a tenant can override; anything missing falls back to the defaults in prompts.py
+PREFERENCE_KINDS = ("background", "triage_preferences", "response_preferences", "cal_preferences")
+
+class Tenant:
+    """One mailbox served by the shared graph: its memory namespaces, Gmail token, preferences and limits.
+
+    Each tenant gets its own pre-triage sender statistics and triage cache, so decisions
+    learned for one mailbox never leak into another. The default tenant (tenant_id None)
+    keeps the original single-user namespaces and the process-wide pre-triage and triage_cache.
+
+    Args:
+        tenant_id: Name of the tenant, used in memory namespaces and thread ids
+        token_path: OAuth token file of the tenant's Gmail account; None for gmail_pool's default
+        preferences: Initial memory content per kind in PREFERENCE_KINDS, replacing the defaults
+        max_concurrency: Emails of this tenant in flight at once (None = unlimited)
+        rate_per_minute: Emails of this tenant started per minute, with bursts up to max_concurrency (None = unlimited)
+        allow_senders: Senders that always reach the triage LLM (see PreTriage)
+        deny_senders: Senders that are always ignored (see PreTriage)
+        vip_senders: Addresses or "@domain"s whose mail goes to the priority scheduler's urgent lane
+        weight: Share of the priority scheduler's capacity relative to other tenants in the same lane
+    """
+
+    def __init__(self, tenant_id: str | None, token_path: str | None = None, preferences: dict | None = None,
+                 max_concurrency: int | None = DEFAULT_MAX_CONCURRENCY, rate_per_minute: float | None = DEFAULT_RATE_PER_MINUTE,
+                 allow_senders=(), deny_senders=(), vip_senders=(), weight: float = 1.0,
+                 pre_triage: PreTriage | None = None, triage_cache: TriageCache | None = None):
+        unknown = set(preferences or {}) - set(PREFERENCE_KINDS)
+        if unknown:
+            raise ValueError(f"Unknown preference kinds {sorted(unknown)}; expected some of {PREFERENCE_KINDS}")
+        if weight <= 0:
+            raise ValueError(f"Tenant weight must be positive, got {weight}")
+        self.tenant_id = tenant_id
+        self.token_path = token_path
+        self.preferences = dict(preferences or {})
+        self.max_concurrency = max_concurrency
+        self.rate_per_minute = rate_per_minute
+        self.vip_senders = {sender.lower() for sender in vip_senders}
+        self.weight = weight
+        self._allow_senders = allow_senders
+        self._deny_senders = deny_senders
+        if pre_triage is not None:
+            self.pre_triage = pre_triage
+        self.triage_cache = triage_cache or TriageCache()
+
+        self.started = 0
+        self.throttled_seconds = 0.0
+        self._running = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        # Token bucket for rate_per_minute
+        self._burst = max(1, max_concurrency or 1)
+        self._tokens = float(self._burst)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @cached_property
+    def pre_triage(self) -> PreTriage:
+        """The tenant's pre-triage, built on first use since it reads the learned sender statistics."""
+        if self.tenant_id is None:
+            return get_pre_triage()
+        # Learned sender statistics are saved per tenant
+        return PreTriage(allow_senders=self._allow_senders, deny_senders=self._deny_senders, stats_path=stats_path_for(self.tenant_id))
+
+    def namespace(self, kind: str) -> tuple:
+        """Memory namespace of one kind of preference, e.g. ("email_assistant", "alice", "triage_preferences")."""
+        if self.tenant_id is None:
+            return ("email_assistant", kind)
+        return ("email_assistant", self.tenant_id, kind)
+
+    def preference(self, kind: str, default: str) -> str:
+        """Initial content for a kind of preference: the tenant's own, or the given default."""
+        return self.preferences.get(kind, default)
+
+    def thread_id(self, email_id: str) -> str:
+        """Checkpoint thread of an email; prefixed with the tenant so mailboxes never share threads."""
+        return email_id if self.tenant_id is None else f"{self.tenant_id}:{email_id}"
+
+    def _take_token(self) -> float:
+        """Take a token from the bucket; returns 0 on success or the seconds to wait for one."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self.rate_per_minute / 60)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) * 60 / self.rate_per_minute
+
+    async def throttle(self):
+        """Wait until this tenant's rate limit allows another email."""
+        if self.rate_per_minute:
+            while (wait := self._take_token()) > 0:
+                self.throttled_seconds += wait
+                await asyncio.sleep(wait)
+
+    @asynccontextmanager
+    async def slot(self, throttle: bool = True):
+        """Wait until this tenant may start another email (rate limit first, then concurrency).
+
+        Pass throttle=False when the rate limit was already waited out (see PriorityScheduler.slot).
+        """
+        if throttle:
+            await self.throttle()
+        async with self._semaphore or nullcontext():
+            self._running += 1
+            self.started += 1
+            try:
+                yield
+            finally:
+                self._running -= 1
+
+    def stats(self) -> dict:
+        """Emails started and running, and time spent waiting on the rate limit."""
+        return {
+            "started": self.started,
+            "running": self._running,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "pre_triage": self.pre_triage.stats(),
+            "triage_cache": self.triage_cache.stats(),
+        }
+
+class TenantRegistry:
+    """Tenants served by this process, looked up by the tenant_id in each run's config."""
+
+    def __init__(self):
+        # Single-user deployments keep working unchanged: no tenant_id means the default tenant
+        self.default = Tenant(None, max_concurrency=None, rate_per_minute=None, triage_cache=triage_cache)
+        self._tenants = {}
+        self._lock = threading.Lock()
+
+    def register(self, tenant_id: str, **kwargs) -> Tenant:
+        """Add (or replace) a tenant; kwargs are passed to Tenant."""
+        if not isinstance(tenant_id, str) or not TENANT_ID_PATTERN.fullmatch(tenant_id):
+            raise ValueError(f"Invalid tenant id {tenant_id!r}; use only letters, digits, '_' and '-' (e.g. 'alice_smith')")
+        tenant = Tenant(tenant_id, **kwargs)
+        with self._lock:
+            self._tenants[tenant_id] = tenant
+        return tenant
+
+    def remove(self, tenant_id: str):
+        """Stop serving a tenant. Its memory stays in the store."""
+        with self._lock:
+            self._tenants.pop(tenant_id, None)
+
+    def get(self, tenant_id: str | None) -> Tenant:
+        """Return a registered tenant, or the default tenant for None."""
+        if tenant_id is None:
+            return self.default
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+        if tenant is None:
+            raise ValueError(f"Unknown tenant {tenant_id!r}; register it with tenant_registry.register first")
+        return tenant
+
+    def load(self, path: str):
+        """Register every tenant in a JSON file of {tenant_id: {token_path, preferences, max_concurrency, ...}}."""
+        with open(path) as f:
+            for tenant_id, settings in json.load(f).items():
+                self.register(tenant_id, **settings)
+
+    def ids(self) -> list[str]:
+        """Ids of the registered tenants."""
+        with self._lock:
+            return list(self._tenants)
+
+    def stats(self) -> dict:
+        """Tenant.stats() for every registered tenant."""
+        with self._lock:
+            tenants = dict(self._tenants)
+        return {tenant_id: tenant.stats() for tenant_id, tenant in tenants.items()}
+
+# Process-wide registry shared by every graph and runner
+tenant_registry = TenantRegistry()
+
+def current_tenant(config: dict | None = None) -> Tenant:
+    """Tenant of a run, from config or (inside a graph node) from the run's own config."""
+    if config is None:
+        try:
+            from langgraph.config import get_config
+            config = get_config()
+        except RuntimeError:
+            # Called outside a graph run
+            config = {}
+    return tenant_registry.get(config.get("configurable", {}).get(TENANT_KEY))
+
+def tenant_config(tenant_id: str, config: dict | None = None) -> dict:
+    """Run config for a tenant: config with tenant_id set under "configurable"."""
+    tenant_registry.get(tenant_id)
+    config = config or {}
+    return {**config, "configurable": {**config.get("configurable", {}), TENANT_KEY: tenant_id}}
@@ -0,0 +1,75 @@
+"""Batch triage sends one router call per batch, with a fallback call only for emails the batch skipped."""
+import re
+
+from email_assistant.batch_triage import BatchRouterDecision, BatchRouterSchema, batch_triage, make_batches
+from email_assistant.schemas import RouterSchema
+
+EMAIL_INDEX = re.compile(r'<email index="(\d+)">')
+
+class FakeBatchRouter:
+    """Batch router that classifies every email it is shown, except the indices in skip."""
+
+    def __init__(self, skip=()):
+        self.skip = set(skip)
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(messages)
+        indices = [int(index) for index in EMAIL_INDEX.findall(messages[-1]["content"])]
+        return BatchRouterSchema(decisions=[
+            BatchRouterDecision(index=index, reasoning="fake", classification="notify")
+            for index in indices if index not in self.skip
+        ])
+
+class FakeRouter:
+    """Single-email router counting its calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(messages)
+        return RouterSchema(reasoning="fake", classification="respond")
+
+def emails(count):
+    return [(f"sender{i}@example.com", "me@example.com", f"Subject {i}", f"Body of email {i}") for i in range(count)]
+
+def test_one_router_call_per_batch():
+    batch_router, router = FakeBatchRouter(), FakeRouter()
+    results = batch_triage(emails(45), batch_router, router, "system prompt", batch_size=20)
+
+    assert len(batch_router.calls) == 3
+    assert len(router.calls) == 0
+    assert [result.classification for result in results] == ["notify"] * 45
+    # The system prompt is sent once per batch
+    assert all(call[0]["content"] == "system prompt" for call in batch_router.calls)
+
+def test_skipped_emails_fall_back_to_single_calls():
+    batch_router, router = FakeBatchRouter(skip={1}), FakeRouter()
+    results = batch_triage(emails(10), batch_router, router, "system prompt", batch_size=5)
+
+    assert len(batch_router.calls) == 2
+    # Index 1 of each batch (emails 1 and 6) is classified on its own
+    assert len(router.calls) == 2
+    assert [i for i, result in enumerate(results) if result.classification == "respond"] == [1, 6]
+
+def test_decided_emails_never_reach_the_llm():
+    batch_router, router = FakeBatchRouter(), FakeRouter()
+    decided = [RouterSchema(reasoning="rule", classification="ignore") if i % 2 == 0 else None for i in range(8)]
+    results = batch_triage(emails(8), batch_router, router, "system prompt", batch_size=20, decided=decided)
+
+    assert len(batch_router.calls) == 1
+    assert len(EMAIL_INDEX.findall(batch_router.calls[0][-1]["content"])) == 4
+    assert [result.classification for result in results] == ["ignore", "notify"] * 4
+
+def test_all_decided_makes_no_calls():
+    batch_router, router = FakeBatchRouter(), FakeRouter()
+    decided = [RouterSchema(reasoning="rule", classification="ignore")] * 3
+    batch_triage(emails(3), batch_router, router, "system prompt", decided=decided)
+
+    assert batch_router.calls == [] and router.calls == []
+
+def test_batches_are_bounded_by_size_and_characters():
+    assert make_batches(emails(5), batch_size=2) == [[0, 1], [2, 3], [4]]
+    # Every email is about 60 characters, so 130 characters fit two of them
+    assert make_batches(emails(5), batch_size=20, max_chars=130) == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,290 @@
+"""GmailInboxStream and feed_graph against an in-memory fake of the Gmail API."""
+import asyncio
+import base64
+import json
+import time
+from email.message import EmailMessage
+from typing import TypedDict
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from email_assistant import resilience
+from email_assistant.gmail_ingest import GmailInboxStream, feed_graph, poll_inbox
+from email_assistant.resilience import CircuitBreaker
+from email_assistant.thread_coalescer import SUPERSEDED_KEY, ThreadCoalescer
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b'{"error": {"message": "Gmail error"}}')
+
+def not_found():
+    return http_error(404)
+
+@pytest.fixture(autouse=True)
+def gmail_breaker(monkeypatch):
+    """A fresh Gmail circuit breaker per test, so failures in one test never open it for the next."""
+    monkeypatch.setitem(resilience._breakers, "gmail", CircuitBreaker("gmail"))
+
+class Request:
+    def __init__(self, fn):
+        self.fn = fn
+
+    def execute(self):
+        return self.fn()
+
+class FakeGmail:
+    """Just enough of users().{getProfile, messages().list/get, history().list} for the stream."""
+
+    def __init__(self):
+        self.history_id = 100
+        self.inbox = {}
+        # (history id, message id) of every message added to the inbox
+        self.added = []
+        self.history_expired = False
+        self.gets = 0
+        # Statuses the next message gets fail with, one per call
+        self.get_errors = []
+
+    def add(self, message_id, subject, thread_id=None):
+        self.history_id += 1
+        message = EmailMessage()
+        message["From"], message["To"], message["Subject"] = "alice@example.com", "me@example.com", subject
+        message.set_content(f"Body of {subject}")
+        self.inbox[message_id] = {
+            "id": message_id, "threadId": thread_id or message_id, "historyId": str(self.history_id), "labelIds": ["INBOX", "UNREAD"],
+            "raw": base64.urlsafe_b64encode(message.as_bytes()).decode("ascii"),
+        }
+        self.added.append((self.history_id, message_id))
+
+    # users()
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return Request(lambda: {"historyId": str(self.history_id)})
+
+    # users().messages() and users().history()
+    def messages(self):
+        return self
+
+    def history(self):
+        return self
+
+    def get(self, userId, id, format):
+        def fetch():
+            self.gets += 1
+            if self.get_errors:
+                raise http_error(self.get_errors.pop(0))
+            if id not in self.inbox:
+                raise not_found()
+            return self.inbox[id]
+        return Request(fetch)
+
+    def list(self, userId, pageToken=None, maxResults=50, q=None, startHistoryId=None, **kwargs):
+        if startHistoryId is None:
+            # messages.list, newest first, one message per page to exercise paging
+            ids = [message_id for _, message_id in reversed(self.added)]
+            return Request(lambda: self._page([{"id": message_id} for message_id in ids], pageToken, 1, "messages"))
+
+        def history():
+            # The first page is served; the history is found expired while paging on
+            if self.history_expired and pageToken is not None:
+                raise not_found()
+            records = [
+                {"messagesAdded": [{"message": {"id": message_id, "labelIds": ["INBOX", "UNREAD"]}}]}
+                for history_id, message_id in self.added if history_id > int(startHistoryId)
+            ]
+            return self._page(records, pageToken, 1, "history")
+        return Request(history)
+
+    def _page(self, items, page_token, size, key):
+        start = int(page_token or 0)
+        page = {key: items[start:start + size]}
+        if start + size < len(items):
+            page["nextPageToken"] = str(start + size)
+        return page
+
+def stream_for(gmail, tmp_path, **kwargs):
+    return GmailInboxStream(gmail, checkpoint_path=str(tmp_path / "state.json"), **kwargs)
+
+def test_full_then_incremental_sync(tmp_path):
+    gmail = FakeGmail()
+    gmail.add("m1", "First")
+    gmail.add("m2", "Second")
+    stream = stream_for(gmail, tmp_path)
+
+    emails = list(stream.sync())
+    assert sorted(email["id"] for email in emails) == ["m1", "m2"]
+    for email in emails:
+        stream.ack(email)
+    assert stream.history_id == "102"
+
+    gmail.add("m3", "Third")
+    assert [email["id"] for email in stream.sync()] == ["m3"]
+
+def test_failed_email_does_not_replay_acknowledged_ones(tmp_path):
+    gmail = FakeGmail()
+    stream = stream_for(gmail, tmp_path)
+    list(stream.sync())
+    for index in range(1, 4):
+        gmail.add(f"m{index}", f"Email {index}")
+
+    for email in stream.sync():
+        if email["id"] == "m2":
+            assert stream.fail(email, RuntimeError("model down")) is False
+        else:
+            stream.ack(email)
+    # The checkpoint waits for m2...
+    assert stream.history_id == "100"
+
+    # ...but only m2 (and new mail) is delivered again, also after a restart
+    gmail.add("m4", "Email 4")
+    stream = stream_for(gmail, tmp_path)
+    gets = gmail.gets
+    emails = list(stream.sync())
+    assert [email["id"] for email in emails] == ["m2", "m4"]
+    assert gmail.gets - gets == 2
+
+    for email in emails:
+        stream.ack(email)
+    assert stream.history_id == "104"
+
+def test_email_is_dead_lettered_after_max_attempts(tmp_path):
+    gmail = FakeGmail()
+    stream = stream_for(gmail, tmp_path, max_attempts=3)
+    list(stream.sync())
+    gmail.add("bad", "Poison")
+    gmail.add("good", "Fine")
+
+    for attempt in range(3):
+        for email in stream.sync():
+            if email["id"] == "bad":
+                stream.fail(email, ValueError("cannot parse"))
+            else:
+                stream.ack(email)
+
+    assert stream.history_id == "102"
+    assert list(stream.sync()) == []
+    letters = [json.loads(line) for line in open(tmp_path / "state.dead_letter.jsonl")]
+    assert [(letter["id"], letter["attempts"]) for letter in letters] == [("bad", 3)]
+
+def test_expired_history_falls_back_without_redelivery(tmp_path):
+    gmail = FakeGmail()
+    stream = stream_for(gmail, tmp_path)
+    list(stream.sync())
+    gmail.add("m1", "First")
+    gmail.add("m2", "Second")
+    gmail.history_expired = True
+
+    emails = [email["id"] for email in stream.sync()]
+    # m1 came from the first history page, then the full sync lists m2 and m1 again
+    assert emails == ["m1", "m2"]
+
+class Counted(TypedDict):
+    email_input: dict
+
+def counting_graph(runs, fail=False, seconds=0.0, inputs=None):
+    async def triage(state):
+        runs.append(state["email_input"]["id"])
+        if inputs is not None:
+            inputs.append(state["email_input"])
+        await asyncio.sleep(seconds)
+        if fail:
+            raise RuntimeError("model down")
+        return {}
+    builder = StateGraph(Counted)
+    builder.add_node("triage", triage)
+    builder.add_edge(START, "triage")
+    builder.add_edge("triage", END)
+    return builder.compile(checkpointer=InMemorySaver())
+
+def test_feed_graph_runs_each_email_once(tmp_path):
+    gmail = FakeGmail()
+    gmail.add("m1", "First")
+    gmail.add("m2", "Second")
+    runs = []
+    graph = counting_graph(runs)
+
+    assert asyncio.run(feed_graph(graph, stream_for(gmail, tmp_path), coalescer=None)) == 2
+    # A new stream (lost checkpoint) delivers both again; their threads already ran
+    (tmp_path / "state.json").unlink()
+    assert asyncio.run(feed_graph(graph, stream_for(gmail, tmp_path), coalescer=None)) == 2
+    assert sorted(runs) == ["m1", "m2"]
+
+def test_feed_graph_dead_letters_a_failing_email(tmp_path):
+    gmail = FakeGmail()
+    gmail.add("m1", "First")
+    runs = []
+    graph = counting_graph(runs, fail=True)
+    stream = stream_for(gmail, tmp_path, max_attempts=2)
+
+    for _ in range(3):
+        assert asyncio.run(feed_graph(graph, stream, coalescer=None)) == 0
+    # Two attempts, then the checkpoint moved past it
+    assert runs == ["m1", "m1"]
+    assert stream.history_id == "101"
+
+def test_feed_graph_runs_a_thread_once_and_acknowledges_all_of_it(tmp_path):
+    gmail = FakeGmail()
+    gmail.add("m1", "Question", thread_id="t1")
+    gmail.add("m2", "Re: Question", thread_id="t1")
+    gmail.add("m3", "Other", thread_id="t2")
+    runs, inputs = [], []
+    stream = stream_for(gmail, tmp_path)
+
+    assert asyncio.run(feed_graph(counting_graph(runs, inputs=inputs), stream, coalescer=ThreadCoalescer(window_seconds=0.05))) == 3
+    assert sorted(runs) == ["m2", "m3"]
+    # The newest message of t1 carries the older one it covers, which was acknowledged with it
+    assert {email["id"]: email.get(SUPERSEDED_KEY) for email in inputs} == {"m2": ["m1"], "m3": []}
+    assert stream.history_id == "103"
+
+def test_held_emails_do_not_occupy_workers(tmp_path):
+    gmail = FakeGmail()
+    for index in range(8):
+        gmail.add(f"m{index}", f"Email {index}")
+    runs = []
+    coalescer = ThreadCoalescer(window_seconds=0.3)
+
+    start = time.perf_counter()
+    assert asyncio.run(feed_graph(counting_graph(runs), stream_for(gmail, tmp_path), max_concurrency=2, coalescer=coalescer)) == 8
+    # Eight emails held in their workers would take four windows; held outside them, about one
+    assert time.perf_counter() - start < 0.9
+    assert len(runs) == 8
+
+def test_rate_limited_fetch_is_retried(tmp_path):
+    gmail = FakeGmail()
+    gmail.add("m1", "First")
+    gmail.get_errors = [429]
+    runs = []
+
+    assert asyncio.run(feed_graph(counting_graph(runs), stream_for(gmail, tmp_path), coalescer=None)) == 1
+    assert runs == ["m1"]
+    assert gmail.gets == 2
+
+def test_failed_sync_stops_the_workers_and_the_poller_goes_on(tmp_path):
+    gmail = FakeGmail()
+    gmail.add("m1", "First")
+    gmail.get_errors = [403]
+    runs = []
+    graph = counting_graph(runs)
+    stream = stream_for(gmail, tmp_path)
+
+    async def failed_sync():
+        with pytest.raises(HttpError):
+            await feed_graph(graph, stream, max_concurrency=4, coalescer=None)
+        # No worker is left waiting for the end of the stream
+        return [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    assert asyncio.run(failed_sync()) == []
+
+    async def poll():
+        gmail.get_errors = [403]
+        poller = asyncio.create_task(poll_inbox(graph, stream, interval_seconds=0.01, coalescer=None))
+        while not runs:
+            assert not poller.done()
+            await asyncio.sleep(0.01)
+        poller.cancel()
+    asyncio.run(asyncio.wait_for(poll(), timeout=5))
+    assert runs == ["m1"]
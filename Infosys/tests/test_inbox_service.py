@@ -0,0 +1,80 @@
+"""AgentInbox against the SQLite persistence: tenant config on resume, failed resumes and interrupts from other runners."""
+import asyncio
+from typing import TypedDict
+
+from langgraph.config import get_config
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import interrupt
+
+from email_assistant.async_runner import ainvoke_once, email_config
+from email_assistant.inbox_service import AgentInbox
+from email_assistant.sqlite_persistence import get_persistence
+from email_assistant.tenants import tenant_config, tenant_registry
+
+class Review(TypedDict):
+    email_input: dict
+    answer: str
+
+def review_graph(checkpointer, seen, fail=None):
+    """One node asking for review inside a subgraph, like the assistant's response agent."""
+    def ask(state):
+        response = interrupt([{"action_request": {"action": "send_email_tool", "args": {}}, "config": {"allow_accept": True}, "description": ""}])[0]
+        seen.append(get_config()["configurable"].get("tenant_id"))
+        if fail:
+            fail.pop()
+            raise RuntimeError("model down")
+        return {"answer": response["type"]}
+    agent = StateGraph(Review)
+    agent.add_node("ask", ask)
+    agent.add_edge(START, "ask")
+    agent.add_edge("ask", END)
+    builder = StateGraph(Review)
+    builder.add_node("response_agent", agent.compile())
+    builder.add_edge(START, "response_agent")
+    builder.add_edge("response_agent", END)
+    return builder.compile(checkpointer=checkpointer)
+
+async def settle(inbox):
+    while inbox._tasks:
+        await asyncio.gather(*list(inbox._tasks))
+
+def test_resume_keeps_the_tenant_and_failed_resumes_stay_pending(tmp_path):
+    tenant_registry.register("alice")
+    checkpointer, _ = get_persistence(str(tmp_path / "inbox.sqlite"))
+    seen, fail = [], [True]
+
+    async def main():
+        inbox = AgentInbox(review_graph(checkpointer, seen, fail), checkpointer.db)
+        thread_id = await inbox.submit({"id": "m1"}, tenant_config("alice"))
+        await settle(inbox)
+        assert thread_id == "alice:m1"
+        assert (await inbox.pending.get(thread_id))["configurable"] == {"tenant_id": "alice"}
+
+        # The first resume fails: the item is listed again and can be answered again
+        await inbox.respond(thread_id, {"type": "accept"})
+        await settle(inbox)
+        assert await inbox.pending.get(thread_id) is not None
+
+        await inbox.respond(thread_id, {"type": "accept"})
+        await settle(inbox)
+        assert await inbox.pending.get(thread_id) is None
+    asyncio.run(main())
+    assert seen == ["alice", "alice"]
+    tenant_registry.remove("alice")
+
+def test_interrupts_of_other_runners_are_listed(tmp_path):
+    checkpointer, _ = get_persistence(str(tmp_path / "inbox.sqlite"))
+    graph = review_graph(checkpointer, [])
+
+    async def main():
+        inbox = AgentInbox(graph, checkpointer.db)
+        # A run of feed_graph or worker_fleet goes through ainvoke_once
+        await ainvoke_once(graph, {"id": "m1"}, email_config({"id": "m1"}))
+        assert (await inbox.pending.get("m1"))["request"]["action_request"]["action"] == "send_email_tool"
+
+        # A process that died after claiming the item (removed, but never resumed)
+        await inbox.pending.remove("m1")
+        assert await inbox.reconcile() == 1
+        assert await inbox.pending.get("m1") is not None
+        assert await inbox.reconcile() == 0
+    asyncio.run(main())
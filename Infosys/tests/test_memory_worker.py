@@ -0,0 +1,68 @@
+"""MemoryUpdateQueue leases shared through the journal, and dead-lettering of failing updates."""
+import json
+import sqlite3
+import time
+
+from langchain_core.messages import convert_to_messages, messages_to_dict
+
+from email_assistant.memory_worker import MemoryUpdateQueue
+
+NAMESPACE = ("email_assistant", "triage_preferences")
+
+def wait_for(condition, timeout=3.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+def journal_event(path, content, owner, lease_until):
+    """An event journaled by another process, as it is left when that process stops renewing its lease."""
+    with sqlite3.connect(path) as journal:
+        journal.execute(
+            "INSERT INTO memory_events (queue, namespace, messages, created_at, owner, lease_until) VALUES (?, ?, ?, ?, ?, ?)",
+            ("default", json.dumps(NAMESPACE), json.dumps(messages_to_dict(convert_to_messages([{"role": "user", "content": content}]))),
+             time.time(), owner, lease_until),
+        )
+
+def journal_rows(path, table):
+    with sqlite3.connect(path) as journal:
+        return journal.execute(f"SELECT id, attempts FROM {table}").fetchall()
+
+def test_events_of_a_lapsed_lease_are_claimed_and_applied_once(tmp_path):
+    path = str(tmp_path / "memory_updates.sqlite")
+    applied = []
+    queue = MemoryUpdateQueue(None, lambda store, namespace, messages: applied.append((namespace, [message.content for message in messages])),
+                              journal_path=path, debounce_seconds=0.01, lease_seconds=0.3)
+    try:
+        journal_event(path, "expired", "crashed-host:1", time.time() - 1)
+        journal_event(path, "still leased", "busy-host:2", time.time() + 0.5)
+
+        # The expired lease is claimed at the next renewal; the live one only once it lapses
+        wait_for(lambda: applied)
+        assert applied == [(NAMESPACE, ["expired"])]
+        wait_for(lambda: len(applied) == 2)
+        assert applied[1] == (NAMESPACE, ["still leased"])
+
+        time.sleep(0.3)
+        assert len(applied) == 2
+        assert journal_rows(path, "memory_events") == []
+    finally:
+        queue.stop()
+
+def test_failing_update_is_dead_lettered_after_max_attempts(tmp_path):
+    path = str(tmp_path / "memory_updates.sqlite")
+    attempts = []
+    def update(store, namespace, messages):
+        attempts.append(namespace)
+        raise RuntimeError("model down")
+
+    queue = MemoryUpdateQueue(None, update, journal_path=path, debounce_seconds=0.01, max_attempts=2)
+    try:
+        queue.enqueue(NAMESPACE, [{"role": "user", "content": "Never archive invoices"}])
+        wait_for(lambda: queue.dead_lettered == 1)
+        assert len(attempts) == 2
+        assert queue.pending() == {}
+        assert journal_rows(path, "memory_events") == []
+        assert [count for _, count in journal_rows(path, "memory_dead_letters")] == [2]
+    finally:
+        queue.stop()
@@ -0,0 +1,45 @@
+"""RuleBook updates racing an update made by another process."""
+import asyncio
+
+from langgraph.store.memory import InMemoryStore
+
+from email_assistant import preference_rules
+from email_assistant.preference_rules import RULES_KEY, RuleBook, RuleOperation, RuleUpdate
+
+NAMESPACE = ("email_assistant", "triage_preferences")
+
+class RacingUpdater:
+    """Memory updater whose call takes long enough for another process to add a rule meanwhile."""
+
+    def __init__(self, store, other):
+        self.store = store
+        self.other = other
+
+    def _race(self):
+        document, _ = self.other.apply(self.store.get(NAMESPACE, RULES_KEY).value, [RuleOperation(op="add", text="Other process rule")])
+        self.store.put(NAMESPACE, RULES_KEY, document)
+        return RuleUpdate(operations=[RuleOperation(op="add", text="This process rule")])
+
+    def invoke(self, messages):
+        return self._race()
+
+    async def ainvoke(self, messages):
+        return self._race()
+
+def rule_texts(store):
+    return sorted(rule["text"] for rule in store.get(NAMESPACE, RULES_KEY).value["rules"].values())
+
+def test_update_keeps_rules_added_during_the_call(monkeypatch):
+    store = InMemoryStore()
+    rulebook, other = RuleBook(), RuleBook()
+    rulebook.load(store, NAMESPACE, "Default rule")
+    monkeypatch.setattr(preference_rules, "get_structured_model", lambda role, schema: RacingUpdater(store, other))
+
+    assert rulebook.update(store, NAMESPACE, [{"role": "user", "content": "feedback"}]) == 1
+    assert rule_texts(store) == ["Default rule", "Other process rule", "This process rule"]
+
+    # Async, and with the rule ids of both adds kept apart
+    assert asyncio.run(rulebook.aupdate(store, NAMESPACE, [{"role": "user", "content": "more feedback"}])) == 1
+    rules = store.get(NAMESPACE, RULES_KEY).value["rules"]
+    assert len(rules) == 5
+    assert sorted(rule["text"] for rule in rules.values()).count("This process rule") == 2
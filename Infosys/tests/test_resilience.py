@@ -0,0 +1,61 @@
+"""Circuit breaker outcomes of call / acall, in particular for the half-open trial call."""
+import asyncio
+import time
+
+import pytest
+
+from email_assistant import resilience
+from email_assistant.resilience import CircuitBreaker, CircuitOpenError, acall, call
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A breaker of its own dependency that is half-open: open, with the cool-down already over."""
+    monkeypatch.setitem(resilience.CALL_POLICIES, "test", {"dependency": "test", "timeout": 5.0, "deadline": 5.0, "max_attempts": 1, "hedge": False})
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=0.05)
+    monkeypatch.setitem(resilience._breakers, "test", breaker)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    return breaker
+
+def test_cancelled_trial_releases_the_half_open_circuit(breaker):
+    async def main():
+        started = asyncio.Event()
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+        trial = asyncio.create_task(acall("test", hang))
+        await started.wait()
+        # Only one trial at a time
+        with pytest.raises(CircuitOpenError):
+            await acall("test", hang)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        # The next call is the trial; its success closes the circuit
+        async def ok():
+            return "ok"
+        assert await acall("test", ok) == "ok"
+    asyncio.run(main())
+    assert breaker.state == "closed"
+
+def test_interrupted_sync_trial_releases_the_circuit(breaker):
+    def interrupted():
+        raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        call("test", interrupted)
+    assert call("test", lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+def test_non_retryable_error_leaves_the_circuit_as_it_is(breaker):
+    def bad_request():
+        raise ValueError("bad request")
+    with pytest.raises(ValueError):
+        call("test", bad_request)
+    # Still half-open, with the trial free again and the failures kept
+    assert breaker.state == "half_open"
+    assert breaker.failures == 1
+    with pytest.raises(TimeoutError):
+        call("test", lambda: (_ for _ in ()).throw(TimeoutError("slow")))
+    assert breaker.state == "open"
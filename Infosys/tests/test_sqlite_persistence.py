@@ -0,0 +1,66 @@
+"""SqliteCheckpointer and SqliteStore round-trips on a real SqliteDatabase."""
+import asyncio
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.store.base import InvalidNamespaceError
+
+from email_assistant.sqlite_persistence import SqliteCheckpointer, SqliteDatabase, SqliteStore
+
+@pytest.fixture
+def db(tmp_path):
+    db = SqliteDatabase(str(tmp_path / "assistant.sqlite"), pool_size=2)
+    yield db
+    db.close()
+
+def put_checkpoint(checkpointer, config, step, **values):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = values
+    return checkpointer.put(config, checkpoint, {"source": "loop", "step": step}, {})
+
+def test_checkpoints_round_trip_with_pending_writes(db):
+    checkpointer = SqliteCheckpointer(db)
+    thread = {"configurable": {"thread_id": "t1", "checkpoint_ns": "", "tenant_id": "alice"}}
+    first = put_checkpoint(checkpointer, thread, 0, email="short")
+    # Large values are stored compressed
+    second = put_checkpoint(checkpointer, {"configurable": {**thread["configurable"], **first["configurable"]}}, 1, email="x" * 5000)
+    checkpointer.put_writes(second, [("messages", "draft"), ("__interrupt__", "review")], task_id="task-1")
+
+    latest = checkpointer.get_tuple({"configurable": {"thread_id": "t1"}})
+    assert latest.config == second
+    assert latest.parent_config == first
+    assert latest.checkpoint["channel_values"] == {"email": "x" * 5000}
+    # The run's configurable values are kept in the metadata
+    assert (latest.metadata["step"], latest.metadata["tenant_id"]) == (1, "alice")
+    assert sorted(latest.pending_writes) == [("task-1", "__interrupt__", "review"), ("task-1", "messages", "draft")]
+
+    # Newest first; before and limit page through the history
+    assert [item.config for item in checkpointer.list({"configurable": {"thread_id": "t1"}})] == [second, first]
+    assert [item.config for item in checkpointer.list({"configurable": {"thread_id": "t1"}}, before=second)] == [first]
+    assert [item.config for item in checkpointer.list(None, filter={"step": 0})] == [first]
+    assert checkpointer.get_tuple(first).pending_writes == []
+
+    async def async_latest():
+        return await checkpointer.aget_tuple({"configurable": {"thread_id": "t1"}})
+    assert asyncio.run(async_latest()).config == second
+
+    assert checkpointer.prune(keep_last=1) == 1
+    assert [item.config for item in checkpointer.list({"configurable": {"thread_id": "t1"}})] == [second]
+
+def test_store_search_matches_whole_namespace_labels(db):
+    store = SqliteStore(db)
+    store.put(("alice", "triage_preferences"), "rules", {"kind": "triage"})
+    store.put(("alice", "triage_preferences", "archive"), "rules", {"kind": "archive"})
+    # Shares the text prefix "alice.triage_preferences" but not the namespace
+    store.put(("alice", "triage_preferences_old"), "rules", {"kind": "old"})
+    store.put(("bob", "triage_preferences"), "rules", {"kind": "bob"})
+
+    found = store.search(("alice", "triage_preferences"))
+    assert sorted(item.namespace for item in found) == [("alice", "triage_preferences"), ("alice", "triage_preferences", "archive")]
+    assert [item.value["kind"] for item in store.search(("alice",), filter={"kind": "old"})] == ["old"]
+    assert len(store.search(())) == 4
+
+    store.delete(("alice", "triage_preferences"), "rules")
+    assert store.get(("alice", "triage_preferences"), "rules") is None
+    with pytest.raises(InvalidNamespaceError):
+        store.put(("alice.smith", "triage_preferences"), "rules", {})
@@ -0,0 +1,47 @@
+"""run_tool_calls timeouts: measured from when a call starts, and hung calls never starve the pool."""
+import threading
+import time
+
+import pytest
+from langchain_core.tools import tool
+
+from email_assistant import tool_executor
+from email_assistant.tool_executor import DEFAULT_MAX_WORKERS, run_tool_calls
+
+release = threading.Event()
+
+@tool
+def hang(seconds: float) -> str:
+    """Block until released (or for at most seconds)."""
+    release.wait(seconds)
+    return "released"
+
+@tool
+def work(seconds: float) -> str:
+    """Take seconds to finish."""
+    time.sleep(seconds)
+    return "done"
+
+TOOLS = {"hang": hang, "work": work}
+
+def calls(name, count, seconds):
+    return [{"name": name, "args": {"seconds": seconds}, "id": f"{name}-{index}"} for index in range(count)]
+
+@pytest.fixture(autouse=True)
+def fresh_pool(monkeypatch):
+    monkeypatch.setattr(tool_executor, "_pool", None)
+    release.clear()
+    yield
+    release.set()
+
+def test_time_waiting_for_a_thread_does_not_count():
+    # One call more than there are threads: the last one waits for a thread, then runs within its timeout
+    result = run_tool_calls(calls("work", DEFAULT_MAX_WORKERS + 1, 0.2), TOOLS, timeout=0.3)
+    assert [message["content"] for message in result] == ["done"] * (DEFAULT_MAX_WORKERS + 1)
+
+def test_hung_calls_do_not_starve_later_calls():
+    for _ in range(DEFAULT_MAX_WORKERS):
+        result = run_tool_calls(calls("hang", 1, 30), TOOLS, timeout=0.05)
+        assert result[0]["content"].startswith("Error: hang did not finish")
+    # Every thread of the first pool is held by a hung call; a new one takes the next calls
+    assert run_tool_calls(calls("work", 2, 0.0), TOOLS, timeout=1.0)[0]["content"] == "done"
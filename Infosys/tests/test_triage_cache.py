@@ -0,0 +1,31 @@
+"""TriageCache hits for near-duplicates, and invalidation by rules updates made in another process."""
+import time
+
+from langgraph.store.memory import InMemoryStore
+
+from email_assistant.preference_rules import RuleBook, RuleOperation, revision
+from email_assistant.triage_cache import TriageCache
+
+NAMESPACE = ("email_assistant", "triage_preferences")
+
+def test_near_duplicate_hits_until_another_process_updates_the_rules():
+    store = InMemoryStore()
+    # One RuleBook per process, sharing the store
+    here, there = RuleBook(cache_seconds=0.05), RuleBook(cache_seconds=0.05)
+    cache = TriageCache()
+
+    decided_under = revision(here.load(store, NAMESPACE, "Ignore build reports"))
+    cache.put("ci@example.com", "Build #4512 passed", "Build 4512 passed on main in 312 seconds.", "ignore", decided_under)
+    assert cache.get("CI <ci@example.com>", "Re: Build #4513 passed", "Build 4513 passed on main in 298 seconds.", decided_under) == "ignore"
+
+    # The other process changes the rules...
+    document, applied = there.apply(there.load(store, NAMESPACE), [RuleOperation(op="add", text="Notify me about failed builds")])
+    assert applied == 1
+    store.put(NAMESPACE, "preference_rules", document)
+
+    # ...which this process reads within its cache window, dropping the decision
+    time.sleep(0.06)
+    current = revision(here.load(store, NAMESPACE))
+    assert current == decided_under + 1
+    assert cache.get("ci@example.com", "Build #4514 passed", "Build 4514 passed on main in 305 seconds.", current) is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,62 @@
+"""JobQueue leases: attempt numbers guard ack / nack / extend, so a worker that lost its lease cannot finish the job."""
+import time
+
+import pytest
+
+from email_assistant.worker_fleet import JobQueue
+
+def email(email_id):
+    return {"id": email_id, "thread_id": email_id, "from": "alice@example.com", "subject": f"Email {email_id}", "body": ""}
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"), visibility_timeout=0.1, max_attempts=2)
+    yield queue
+    queue.close()
+
+def test_enqueue_is_idempotent_per_thread(queue):
+    assert queue.enqueue(email("m1")) is True
+    assert queue.enqueue(email("m1")) is False
+    assert queue.stats()["queued"] == 1
+
+def test_ack_by_a_worker_that_lost_its_lease_is_rejected(queue):
+    queue.enqueue(email("m1"))
+    [first] = queue.lease("worker-a")
+    assert first["attempt"] == 1
+    assert queue.lease("worker-b") == []
+
+    # worker-a hangs past its lease; worker-b gets the job as attempt 2
+    time.sleep(0.15)
+    [second] = queue.lease("worker-b")
+    assert (second["id"], second["attempt"]) == (first["id"], 2)
+    assert queue.extend(first, "worker-a") is False
+    assert queue.ack(first, "worker-a") is False
+    assert queue.nack(first, "worker-a", "late") is False
+    # A worker cannot finish an attempt it does not own either
+    assert queue.ack(second, "worker-a") is False
+
+    assert queue.ack(second, "worker-b") is True
+    assert queue.ack(second, "worker-b") is False
+    assert queue.stats() == {"queued": 0, "leased": 0, "done": 1, "dead": 0}
+
+def test_nack_requeues_until_max_attempts(queue):
+    queue.enqueue(email("m1"))
+    [job] = queue.lease("worker-a")
+    assert queue.nack(job, "worker-a", "model down") is True
+    assert queue.stats()["queued"] == 1
+
+    [job] = queue.lease("worker-a")
+    assert job["attempt"] == 2
+    assert queue.nack(job, "worker-a", "model down") is True
+    assert queue.stats()["dead"] == 1
+    assert queue.lease("worker-a") == []
+
+def test_expired_lease_on_the_last_attempt_is_marked_dead(queue):
+    queue.enqueue(email("m1"))
+    queue.lease("worker-a")
+    time.sleep(0.15)
+    queue.lease("worker-b")
+    time.sleep(0.15)
+    # Both attempts were used up by workers that never came back
+    assert queue.lease("worker-c") == []
+    assert queue.stats()["dead"] == 1
@@ -0,0 +1,178 @@
+import asyncio
+
+from email_assistant.telemetry import get_logger, record_coalesced
+from email_assistant.tenants import current_tenant
+
+logger = get_logger(__name__)
+
+# Seconds an email is held for newer messages of its thread before its run starts
+DEFAULT_COALESCE_WINDOW = 2.0
+
+# Key added to the email_input of a coalesced run: ids of the older messages it covers
+SUPERSEDED_KEY = "superseded_ids"
+
+def _order(email_input: dict, arrival: int) -> tuple:
+    """Sort key of a message within its thread: Gmail history id, then arrival order.
+
+    A full sync lists the newest messages first, so arrival order alone is not enough.
+    """
+    history_id = str(email_input.get("history_id") or "")
+    return (int(history_id) if history_id.isdigit() else -1, arrival)
+
+class _Thread:
+    """Coalescing state of one conversation: its newest message and the run on it."""
+
+    def __init__(self):
+        self.latest = None
+        self.latest_order = None
+        self.superseded = []
+        self.generation = 0
+        self.task = None
+
+class ThreadCoalescer:
+    """Folds quick replies in one Gmail thread into a single run on the newest message.
+
+    Each email is held for window_seconds. An email of the same thread arriving meanwhile
+    replaces it, and the held email's run is skipped. A run already in flight for an older
+    message of the thread is cancelled (cancel_in_flight), so the thread is not triaged and
+    drafted twice and no conflicting drafts are produced. The run on the newest message gets
+    the ids of the messages it covers in email_input["superseded_ids"]. Emails without a
+    thread_id are run right away. An older message delivered after the newer message's run
+    started gets a run of its own, since that run no longer covers it.
+
+    submit holds and runs an email; hold only waits out the window and returns the email to
+    run, for callers whose runs take a slot of a worker pool (see gmail_ingest.feed_graph),
+    so held emails never occupy a slot.
+
+    Threads are keyed per tenant, so two mailboxes never share a conversation.
+    """
+
+    def __init__(self, window_seconds: float = DEFAULT_COALESCE_WINDOW, cancel_in_flight: bool = True):
+        self.window_seconds = window_seconds
+        self.cancel_in_flight = cancel_in_flight
+        self.held = 0
+        self.cancelled = 0
+        self._arrivals = 0
+        self._threads = {}
+
+    async def submit(self, email_input: dict, run, config: dict | None = None):
+        """Run an email through run(email_input) unless a newer message of its thread takes over.
+
+        Args:
+            email_input: Email in the parse_gmail shape, with thread_id and history_id when known
+            run: Async function running one email_input, e.g. through the graph
+            config: Run config, used to find the email's tenant
+
+        Returns:
+            The result of run, or None when the email was folded into a newer message's run
+        """
+        thread_id = email_input.get("thread_id")
+        if not thread_id:
+            return await run(email_input)
+
+        key = current_tenant(config).thread_id(thread_id)
+        thread = self._threads.setdefault(key, _Thread())
+        order = self._next_order(email_input)
+
+        if thread.latest is not None and order < thread.latest_order:
+            if thread.task is not None:
+                # The newer message's run started without this one, so it needs a run of its own
+                return await run(email_input)
+            # An older message delivered late is covered by the run on the newer one
+            thread.superseded.append(email_input["id"])
+            self._record("held", email_input, thread_id)
+            return None
+
+        if thread.latest is not None:
+            thread.superseded.append(thread.latest["id"])
+            if self.cancel_in_flight and thread.task is not None and not thread.task.done():
+                # The run on the older message is stale now; the newer one replaces it
+                thread.task.cancel()
+        generation = self._take_over(thread, email_input, order)
+
+        try:
+            await asyncio.sleep(self.window_seconds)
+            if thread.generation != generation:
+                self._record("held", email_input, thread_id)
+                return None
+
+            task = asyncio.create_task(run({**email_input, SUPERSEDED_KEY: list(thread.superseded)}))
+            thread.task = task
+            try:
+                return await task
+            except asyncio.CancelledError:
+                # Cancelled for a newer message rather than by our caller
+                if thread.generation != generation and not asyncio.current_task().cancelling():
+                    self._record("cancelled", email_input, thread_id)
+                    return None
+                raise
+        finally:
+            if thread.generation == generation:
+                del self._threads[key]
+
+    async def hold(self, email_input: dict, config: dict | None = None):
+        """Hold an email for window_seconds without running it.
+
+        Args:
+            email_input: Email in the parse_gmail shape, with thread_id and history_id when known
+            config: Run config, used to find the email's tenant
+
+        Returns:
+            The email to run (with the ids of the older messages it covers), or None when it
+            was folded into a newer message of its thread
+        """
+        thread_id = email_input.get("thread_id")
+        if not thread_id:
+            return email_input
+
+        key = current_tenant(config).thread_id(thread_id)
+        thread = self._threads.setdefault(key, _Thread())
+        order = self._next_order(email_input)
+
+        if thread.latest is not None and order < thread.latest_order:
+            # An older message delivered late is covered by the newer one still being held
+            thread.superseded.append(email_input["id"])
+            self._record("held", email_input, thread_id)
+            return None
+
+        if thread.latest is not None:
+            thread.superseded.append(thread.latest["id"])
+        generation = self._take_over(thread, email_input, order)
+
+        try:
+            await asyncio.sleep(self.window_seconds)
+            if thread.generation != generation:
+                self._record("held", email_input, thread_id)
+                return None
+            return {**email_input, SUPERSEDED_KEY: list(thread.superseded)}
+        finally:
+            # Released (or cancelled): messages arriving from now on start a new hold,
+            # since the caller may already be running this one
+            if thread.generation == generation:
+                del self._threads[key]
+
+    def _next_order(self, email_input):
+        self._arrivals += 1
+        return _order(email_input, self._arrivals)
+
+    def _take_over(self, thread, email_input, order) -> int:
+        """Make email_input the newest message of its thread; returns its generation."""
+        thread.latest, thread.latest_order = email_input, order
+        thread.generation += 1
+        return thread.generation
+
+    def _record(self, outcome, email_input, thread_id):
+        if outcome == "held":
+            self.held += 1
+        else:
+            self.cancelled += 1
+        record_coalesced(outcome)
+        logger.info(f"🧵 Folded email {email_input['id']} into a newer message of thread {thread_id} ({outcome})",
+                    email_id=email_input["id"], thread_id=thread_id, outcome=outcome)
+
+    def stats(self) -> dict:
+        """Emails folded before their run started (held), runs cancelled, and threads being held."""
+        return {"held": self.held, "cancelled": self.cancelled, "threads": len(self._threads)}
+
+# Shared by the Gmail ingest loop
+thread_coalescer = ThreadCoalescer()
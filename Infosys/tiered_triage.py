@@ -0,0 +1,154 @@
+import threading
+import time
+
+from pydantic import Field
+
+from email_assistant.model_registry import MODEL_SPECS, get_structured_model
+from email_assistant.schemas import RouterSchema
+from email_assistant.telemetry import MODEL_PRICES, get_logger
+
+logger = get_logger(__name__)
+
+# Fast-tier decisions below this confidence are escalated to the large router model
+DEFAULT_ESCALATION_THRESHOLD = 0.8
+
+# Per-namespace overrides of DEFAULT_ESCALATION_THRESHOLD, keyed by the triage_preferences
+# namespace, e.g. {("email_assistant", "alice", "triage_preferences"): 0.9}
+ESCALATION_THRESHOLDS = {}
+
+TIERS = {"fast": "router_fast", "large": "router"}
+
+class ConfidentRouterSchema(RouterSchema):
+    """Routing decision of the fast triage model, with how sure it is."""
+
+    confidence: float = Field(
+        ge=0.0, le=1.0,
+        description="How confident you are in the classification, from 0.0 (guessing) to 1.0 (certain). "
+        "Use a low value when the email is ambiguous or the triage rules do not clearly cover it.",
+    )
+
+def escalation_threshold(namespace=None) -> float:
+    """Confidence the fast tier needs for an email of this namespace not to be escalated."""
+    return ESCALATION_THRESHOLDS.get(tuple(namespace) if namespace else None, DEFAULT_ESCALATION_THRESHOLD)
+
+def set_escalation_threshold(namespace, threshold: float):
+    """Set the threshold for a namespace (0 never escalates, above 1 always does)."""
+    ESCALATION_THRESHOLDS[tuple(namespace)] = threshold
+
+def _estimated_cost(role, messages, result):
+    """Cost estimate from prompt and output length (about four characters per token)."""
+    input_price, output_price = MODEL_PRICES.get(MODEL_SPECS[role]["model"].split(":")[-1], (0.0, 0.0))
+    input_tokens = sum(len(message["content"]) for message in messages) // 4
+    output_tokens = len(result.model_dump_json()) // 4 if result is not None else 0
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+class TieredRouter:
+    """Two-tier triage: a small, fast model first, the large model only when it is unsure.
+
+    The fast tier answers with ConfidentRouterSchema. When its confidence is below the
+    namespace's escalation threshold, or the call fails, the email goes to the large router
+    model as before. Calls, latency, estimated cost and escalations are counted per tier.
+    Invoke it like the router model; pass namespace to use that namespace's threshold.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.escalations = 0
+        self.fast_failures = 0
+        self._tiers = {tier: {"calls": 0, "seconds": 0.0, "cost_usd": 0.0} for tier in TIERS}
+        self._lock = threading.Lock()
+
+    def _record(self, tier, seconds, messages, result):
+        cost = _estimated_cost(TIERS[tier], messages, result)
+        with self._lock:
+            entry = self._tiers[tier]
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+            entry["cost_usd"] += cost
+
+    def _escalate(self, result, namespace) -> bool:
+        if result is None:
+            return True
+        escalate = result.confidence < escalation_threshold(namespace)
+        if escalate:
+            with self._lock:
+                self.escalations += 1
+            logger.info(f"⬆️ Escalating triage (fast tier said {result.classification} at {result.confidence:.2f} confidence)",
+                        classification=result.classification, confidence=result.confidence)
+        return escalate
+
+    def warm_up(self):
+        """Build the structured-output models of both tiers now instead of on the first email."""
+        get_structured_model("router_fast", ConfidentRouterSchema)
+        get_structured_model("router", RouterSchema)
+
+    def invoke(self, messages, config=None, namespace=None):
+        """Classify one email (router messages: system prompt and user prompt).
+
+        Args:
+            messages: System and user messages, as sent to the router model
+            config: Optional run config passed to the model
+            namespace: triage_preferences namespace whose escalation threshold applies
+
+        Returns:
+            RouterSchema: The fast tier's decision, or the large model's after escalation
+        """
+        result = None
+        if self.enabled:
+            start = time.perf_counter()
+            try:
+                result = get_structured_model("router_fast", ConfidentRouterSchema).invoke(messages, config)
+            except Exception as error:
+                with self._lock:
+                    self.fast_failures += 1
+                logger.warning(f"⚠️ Fast triage failed, escalating: {error}")
+            self._record("fast", time.perf_counter() - start, messages, result)
+            if not self._escalate(result, namespace):
+                return result
+
+        start = time.perf_counter()
+        result = get_structured_model("router", RouterSchema).invoke(messages, config)
+        self._record("large", time.perf_counter() - start, messages, result)
+        return result
+
+    async def ainvoke(self, messages, config=None, namespace=None):
+        """Async variant of invoke."""
+        result = None
+        if self.enabled:
+            start = time.perf_counter()
+            try:
+                result = await get_structured_model("router_fast", ConfidentRouterSchema).ainvoke(messages, config)
+            except Exception as error:
+                with self._lock:
+                    self.fast_failures += 1
+                logger.warning(f"⚠️ Fast triage failed, escalating: {error}")
+            self._record("fast", time.perf_counter() - start, messages, result)
+            if not self._escalate(result, namespace):
+                return result
+
+        start = time.perf_counter()
+        result = await get_structured_model("router", RouterSchema).ainvoke(messages, config)
+        self._record("large", time.perf_counter() - start, messages, result)
+        return result
+
+    def stats(self) -> dict:
+        """Per tier: calls, mean latency and estimated cost; plus the escalation rate of the fast tier."""
+        with self._lock:
+            tiers = {
+                tier: {
+                    "calls": entry["calls"],
+                    "mean_seconds": entry["seconds"] / entry["calls"] if entry["calls"] else 0.0,
+                    "cost_usd": round(entry["cost_usd"], 6),
+                }
+                for tier, entry in self._tiers.items()
+            }
+            fast_calls = self._tiers["fast"]["calls"]
+            return {
+                "tiers": tiers,
+                "escalations": self.escalations,
+                "fast_failures": self.fast_failures,
+                "escalation_rate": (self.escalations + self.fast_failures) / fast_calls if fast_calls else 0.0,
+            }
+
+# Shared by every assistant's triage router
+tiered_router = TieredRouter()
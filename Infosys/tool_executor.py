@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from email_assistant.telemetry import get_logger, record_tool, span
+
+logger = get_logger(__name__)
+
+# Default limits for tools run without human review
+DEFAULT_TOOL_TIMEOUT = 30.0
+DEFAULT_MAX_WORKERS = 8
+
+# Per-tool overrides of DEFAULT_TOOL_TIMEOUT, in seconds, e.g. {"check_calendar_tool": 10.0}
+TOOL_TIMEOUTS = {}
+
+# A timed-out call keeps its thread (it cannot be killed); once this many of a pool's threads
+# are held by abandoned calls, new calls go to a fresh pool and the old one is left to them
+MAX_ABANDONED = DEFAULT_MAX_WORKERS // 2
+
+class _ToolPool:
+    """Thread pool for sync tool execution, with the number of its threads held by abandoned calls."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="tool")
+        self.abandoned = 0
+
+class _Call:
+    """A tool call on the pool: its future, and when a thread picked it up."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.future = None
+        self.started = threading.Event()
+        self.started_at = None
+
+# Shared pool, so independent calls of one turn overlap; created on first use
+_pool = None
+_lock = threading.Lock()
+
+def _submit(fn, *args) -> _Call:
+    """Run fn(*args) on the tool pool, in a copy of the current context so run config and callbacks follow it."""
+    global _pool
+    with _lock:
+        if _pool is None or _pool.abandoned >= MAX_ABANDONED:
+            if _pool is not None:
+                logger.warning(f"⚠️ {_pool.abandoned} hung tool call(s) hold the tool pool, starting a new one", abandoned=_pool.abandoned)
+                # Idle threads exit; hung calls keep theirs until they return
+                _pool.executor.shutdown(wait=False)
+            _pool = _ToolPool()
+        call = _Call(_pool)
+
+    def run():
+        call.started_at = time.monotonic()
+        call.started.set()
+        return fn(*args)
+    call.future = call.pool.executor.submit(contextvars.copy_context().run, run)
+    return call
+
+def _abandon(call: _Call):
+    """Count a timed-out call that is still running against its pool until it returns."""
+    with _lock:
+        call.pool.abandoned += 1
+
+    def returned(_):
+        with _lock:
+            call.pool.abandoned -= 1
+    call.future.add_done_callback(returned)
+
+def tool_timeout(name: str, timeout: float | None = None) -> float:
+    """Timeout for a tool: an explicit value wins over TOOL_TIMEOUTS, which wins over the default."""
+    if timeout is not None:
+        return timeout
+    return TOOL_TIMEOUTS.get(name, DEFAULT_TOOL_TIMEOUT)
+
+def timeout_message(tool_call: dict, timeout: float) -> dict:
+    """Tool message telling the agent a call took too long, so it can retry or move on."""
+    return {
+        "role": "tool",
+        "content": f"Error: {tool_call['name']} did not finish within {timeout:g} seconds. Try again or continue without it.",
+        "tool_call_id": tool_call["id"],
+    }
+
+def invoke_tool(tool, args):
+    """Invoke a tool, recording its latency in the tool metrics."""
+    start = time.perf_counter()
+    with span(f"tool {tool.name}", tool=tool.name):
+        try:
+            observation = tool.invoke(args)
+        except Exception:
+            record_tool(tool.name, time.perf_counter() - start, "error")
+            raise
+    record_tool(tool.name, time.perf_counter() - start)
+    return observation
+
+async def ainvoke_tool(tool, args):
+    """Async variant of invoke_tool."""
+    start = time.perf_counter()
+    with span(f"tool {tool.name}", tool=tool.name):
+        try:
+            observation = await tool.ainvoke(args)
+        except Exception:
+            record_tool(tool.name, time.perf_counter() - start, "error")
+            raise
+    record_tool(tool.name, time.perf_counter() - start)
+    return observation
+
+def run_tool_calls(tool_calls, tools_by_name, timeout: float | None = None) -> list[dict]:
+    """Execute independent tool calls concurrently on a thread pool.
+
+    Args:
+        tool_calls: Tool calls from the last AI message
+        tools_by_name: Mapping of tool name to tool
+        timeout: Per-call timeout in seconds; defaults to TOOL_TIMEOUTS / DEFAULT_TOOL_TIMEOUT
+
+    Returns:
+        list[dict]: One tool message per call, in the same order as tool_calls
+    """
+    tool_calls = list(tool_calls)
+
+    # Submit everything first
+    calls = [_submit(invoke_tool, tools_by_name[tool_call["name"]], tool_call["args"]) for tool_call in tool_calls]
+    submitted = time.monotonic()
+
+    # Collect in submission order so tool_call_id pairing stays stable
+    result = []
+    for tool_call, call in zip(tool_calls, calls):
+        limit = tool_timeout(tool_call["name"], timeout)
+        # A call waits for a thread at most its timeout too; one that never started can safely be retried
+        if not call.started.wait(max(0.0, submitted + limit - time.monotonic())) and call.future.cancel():
+            record_tool(tool_call["name"], limit, "timeout")
+            result.append(timeout_message(tool_call, limit))
+            continue
+        call.started.wait()
+        # The timeout starts when the call starts running, not while it waits behind other emails' calls
+        try:
+            observation = call.future.result(timeout=max(0.0, call.started_at + limit - time.monotonic()))
+        except FutureTimeoutError:
+            # The thread cannot be killed, but the agent no longer waits for it
+            _abandon(call)
+            record_tool(tool_call["name"], limit, "timeout")
+            result.append(timeout_message(tool_call, limit))
+            continue
+        result.append({"role": "tool", "content": observation, "tool_call_id": tool_call["id"]})
+    return result
+
+async def arun_tool_calls(tool_calls, tools_by_name, timeout: float | None = None) -> list[dict]:
+    """Async variant of run_tool_calls, using ainvoke and asyncio.gather."""
+    tool_calls = list(tool_calls)
+
+    async def run(tool_call):
+        limit = tool_timeout(tool_call["name"], timeout)
+        try:
+            observation = await asyncio.wait_for(ainvoke_tool(tools_by_name[tool_call["name"]], tool_call["args"]), limit)
+        except asyncio.TimeoutError:
+            record_tool(tool_call["name"], limit, "timeout")
+            return timeout_message(tool_call, limit)
+        return {"role": "tool", "content": observation, "tool_call_id": tool_call["id"]}
+
+    # gather keeps results in tool_calls order
+    return list(await asyncio.gather(*(run(tool_call) for tool_call in tool_calls)))
@@ -0,0 +1,155 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from email_assistant.pre_triage import sender_address
+
+# Cached decisions expire after a week, so a recurring email is re-checked at least that often
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAXSIZE = 5000
+# Bodies whose 64-bit SimHashes differ in at most this many bits count as the same email
+DEFAULT_MAX_DISTANCE = 3
+
+SIMHASH_BITS = 64
+# The SimHash is split into MAX_DISTANCE + 1 bands; two hashes within MAX_DISTANCE bits
+# of each other always agree on at least one band, so only same-band entries are compared
+BAND_BITS = 16
+
+# Parts of an email that change between otherwise identical recurring emails
+URL_PATTERN = re.compile(r"https?://\S+")
+ADDRESS_PATTERN = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")
+NUMBER_PATTERN = re.compile(r"\d+")
+REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd)\s*:\s*)+", re.I)
+
+def normalize_text(text: str) -> str:
+    """Lower-case text with URLs, addresses and numbers replaced by placeholders."""
+    text = URL_PATTERN.sub(" <url> ", text.lower())
+    text = ADDRESS_PATTERN.sub(" <email> ", text)
+    text = NUMBER_PATTERN.sub("#", text)
+    return " ".join(text.split())
+
+def subject_template(subject: str) -> str:
+    """Subject with reply / forward prefixes removed and numbers and dates masked.
+
+    "Re: Build #4512 passed on 2025-05-01" and "Build #4513 passed on 2025-05-02"
+    share the template "build ## passed on #-#-#".
+    """
+    return normalize_text(REPLY_PREFIX.sub("", subject))
+
+def simhash(text: str, bits: int = SIMHASH_BITS) -> int:
+    """SimHash of a text's word 3-shingles; near-duplicate texts get hashes a few bits apart."""
+    words = text.split()
+    shingles = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))]
+    weights = [0] * bits
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+class TriageCache:
+    """Near-duplicate cache of triage decisions for recurring emails.
+
+    An email is fingerprinted by its sender address, its subject template and a SimHash of
+    its normalized body. A later email from the same sender with the same subject template
+    and a body within max_distance bits reuses the stored RouterSchema without a model call.
+    Entries expire after ttl_seconds, the least recently used are evicted past maxsize, and
+    every entry remembers the revision of the stored triage rules it was decided under (see
+    preference_rules), so a rules update made by any process invalidates it as soon as the
+    caller reads the new revision.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_distance: int = DEFAULT_MAX_DISTANCE):
+        if max_distance >= SIMHASH_BITS // BAND_BITS:
+            raise ValueError(f"max_distance must be below {SIMHASH_BITS // BAND_BITS} with {BAND_BITS}-bit bands")
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.hits = 0
+        self.misses = 0
+        # (sender, subject template, simhash) -> (RouterSchema, expires_at, rules revision)
+        self._entries = OrderedDict()
+        # (sender, subject template, band number, band value) -> entry keys
+        self._bands = {}
+        self._lock = threading.Lock()
+
+    def _fingerprint(self, author, subject, body):
+        return sender_address(author), subject_template(subject), simhash(normalize_text(body))
+
+    def _band_keys(self, key):
+        sender, template, value = key
+        mask = (1 << BAND_BITS) - 1
+        return [(sender, template, band, value >> (band * BAND_BITS) & mask) for band in range(SIMHASH_BITS // BAND_BITS)]
+
+    def _drop(self, key):
+        del self._entries[key]
+        for band_key in self._band_keys(key):
+            keys = self._bands.get(band_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band_key]
+
+    def get(self, author: str, subject: str, body: str, revision=None):
+        """Return the cached decision for this email or a near-duplicate of it.
+
+        Args:
+            author: From header of the email
+            subject: Subject of the email
+            body: Email body (or thread) that was classified
+            revision: Revision of the triage preference rules the decision depends on, if any
+
+        Returns:
+            RouterSchema | None: The stored decision, or None on a miss
+        """
+        key = self._fingerprint(author, subject, body)
+        now = time.time()
+        with self._lock:
+            candidates = [key] if key in self._entries else {
+                candidate for band_key in self._band_keys(key) for candidate in self._bands.get(band_key, ())
+            }
+            for candidate in candidates:
+                result, expires_at, entry_revision = self._entries[candidate]
+                # Expired, or decided under triage preferences that have changed since
+                if expires_at <= now or entry_revision != revision:
+                    self._drop(candidate)
+                    continue
+                if bin(candidate[2] ^ key[2]).count("1") <= self.max_distance:
+                    self._entries.move_to_end(candidate)
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, author: str, subject: str, body: str, result, revision=None):
+        """Store the router's decision for an email (same arguments as get)."""
+        key = self._fingerprint(author, subject, body)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (result, time.time() + self.ttl_seconds, revision)
+            for band_key in self._band_keys(key):
+                self._bands.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def clear(self):
+        """Drop every cached decision."""
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+# Process-wide cache shared by all assistant graphs
+triage_cache = TriageCache()
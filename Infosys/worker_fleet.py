@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+
+from email_assistant.async_runner import ainvoke_once, email_config
+from email_assistant.priority_scheduler import LANES, email_lane
+from email_assistant.resilience import get_breaker
+from email_assistant.sqlite_persistence import DEFAULT_DB_PATH
+from email_assistant.telemetry import configure_logging, get_logger
+from email_assistant.tenants import current_tenant, tenant_registry
+
+logger = get_logger(__name__)
+
+# Jobs live here, next to (not inside) the checkpoint database
+DEFAULT_QUEUE_PATH = "email_jobs.sqlite"
+# A leased job not acknowledged or extended within this many seconds is delivered again
+DEFAULT_VISIBILITY_TIMEOUT = 120.0
+# Deliveries before a job is given up on (kept as "dead" for inspection)
+DEFAULT_MAX_ATTEMPTS = 5
+# Worker processes, and emails in flight in each of them
+DEFAULT_PROCESSES = os.cpu_count() or 1
+DEFAULT_WORKER_CONCURRENCY = 8
+# Seconds an idle worker waits before asking the queue again
+DEFAULT_POLL_SECONDS = 0.5
+# Builds the graph in each worker process: "module:function", called with db_path (and factory kwargs)
+DEFAULT_GRAPH_FACTORY = "email_assistant.worker_fleet:durable_async_email_assistant"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    thread_id TEXT NOT NULL UNIQUE,
+    email_input TEXT NOT NULL,
+    configurable TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires, id);
+"""
+# Added to queues created before jobs had a priority lane (see priority_scheduler.LANES):
+# the lane's position (0 = most urgent) and when the job is past the lane's SLA
+PRIORITY_COLUMNS = {"priority": "INTEGER NOT NULL DEFAULT 0", "due_at": "REAL NOT NULL DEFAULT 0"}
+
+class JobQueue:
+    """Durable email job queue in SQLite, shared by every worker process on the machine.
+
+    A job is one email, keyed by its checkpoint thread id, so ingesting an email twice queues
+    it once. Workers lease jobs for visibility_timeout seconds, extend the lease while the
+    graph runs and acknowledge the job when done. A job whose lease expires (its worker
+    crashed or hung) is leased again; after max_attempts deliveries it is marked dead.
+    Every lease gets a new attempt number, and acknowledgements and extensions only apply
+    to the current one, so a worker that lost its lease cannot finish someone else's job.
+
+    Jobs are leased in priority order: a job past its lane's SLA first (oldest deadline
+    first), then by lane (see priority_scheduler.email_lane, decided when the email is
+    queued), then oldest first. Unlike PriorityScheduler there is no fair queuing across
+    tenants within a lane; tenant limits are applied by run_job in each worker process.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_PATH, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        # Autocommit; transactions are opened explicitly with BEGIN IMMEDIATE
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, definition in PRIORITY_COLUMNS.items():
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        self._lock = threading.Lock()
+
+    def enqueue(self, email_input: dict, config: dict | None = None) -> bool:
+        """Queue an email; config's "configurable" values (tenant_id, ...) must be JSON-serializable.
+
+        Returns:
+            bool: False if a job for the email's thread already exists
+        """
+        configurable = email_config(email_input, config)["configurable"]
+        lane = email_lane(email_input, config)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (thread_id, email_input, configurable, priority, due_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (configurable["thread_id"], json.dumps(email_input), json.dumps(configurable), list(LANES).index(lane),
+                 now + LANES[lane]["sla_seconds"], now, now),
+            )
+        return cursor.rowcount == 1
+
+    def lease(self, owner: str, limit: int = 1) -> list[dict]:
+        """Lease up to limit jobs, queued ones or ones whose lease expired, in priority order.
+
+        Returns:
+            list[dict]: Jobs with id, attempt, email_input and config
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases that used up their attempts are not delivered again
+                self._db.execute(
+                    "UPDATE jobs SET status = 'dead', error = 'lease expired', updated_at = ? "
+                    "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, self.max_attempts),
+                )
+                rows = self._db.execute(
+                    "SELECT id, attempts, email_input, configurable FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY due_at > ?, CASE WHEN due_at <= ? THEN due_at ELSE priority END, id LIMIT ?",
+                    (now, now, now, limit),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?, updated_at = ? WHERE id = ?",
+                    [(owner, now + self.visibility_timeout, now, job_id) for job_id, *_ in rows],
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return [
+            {"id": job_id, "attempt": attempts + 1, "email_input": json.loads(email_input), "config": {"configurable": json.loads(configurable)}}
+            for job_id, attempts, email_input, configurable in rows
+        ]
+
+    def _update(self, sql, job, owner, *params) -> bool:
+        with self._lock:
+            cursor = self._db.execute(
+                f"{sql}, updated_at = ? WHERE id = ? AND lease_owner = ? AND attempts = ? AND status = 'leased'",
+                (*params, time.time(), job["id"], owner, job["attempt"]),
+            )
+        return cursor.rowcount == 1
+
+    def extend(self, job: dict, owner: str) -> bool:
+        """Push the lease of a running job out by another visibility_timeout; False if it was lost."""
+        return self._update("UPDATE jobs SET lease_expires = ?", job, owner, time.time() + self.visibility_timeout)
+
+    def ack(self, job: dict, owner: str) -> bool:
+        """Mark a job done; False if the lease was lost (the job was delivered again)."""
+        return self._update("UPDATE jobs SET status = 'done', lease_expires = NULL", job, owner)
+
+    def nack(self, job: dict, owner: str, error: str) -> bool:
+        """Give a failed job back for another attempt, or mark it dead after max_attempts."""
+        status = "dead" if job["attempt"] >= self.max_attempts else "queued"
+        return self._update("UPDATE jobs SET status = ?, lease_expires = NULL, error = ?", job, owner, status, error)
+
+    def purge(self, older_than_seconds: float = 7 * 24 * 3600) -> int:
+        """Delete finished jobs older than this; returns the number deleted."""
+        with self._lock:
+            cursor = self._db.execute("DELETE FROM jobs WHERE status = 'done' AND updated_at < ?", (time.time() - older_than_seconds,))
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        """Number of jobs per status (queued, leased, done, dead)."""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"queued": 0, "leased": 0, "done": 0, "dead": 0, **dict(rows)}
+
+    def close(self):
+        self._db.close()
+
+def durable_async_email_assistant(db_path: str = DEFAULT_DB_PATH):
+    """Default graph factory: the Gmail assistant with the SQLite checkpointer and store."""
+    from email_assistant.email_assistant_hitl_memory_gmail import durable_email_assistants, warm_up
+
+    warm_up()
+    return durable_email_assistants(db_path)[1]
+
+def load_graph(factory: str, db_path: str, **kwargs):
+    """Build the graph named by a "module:function" factory."""
+    module_name, _, function_name = factory.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)(db_path, **kwargs)
+
+async def run_job(graph, job: dict):
+    """Run an email job to its checkpoint, within its tenant's limits (per worker process).
+
+    A job delivered again (its worker crashed) continues the thread from its last
+    checkpoint instead of starting over, and a thread that already finished or is waiting
+    for review is left alone, so each email reaches the graph's checkpoint once.
+    """
+    # While the model provider's circuit is open, jobs wait here (keeping their lease) instead of using up attempts
+    await get_breaker("llm").wait_until_available()
+    async with current_tenant(job["config"]).slot():
+        return await ainvoke_once(graph, job["email_input"], job["config"])
+
+async def worker_loop(graph, queue: JobQueue, concurrency: int, stop_event, poll_seconds: float = DEFAULT_POLL_SECONDS):
+    """Lease jobs and run them, concurrency at a time, until stop_event is set; then finish the running ones."""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    running = set()
+
+    async def process(job):
+        task = asyncio.create_task(run_job(graph, job))
+        try:
+            # Keep the lease while the graph runs; stop if another worker was given the job
+            while not task.done():
+                await asyncio.wait([task], timeout=queue.visibility_timeout / 3)
+                if not task.done() and not await asyncio.to_thread(queue.extend, job, owner):
+                    logger.warning(f"⚠️ Lost the lease of email job {job['id']}, abandoning it", job_id=job["id"])
+                    task.cancel()
+                    return
+            task.result()
+            await asyncio.to_thread(queue.ack, job, owner)
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception as error:
+            logger.warning(f"⚠️ Email job {job['id']} failed (attempt {job['attempt']}): {error}", job_id=job["id"], attempt=job["attempt"])
+            await asyncio.to_thread(queue.nack, job, owner, repr(error))
+
+    while not stop_event.is_set():
+        jobs = []
+        if len(running) < concurrency:
+            jobs = await asyncio.to_thread(queue.lease, owner, concurrency - len(running))
+        for job in jobs:
+            task = asyncio.create_task(process(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        if not jobs:
+            # Idle or full: wake up when a job finishes or after poll_seconds
+            if running:
+                await asyncio.wait(running, timeout=poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                await asyncio.sleep(poll_seconds)
+    if running:
+        await asyncio.wait(running)
+
+def worker_main(factory: str, factory_kwargs: dict, queue_path: str, db_path: str, concurrency: int, visibility_timeout: float,
+                max_attempts: int, tenants_path: str | None, stop_event):
+    """Entry point of one worker process."""
+    # Ctrl-C reaches every process of the group; the parent stops the workers through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging()
+    if tenants_path:
+        tenant_registry.load(tenants_path)
+    graph = load_graph(factory, db_path, **factory_kwargs)
+    queue = JobQueue(queue_path, visibility_timeout, max_attempts)
+    try:
+        asyncio.run(worker_loop(graph, queue, concurrency, stop_event))
+    finally:
+        queue.close()
+
+class WorkerFleet:
+    """Pool of worker processes running the compiled graph on jobs from a JobQueue.
+
+    Each process builds its own graph (from factory) and runs up to concurrency emails at
+    once, so the fleet uses processes x concurrency slots across the machine's cores. The
+    queue and the checkpoint database are SQLite files, which every process opens in WAL
+    mode. Stopping lets every process finish the emails it is running.
+
+    Args:
+        processes: Number of worker processes
+        concurrency: Emails in flight in each process
+        factory: "module:function" building the async graph, called with db_path and factory_kwargs
+        factory_kwargs: Extra keyword arguments of the factory (must be picklable)
+        queue_path: SQLite file of the JobQueue
+        db_path: SQLite file of the checkpointer and store
+        visibility_timeout: Seconds before a job whose worker stopped responding is delivered again
+        max_attempts: Deliveries before a job is marked dead
+        tenants_path: Tenants JSON file loaded in every process (see TenantRegistry.load)
+    """
+
+    def __init__(self, processes: int = DEFAULT_PROCESSES, concurrency: int = DEFAULT_WORKER_CONCURRENCY, factory: str = DEFAULT_GRAPH_FACTORY,
+                 factory_kwargs: dict | None = None, queue_path: str = DEFAULT_QUEUE_PATH, db_path: str = DEFAULT_DB_PATH,
+                 visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT, max_attempts: int = DEFAULT_MAX_ATTEMPTS, tenants_path: str | None = None):
+        if processes < 1 or concurrency < 1:
+            raise ValueError(f"processes and concurrency must be at least 1, got {processes} and {concurrency}")
+        # Fresh interpreters: forking would copy the parent's event loops and database threads
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        self._args = (factory, factory_kwargs or {}, queue_path, db_path, concurrency, visibility_timeout, max_attempts, tenants_path, self._stop_event)
+        self.processes = processes
+        self._workers = []
+
+    def start(self):
+        """Start the worker processes."""
+        for n in range(self.processes):
+            worker = self._context.Process(target=worker_main, args=self._args, name=f"email-worker-{n}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(f"🏭 Started {self.processes} email worker process(es)", processes=self.processes)
+
+    def stop(self, timeout: float | None = None):
+        """Ask every worker to finish its running emails and exit, then wait for them."""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def join(self, timeout: float | None = None):
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+
+    def alive(self) -> int:
+        """Number of worker processes still running."""
+        return sum(worker.is_alive() for worker in self._workers)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run email jobs from the SQLite job queue on a pool of worker processes")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_WORKER_CONCURRENCY, help="Emails in flight per process")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH)
+    parser.add_argument("--db", default=DEFAULT_DB_PATH)
+    parser.add_argument("--factory", default=DEFAULT_GRAPH_FACTORY)
+    parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT)
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument("--tenants", help="Tenants JSON file to load in every worker")
+    args = parser.parse_args()
+
+    configure_logging()
+    fleet = WorkerFleet(args.processes, args.concurrency, args.factory, queue_path=args.queue, db_path=args.db,
+                        visibility_timeout=args.visibility_timeout, max_attempts=args.max_attempts, tenants_path=args.tenants)
+    fleet.start()
+    try:
+        fleet.join()
+    except KeyboardInterrupt:
+        fleet.stop()
+
+if __name__ == "__main__":
+    main()